@@ -0,0 +1,124 @@
+"""
+Cache of final answers to questions that don't depend on the user's transactions, such as "what is the saving period of an ASP loan?".
+
+Such an answer only depends on the indexed documents and the customer information in the system prompt, so it can be
+served without running the agent. Whether an answer is cached is decided from the turn that produced it:
+  - a turn that called a transaction tool (spending analytics or SQL) is never cached: its answer is about the
+    account's transactions, and questions like "last month" change their answer over time;
+  - a question that refers to earlier turns ("it", "that", "what about", "entä", ...) is not cached either, its
+    answer depends on the history. These are recognized with keyword rules before the agent runs.
+
+Entries are keyed by (normalized question, language, account, index version) in a SQLite file, so they survive restarts,
+are only served to users of the same account, and any re-index of the vector store (see index_version.py) makes the old
+entries unreachable.
+"""
+
+import json
+import re
+import sqlite3
+import threading
+import time
+
+from query_cache import normalize_query
+
+# Tools that read the transactions of the user's account. Answers of turns that called them are not cached.
+TRANSACTION_TOOLS = {"spending_summary", "top_merchants", "monthly_spending", "balance_over_time"}
+TRANSACTION_TOOL_PREFIX = "sql_db_"
+# Words that refer to earlier turns, so the question can't be answered on its own.
+FOLLOW_UP_WORDS = re.compile(
+    r"\b(it|its|that|this|these|those|they|them|he|she|what about|how about|again|same"
+    r"|se|sen|sitä|siitä|tuo|tämä|tästä|ne|niitä|entä|myös|lisää|vielä|sama)\b"
+)
+MIN_WORDS = 3  # Shorter messages ("yes", "thanks", "tell me more") depend on the conversation
+
+
+def classify_question(question: str) -> str:
+    """Returns "follow_up" or "generic"."""
+    normalized = normalize_query(question)
+    if len(normalized.split()) < MIN_WORDS or FOLLOW_UP_WORDS.search(normalized):
+        return "follow_up"
+    return "generic"
+
+
+def uses_transactions(tool_names) -> bool:
+    return any(name in TRANSACTION_TOOLS or name.startswith(TRANSACTION_TOOL_PREFIX) for name in tool_names)
+
+
+class AnswerCache:
+    def __init__(self, path: str, version_fn, ttl: float = 24 * 3600, max_entries: int = 2000):
+        self.version_fn = version_fn  # Returns the current index version
+        self.ttl = ttl  # Seconds, answers can also change because of date-dependent content
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.not_cacheable = 0
+        self.saved_seconds = 0.0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(answers)")]
+        if columns and "account" not in columns:
+            self._conn.execute("DROP TABLE answers")  # Entries of the earlier format were not scoped to an account
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " question TEXT NOT NULL, lang TEXT NOT NULL, account TEXT NOT NULL, index_version TEXT NOT NULL, response TEXT NOT NULL,"
+            " cost REAL NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL,"
+            " PRIMARY KEY (question, lang, account, index_version))"
+        )
+        self._conn.commit()
+
+    def is_cacheable(self, question: str) -> bool:
+        cacheable = classify_question(question) == "generic"
+        if not cacheable:
+            with self._lock:
+                self.not_cacheable += 1
+        return cacheable
+
+    def get(self, question: str, lang: str, account: str) -> dict | None:
+        """The cached response of a generic question for users of the account, or None. Call is_cacheable() first."""
+        now = time.time()
+        key = (normalize_query(question), lang, account, self.version_fn())
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, cost FROM answers WHERE question = ? AND lang = ? AND account = ? AND index_version = ? AND created > ?",
+                (*key, now - self.ttl),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE answers SET last_used = ? WHERE question = ? AND lang = ? AND account = ? AND index_version = ?", (now, *key))
+            self._conn.commit()
+            self.hits += 1
+            self.saved_seconds += row[1]
+        return json.loads(row[0])
+
+    def put(self, question: str, lang: str, account: str, response: dict, cost: float, tool_names=()):
+        """Store a response with the time it took the agent to produce it (reported as saved on later hits).
+
+        tool_names are the tools the turn called. Follow-up questions and turns that read transactions are not stored.
+        """
+        if classify_question(question) != "generic" or uses_transactions(tool_names):
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (question, lang, account, index_version, response, cost, created, last_used) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (normalize_query(question), lang, account, self.version_fn(), json.dumps(response, ensure_ascii=False), cost, now, now),
+            )
+            # Entries of old index versions are never read again, and the least recently used ones go over the limit.
+            self._conn.execute("DELETE FROM answers WHERE index_version != ? OR created <= ?", (self.version_fn(), now - self.ttl))
+            self._conn.execute(
+                "DELETE FROM answers WHERE rowid IN (SELECT rowid FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_entries,),
+            )
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_cacheable": self.not_cacheable,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "saved_seconds": round(self.saved_seconds, 3),
+        }
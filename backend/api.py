@@ -1,62 +1,79 @@
 # Dynamic prompt: https://langchain-ai.github.io/langgraph/agents/agents/#__tabbed_1_2
-# TODO: Handle PDFs and TXT files in the same way as Web pages, so that they can also be stored persistent vector store (No need to embed them on startup)
+# TODO: Handle TXT files in the same way as PDFs, so that they are only embedded when they change (see pdf_index.py).
 # TODO: Distinguish between user-specific RAG sources (invoices, data) and general documents (terms and conditions, service fees, etc.)
 # TODO: Add a tool to open links in a browser and read the content of the page.
-# In-memory database: https://python.langchain.com/docs/integrations/tools/sql_database/
+# SQL database tools: https://python.langchain.com/docs/integrations/tools/sql_database/
 
-from fastapi import FastAPI, Request
+import time
+_import_started = time.perf_counter()
+
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
 import os
 import json
+import sqlite3
+import threading
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
 
-from typing import Annotated
-from typing_extensions import TypedDict, List
-
-from langchain_community.document_loaders import PyPDFLoader, TextLoader
-from langchain.prompts import PromptTemplate
-from langchain_community.document_loaders import WebBaseLoader
-from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
-from langchain_community.utilities.sql_database import SQLDatabase
-from langchain_community.vectorstores import Chroma
-from langchain_core.documents import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_core.vectorstores import InMemoryVectorStore
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import tool
-from langchain_core.messages import SystemMessage
-from langchain.chains import LLMChain
-
-from langgraph.checkpoint.memory import MemorySaver
-from langgraph.prebuilt import ToolNode, tools_condition
-from langgraph.graph import MessagesState, StateGraph, START, END
-from langgraph.graph.message import add_messages
-from langgraph.prebuilt import ToolNode, tools_condition, create_react_agent
-from prompts import SYSTEM_PROMPT, FORMATTER_PROMPT
+from prompts import SYSTEM_PROMPT, FORMATTER_PROMPT, SUMMARY_PROMPT, SINGLE_PASS_FORMAT_PROMPT, SCHEMA_PROMPT
+from context_packing import estimate_tokens, pack_context
+from response_items import IncrementalItemParser, SinglePassFormatter, normalize_item
+from tts import AudioCache, AudioStreams, FakeSynthesizer, GoogleSynthesizer, SpeechService
 
 from pydantic import BaseModel, Field
-from typing import List, Literal, Union, Optional
-from PyPDF2 import PdfReader
-import bs4  # Filters HTML elements, https://www.crummy.com/software/BeautifulSoup/bs4/doc/ 
-from bs4 import SoupStrainer
+from typing import List, Literal, Optional
+from datetime import date
 
-from gtts import gTTS
 import base64
-from io import BytesIO
-from google.cloud import texttospeech
-import sqlite3
-import requests
-from sqlalchemy import create_engine
-from sqlalchemy.pool import StaticPool
-import re
+
+# Heavy dependencies (LangChain community/Gemini clients, Chroma, LangGraph, SQLAlchemy, Google Cloud TTS) are imported
+# lazily in initialize() and tts.py, so that the module imports quickly and the server can start
+# accepting connections right after a Cloud Run cold start. Check the import time with: python check_import_time.py
 
 # Settings that affect the behavior/performance of the RAG system retrieval tool (but not listing/reading documents).
 CHUNK_SIZE = 1000  # Maximum size of a chunk in characters
 CHUNK_OVERLAP = 200  # Overlap between chunks in characters
-RETRIEVED_DOCS_AMOUNT = 20 # Number of documents to retrieve for each query. The more documents, the more spent tokens, but also more accurate responses, and the more context for the LLM to use.
+RETRIEVED_DOCS_AMOUNT = 10 # Number of documents to retrieve for each query. The more documents, the more spent tokens, but also more accurate responses, and the more context for the LLM to use.
+RETRIEVAL_TOKEN_BUDGET = 2500 # Approximate maximum number of tokens the retrieve tool returns to the LLM
+QUERY_CACHE_SIZE = 256 # Retrieval results of this many recent queries are cached, see query_cache.py
+QUERY_CACHE_TTL = 3600 # Seconds a cached retrieval result stays valid (it is also dropped when the vector store is re-indexed)
+QUERY_SIMILARITY_THRESHOLD = 0.95 # Cosine similarity above which two queries are considered the same question
+HYBRID_CANDIDATES = 20 # Chunks taken from both the vector search and the BM25 keyword search before they are fused, see hybrid_retrieval.py. Fusion reaches the recall of a larger vector-only k with fewer documents.
 JSON_PATH = "docs_en.json"  # Path to the JSON file with documents
 CHROMA_DB_PATH = "./chroma_db_en"  # Path to the Chroma DB directory
+DOC_STORE_PATH = "./docs_en.sqlite"  # Path to the document store, built from JSON_PATH and the PDFs
+HISTORY_KEEP_TURNS = 4 # Latest conversation turns sent to the LLM verbatim, older ones are summarized, see conversation_history.py
+HISTORY_TOKEN_BUDGET = 6000 # Approximate maximum number of tokens of conversation history (summary and turns) sent to the LLM
+# "single_pass": the agent writes its final answer directly as ResponseFormatter JSON, which is parsed locally (one LLM call less per turn).
+# "two_pass": a second LLM call reshapes the final answer into a ResponseFormatter. Compare them with benchmarks/structured_output_benchmark.py.
+STRUCTURED_OUTPUT_MODE = os.getenv("STRUCTURED_OUTPUT_MODE", "single_pass")
+ANSWER_CACHE_PATH = "./answer_cache.sqlite"  # Cached answers to questions that don't need the transactions, see answer_cache.py
+ANSWER_CACHE_TTL = 24 * 3600  # Seconds a cached answer is served (it is also dropped when the vector store is re-indexed)
+CONVERSATIONS_DB_PATH = "./conversations.sqlite"  # Conversation history (LangGraph checkpoints) of all users, see checkpoint_store.py
+CONVERSATION_MAX_BYTES = 2 * 1024 * 1024  # Stored size of one conversation above which its oldest turns are dropped
+CONVERSATION_IDLE_TTL = 7 * 24 * 3600  # Seconds after the last message until a conversation is deleted
+CONVERSATION_COMPACT_INTERVAL = 600  # Seconds between compactions of the conversation store
+TTS_CACHE_DIR = "./tts_cache"  # Synthesized audio, keyed by the text, language, voice and encoding, see tts.py
+TTS_CACHE_MEMORY_BYTES = 32 * 1024 * 1024  # Most recently used audio kept in memory
+TTS_CACHE_DISK_BYTES = 512 * 1024 * 1024  # Audio kept on disk, the least recently used files are removed first
+TTS_CONCURRENCY = 4  # Sentences synthesized at the same time (over all requests)
+# "stream": the response has an audio item with the URL of binary MP3 that is synthesized sentence by sentence, see /audio.
+# "inline": the audio of the whole answer is synthesized in one call and included in the response as base64 (previous behavior).
+AUDIO_DELIVERY = os.getenv("AUDIO_DELIVERY", "stream")
+AUDIO_STREAM_TTL = 600  # Seconds the audio of an answer can be fetched
+AUDIO_IDLE_TIMEOUT = 120  # Seconds a reader of the audio waits for more of the answer before the audio ends
+SCHEMA_IN_PROMPT = os.getenv("SCHEMA_IN_PROMPT", "1") == "1"  # Database schema and sample rows in the system prompt, see schema_cache.py
+TRANSACTION_STORE_DIR = "./transactions"  # One SQLite database per account, see transaction_store.py
+TRANSACTION_POOL_SIZE = 4  # Read-only connections per account
+TRANSACTION_MAX_POOLS = 64  # Accounts whose connections (and analytics columns) are kept open
+TRANSACTION_ACCOUNT = "elina"  # Demo account, for users without an own account
+TRANSACTION_SOURCE = "data/transaction_history.sql"  # Transactions of the demo account (SQL script or JSON), compiled by the Dockerfile
 
 # Load env vars
 load_dotenv()
@@ -67,16 +84,51 @@ api_key = os.getenv("GEMINI_API_KEY")
 if not api_key:
     raise ValueError("Missing GEMINI_API_KEY in environment variables.")
 
-if not os.path.exists(JSON_PATH) or not os.path.exists(CHROMA_DB_PATH):
-    raise FileNotFoundError(f"{JSON_PATH} file or {CHROMA_DB_PATH} not found. Please run the 'backend/document_loader.py' script first!")
-
 # LangSmith tracing is a debugging and monitoring tool for LangChain applications. 
 # Not necessary to enable, but can help with understanding the flow application and diagnosing issues.
 #LANGSMITH_TRACING = os.getenv("LANGSMITH_TRACING") 
 #LANGSMITH_API_KEY = os.getenv("LANGSMITH_API_KEY")
 
+READY_TIMEOUT = 60  # Seconds a /chat request waits for the background initialization before answering 503
+IMPORT_TIME_BUDGET = float(os.getenv("IMPORT_TIME_BUDGET", "1.5"))  # Seconds, a warning is printed when importing this module takes longer
+
+# Heavy components, created by initialize() in a background thread after the server has started.
+vector_store = None
+embeddings = None
+retriever = None
+query_cache = None
+doc_store = None
+checkpointer = None
+history_trimmer = None
+response_formatter = None
+answer_cache = None
+transaction_store = None
+sql_database = None
+sql_validator = None
+schema_cache = None
+agent_executor = None
+ready = threading.Event()
+init_error = None
+
+# Text-to-speech with one long-lived client, created on the first synthesis. FAKE_TTS=1 replaces Google Cloud TTS
+# with generated bytes, to run the server and the benchmarks without credentials.
+speech = SpeechService(
+    FakeSynthesizer() if os.getenv("FAKE_TTS") else GoogleSynthesizer(),
+    AudioCache(TTS_CACHE_DIR, max_memory_bytes=TTS_CACHE_MEMORY_BYTES, max_disk_bytes=TTS_CACHE_DISK_BYTES),
+    max_concurrency=TTS_CONCURRENCY,
+)
+audio_streams = AudioStreams(speech, ttl=AUDIO_STREAM_TTL, idle_timeout=AUDIO_IDLE_TIMEOUT)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Don't block the startup: /healthz answers right away, and /ready once the components are initialized.
+    threading.Thread(target=initialize_in_background, name="initialize", daemon=True).start()
+    compaction = asyncio.create_task(compact_conversations_periodically())
+    yield
+    compaction.cancel()
+
 # FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -89,47 +141,42 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Function to create an in-memory transaction history SQLite database. It is intended to be read-only.
-def get_engine_for_transaction_db():
-  """Load local SQL file, populate in-memory database, and create engine."""
-  sql_file_path = "data/transaction_history.sql"
-  with open(sql_file_path, "r", encoding="utf-8") as f:
-    sql_script = f.read()
-
-  connection = sqlite3.connect(":memory:", check_same_thread=False)
-  connection.executescript(sql_script)
+# Transaction history: one prebuilt, read-only SQLite database (WAL mode) per account, see transaction_store.py.
+def get_transaction_store():
+  """Open the transaction store. The demo account database is prebuilt (see the Dockerfile), so opening it takes the same time
+  however many transactions it has. It is only built here if it is missing or older than its source."""
+  from transaction_store import TransactionStore, read_rows
+
+  store = TransactionStore(TRANSACTION_STORE_DIR, pool_size=TRANSACTION_POOL_SIZE, max_pools=TRANSACTION_MAX_POOLS)
+  account_path = store.path(TRANSACTION_ACCOUNT)
+  if not os.path.exists(account_path) or os.path.getmtime(account_path) < os.path.getmtime(TRANSACTION_SOURCE):
+    print(f"Building {account_path} from {TRANSACTION_SOURCE}. Build it in advance with: python transaction_store.py {TRANSACTION_STORE_DIR} {TRANSACTION_ACCOUNT} {TRANSACTION_SOURCE}")
+    store.build(TRANSACTION_ACCOUNT, read_rows(TRANSACTION_SOURCE))
+  return store
+
+def get_engine_for_transaction_db(store):
+  """Engine over read-only connections to the demo account, for reading the schema (SQLDatabase, schema_cache.py).
+  The tools query the accounts through the connection pools of the store."""
+  from sqlalchemy import create_engine
+  from sqlalchemy.pool import QueuePool
+
+  # A pool like the store's, so that concurrent schema reads don't share one connection.
   return create_engine(
-    "sqlite://",
-    creator=lambda: connection,
-    poolclass=StaticPool,
-    connect_args={"check_same_thread": False},
+    "sqlite://", creator=lambda: store.connect(TRANSACTION_ACCOUNT), poolclass=QueuePool, pool_size=TRANSACTION_POOL_SIZE, max_overflow=0,
   )
 
-engine = get_engine_for_transaction_db()
-db = SQLDatabase(engine)
+def account_for_user(user_id: str) -> str:
+  """The account of a user: the user's own if the store has one, otherwise the demo account."""
+  # LIMITATION: user_id is the userId of the request body, which is not authenticated, so any client can send the id of
+  # another user and read that account (and its conversation). This is fine while the store only has the demo account,
+  # which every user sees. Before real accounts are added, take the account from an authenticated identity instead.
+  return user_id if transaction_store is not None and transaction_store.has_account(user_id) else TRANSACTION_ACCOUNT
 
-class State(TypedDict):
-    # Messages have the type "list". The `add_messages` function
-    # in the annotation defines how this state key should be updated
-    # (in this case, it appends messages to the list, rather than overwriting them)
-    messages: Annotated[list, add_messages]
-
-memory = MemorySaver() # Notice we're using an in-memory checkpointer. This is convenient for our tutorial (it saves it all in-memory). In a production application, you would likely change this to use SqliteSaver or PostgresSaver and connect to your own DB.
-
-graph_builder = StateGraph(State)
-
-# Init LLM
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.0-flash",
-    temperature=1.2,
-    max_tokens=None,
-    timeout=None,
-    max_retries=2,
-    google_api_key=api_key,
-)
-
-embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-toolkit = SQLDatabaseToolkit(db=db, llm=llm)
+def transaction_account(config: RunnableConfig) -> str:
+  """The account whose transactions the tools of an agent run read.
+  It is taken from the run (the userId of the request, like the conversation), never from the LLM. The userId is not
+  authenticated, see account_for_user()."""
+  return account_for_user(config.get("configurable", {}).get("thread_id", ""))
 
 # Read example customer information for Elina Example
 with open("data/elina_example_persona.txt", "r") as f:
@@ -169,128 +216,358 @@ class ResponseFormatter(BaseModel):
       ]}
     ])
 
-# The loading/parsing of Web pages, PDFs and TXT files starts here.
-# TODO: Refactor the code to e.g. import links and use just one function that handles .html, .pdf and .txt file differences,
-# but has the overall same logic.
-
-document_catalog = [] # List to hold document names, descriptions and metadata
-loaded_docs_by_source = {} # Dict to hold loaded documents by their source (link or filepath)
-
-# Load previously parsed Web documents from local persistent storage.
-with open(JSON_PATH, "r", encoding="utf-8") as f:
-    docs = [Document(**doc) for doc in json.load(f)]
-
-print(f"Loaded {len(docs)} documents from '{JSON_PATH}'.\n\n")
-
-for doc in docs:
-    #print("\n\n",doc.metadata.get("title"))
-    document_catalog.append({
-        "title": doc.metadata.get("title"),
-        "description": doc.metadata.get("description", "No description available."),
-        "source": doc.metadata.get("source", "No source available."),
-    })
-    loaded_docs_by_source[doc.metadata["source"]] = doc
-
-vector_store = Chroma(
-    embedding_function=embeddings,
-    persist_directory=CHROMA_DB_PATH
-  )
-
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
-
-def addPdfToVectorStore(pdf_path: str, desc: str = ""):
-  """Load a PDF file and add its contents to the vector store, with an optional description."""
-  if not os.path.exists(pdf_path):
-    raise FileNotFoundError(f"The file {pdf_path} does not exist.")
-  
-  # Initialize the loader
-  loader = PyPDFLoader(file_path=pdf_path)
-
-  # Load the documents
-  doc = loader.load()
-  
-  # Split the documents
-  text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
-  all_splits = text_splitter.split_documents(doc)
-
-  document_catalog.append({
-        "title": doc[0].metadata.get("title"),
-        "description": desc,
-        "source": doc[0].metadata.get("source", "No source available."),
-    })
-  loaded_docs_by_source[doc[0].metadata["source"]] = doc
-
-  # Add split documents to the vector store
-  _ = vector_store.add_documents(all_splits)
-
-pdfs_with_desc = [
-  ("data/muutokset-palveluhinnastoon-6-2025.pdf", "Changes to the service price list effective June 2025."),
-  ("data/velan-yleiset-ehdotA.pdf", "General terms and conditions for loans. Includes defintions of related terms, such as 'loan', 'interest', 'collateral', etc."),
-  ("data/Invoice_ENG.pdf", "Unpaid invoice that was obtained throgh Gmail API."),
-]
-
-for pdf_path, desc in pdfs_with_desc:
-  addPdfToVectorStore(pdf_path, desc)
-
-# Customer information already in the context
-# loader = TextLoader("data/elina_example_persona.txt")
-#
-# doc = loader.load()
-#
-# all_splits = text_splitter.split_documents(doc)
-#
-# document_catalog.append({
-#       "title": "Elina Example - Customer Information",
-#       "description": "Compiled customer information for Elina Example, containing her personal details, habits and preferences, Nordea service usage, account information, monthly spending, investments and property.",
-#       "source": "data/elina_example_persona.txt",
-#   })
-# loaded_docs_by_source["data/elina_example_persona.txt"] = doc
-#
-# # Add split documents to the vector store
-# _ = vector_store.add_documents(all_splits)
-
-print("Finished loading and indexing documents into the vector store.")
-
 @tool(response_format="content_and_artifact")
-def retrieve(query: str):
+async def retrieve(query: str):
     """Retrieve information related to a query."""
-    retrieved_docs = vector_store.similarity_search(query, k=RETRIEVED_DOCS_AMOUNT)
-    
-    serialized = "\n\n".join(
-        (f"Source: {doc.metadata}\n" f"Content: {doc.page_content}")
-        for doc in retrieved_docs
-    )
+    # Repeated and near-duplicate queries are answered from the cache, see query_cache.py. The lookup reads the index version
+    # file, and rebuilds the BM25 index when the version has changed, so it runs on a worker thread too.
+    retrieved_docs = await asyncio.to_thread(query_cache.get, query)
+    if retrieved_docs is None:
+        query_embedding = await embeddings.aembed_query(query)
+        retrieved_docs = query_cache.get_similar(query_embedding)
+        if retrieved_docs is None:
+            started = time.perf_counter()
+            # Vector similarity search fused with BM25 keyword search, which catches exact terms like product names and fee codes.
+            # Chroma has no async API, so the search runs on a worker thread instead of blocking the event loop.
+            retrieved_docs = await asyncio.to_thread(retriever.search, query, RETRIEVED_DOCS_AMOUNT, query_embedding)
+            query_cache.put(query, query_embedding, retrieved_docs, cost=time.perf_counter() - started)
+    print(f"Retrieval cache: {query_cache.stats()}")
+
+    # Overlapping chunks of the same source are merged and referenced compactly, within a token budget. See context_packing.py.
+    serialized = pack_context(retrieved_docs, RETRIEVAL_TOKEN_BUDGET, max_overlap=2 * CHUNK_OVERLAP)
     return serialized, retrieved_docs
 
+# The document store tools are quick local SQLite reads. Like the SQL toolkit tools, they are sync,
+# and the agent runs them on a worker thread when it is invoked asynchronously.
 @tool
 def list_documents() -> str:
     """List all available documents with their metadata (title, description, and source)."""
     response = "\n\n".join(
         f"Title: {doc['title']}\nDescription: {doc['description']}\nSource: {doc['source']}"
-        for doc in document_catalog
+        for doc in doc_store.catalog()
     )
     return response
 
 @tool
 def read_document(doc_source: str) -> str:
     """Read the full content of a selected document by the source string."""
-    doc = loaded_docs_by_source.get(doc_source)
+    doc = doc_store.get(doc_source)
     if not doc:
         return f"Document with source '{doc_source}' not found."
     
     return doc
 
-# toolkit.get_tools() returns a list, so to flatten the tools list, use * unpacking:
-agent_executor = create_react_agent(
-    llm,
-    [list_documents, read_document, retrieve, *toolkit.get_tools()],
-    checkpointer=memory,
-    prompt=prompt,
-    response_format=ResponseFormatter,
-  )
+# Spending analytics: the common questions about the transaction history are answered in one tool call,
+# without listing tables, reading the schema and writing SQL. See transaction_analytics.py.
+# The transaction tools read the account of the user of the run (LangChain passes the run config to the config argument).
+def analytics_result(function, *args, **kwargs) -> str:
+    try:
+        return json.dumps(function(*args, **kwargs), ensure_ascii=False)
+    except ValueError as e:  # Unknown category or receiver, the message lists the known ones
+        return str(e)
 
-def stream_graph_updates(user_input: str, id: str):
-    for event in agent_executor.stream(
+@tool
+def spending_summary(start_date: Optional[date] = None, end_date: Optional[date] = None, group_by: Literal["category", "receiver"] = "category",
+                     category: Optional[str] = None, receiver: Optional[str] = None, config: RunnableConfig = None) -> str:
+    """Total spending and number of transactions from start_date to end_date (inclusive), grouped by category or receiver, largest first.
+    Optionally only for one category (e.g. 'Groceries') or receiver (e.g. 'Wolt'). Leave the dates out for the whole history."""
+    return analytics_result(transaction_store.columns(transaction_account(config)).spend, start_date, end_date, group_by, category, receiver)
+
+@tool
+def top_merchants(start_date: Optional[date] = None, end_date: Optional[date] = None, limit: int = 5, category: Optional[str] = None,
+                  config: RunnableConfig = None) -> str:
+    """The receivers with the largest total spending from start_date to end_date (inclusive), optionally within one category."""
+    return analytics_result(transaction_store.columns(transaction_account(config)).top_merchants, start_date, end_date, limit, category)
+
+@tool
+def monthly_spending(start_date: Optional[date] = None, end_date: Optional[date] = None, category: Optional[str] = None, receiver: Optional[str] = None,
+                     config: RunnableConfig = None) -> str:
+    """Spending per calendar month with the change from the previous month (in euros and percent), optionally for one category or receiver."""
+    return analytics_result(transaction_store.columns(transaction_account(config)).monthly, start_date, end_date, category, receiver)
+
+@tool
+def balance_over_time(current_balance: float, start_date: Optional[date] = None, end_date: Optional[date] = None, config: RunnableConfig = None) -> str:
+    """Month-end balances of the bank account, calculated back from its current balance (from the customer information) and the payments.
+    The transaction history has no income, so the balances show how the payments drew down the account."""
+    return analytics_result(transaction_store.columns(transaction_account(config)).balance_over_time, current_balance, start_date, end_date)
+
+# The SQL tools replace the ones of SQLDatabaseToolkit. The table list and table info are cached per database version
+# (see schema_cache.py), and queries are validated locally instead of by the toolkit's LLM query checker (see sql_validator.py).
+@tool
+def sql_db_list_tables(tool_input: str = "") -> str:
+    """Input is an empty string, output is a comma-separated list of tables in the database."""
+    return schema_cache.table_names()
+
+@tool
+def sql_db_schema(table_names: str) -> str:
+    """Get the schema and sample rows for the specified SQL tables.
+    Input is a comma-separated list of the table names for which to return the schema. Example input: 'table1, table2, table3'"""
+    return schema_cache.table_info(table_names)
+
+@tool
+def sql_db_query(query: str, config: RunnableConfig = None) -> str:
+    """Execute a SQLite SELECT query against the transaction database and get back the result.
+    The query is checked before it runs: only a single read-only SELECT is allowed, and a LIMIT is added if it has none.
+    If the query is not correct, an error message with the reason (and the known tables and columns) is returned. Rewrite the query and try again."""
+    try:
+        query = sql_validator.validate(query)
+    except ValueError as e:
+        return f"Error: {e}"
+    try:
+        rows = transaction_store.query(transaction_account(config), query)
+    except (sqlite3.Error, TimeoutError) as e:
+        return f"Error: {e}"
+    return str(rows) if rows else ""  # Formatted like SQLDatabase.run
+
+pdfs_with_desc = [
+  ("data/muutokset-palveluhinnastoon-6-2025.pdf", "Changes to the service price list effective June 2025."),
+  ("data/velan-yleiset-ehdotA.pdf", "General terms and conditions for loans. Includes defintions of related terms, such as 'loan', 'interest', 'collateral', etc."),
+  ("data/Invoice_ENG.pdf", "Unpaid invoice that was obtained throgh Gmail API."),
+]
+
+def create_agent(llm, tools, checkpointer, mode: str = STRUCTURED_OUTPUT_MODE, pre_model_hook=None, extra_prompt: str = ""):
+    """Create the ReAct agent in the given structured output mode. Returns (agent, SinglePassFormatter or None).
+    extra_prompt is added to the system prompt (e.g. the database schema)."""
+    from langgraph.prebuilt import create_react_agent
+    from conversation_history import SummarizedAgentState
+
+    if mode == "single_pass":
+        # The final answer is parsed into a ResponseFormatter by a post-model hook. The second LLM call
+        # (with the long FORMATTER_PROMPT and examples) is only made when the answer can't be parsed.
+        formatter = SinglePassFormatter(llm, ResponseFormatter)
+        agent = create_react_agent(
+            llm,
+            tools,
+            checkpointer=checkpointer,
+            prompt=prompt + extra_prompt + SINGLE_PASS_FORMAT_PROMPT,
+            pre_model_hook=pre_model_hook,
+            post_model_hook=formatter.as_hook(),
+            state_schema=SummarizedAgentState,
+          )
+        return agent, formatter
+
+    agent = create_react_agent(
+        llm,
+        tools,
+        checkpointer=checkpointer,
+        prompt=prompt + extra_prompt,
+        response_format=ResponseFormatter,
+        pre_model_hook=pre_model_hook,
+        state_schema=SummarizedAgentState,
+      )
+    return agent, None
+
+def initialize():
+    """Create the heavy components: transaction DB, LLM, document store, vector store and the agent."""
+    global vector_store, embeddings, retriever, query_cache, doc_store, checkpointer, history_trimmer, response_formatter, answer_cache, transaction_store, sql_database, sql_validator, schema_cache, agent_executor
+    started = time.perf_counter()
+
+    from langchain_community.utilities.sql_database import SQLDatabase
+    from langchain_community.vectorstores import Chroma
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    from embedding_cache import get_embeddings
+    from doc_store import DocumentStore
+    from pdf_index import sync_pdfs
+    from hybrid_retrieval import HybridRetriever
+    from query_cache import SemanticQueryCache
+    from index_version import read_index_version
+    from checkpoint_store import SqliteCheckpointSaver
+    from conversation_history import HistoryTrimmer
+    from answer_cache import AnswerCache
+    from sql_validator import SCHEMA_QUERY, SqlValidator
+    from schema_cache import SchemaCache
+
+    if not os.path.exists(JSON_PATH) or not os.path.exists(CHROMA_DB_PATH):
+        raise FileNotFoundError(f"{JSON_PATH} file or {CHROMA_DB_PATH} not found. Please run the 'backend/document_loader.py' script first!")
+
+    transaction_store = get_transaction_store()
+    engine = get_engine_for_transaction_db(transaction_store)
+    db = SQLDatabase(engine)  # Schema and sample rows of the demo account
+    with engine.connect() as connection:
+        sql_validator = SqlValidator([row[0] for row in connection.exec_driver_sql(SCHEMA_QUERY)])
+    sql_database = db
+    schema_cache = SchemaCache(db, version_fn=lambda: transaction_store.version(TRANSACTION_ACCOUNT))
+
+    # Conversations are stored on disk, survive restarts, and are bounded in size and age. See checkpoint_store.py.
+    memory = SqliteCheckpointSaver(
+        CONVERSATIONS_DB_PATH,
+        max_thread_bytes=CONVERSATION_MAX_BYTES,
+        idle_ttl=CONVERSATION_IDLE_TTL,
+      )
+
+    # Init LLM
+    llm = ChatGoogleGenerativeAI(
+        model="gemini-2.0-flash",
+        temperature=1.2,
+        max_tokens=None,
+        timeout=None,
+        max_retries=2,
+        google_api_key=api_key,
+    )
+
+    cached_embeddings = get_embeddings() # Gemini embeddings behind the shared local cache, see embedding_cache.py
+
+    # The loading/parsing of Web pages, PDFs and TXT files starts here.
+    # TODO: Refactor the code to e.g. import links and use just one function that handles .html, .pdf and .txt file differences,
+    # but has the overall same logic.
+
+    # Documents (Web pages and PDFs) are kept in an on-disk store and fetched lazily by source, see doc_store.py.
+    # docs_en.json is only imported again when it has changed since the last start.
+    store = DocumentStore(DOC_STORE_PATH)
+    if store.import_json(JSON_PATH):
+        print(f"Imported documents from '{JSON_PATH}' into '{DOC_STORE_PATH}'.")
+
+    print(f"Document store has {store.count()} documents.\n\n")
+
+    chroma = Chroma(
+        embedding_function=cached_embeddings,
+        persist_directory=CHROMA_DB_PATH
+      )
+
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+    # Only new or changed PDFs are embedded, unchanged ones are skipped and removed ones are deleted from the vector store.
+    # See pdf_index.py for the manifest of file hashes and stable chunk IDs.
+    pdf_paths = [pdf_path for pdf_path, _ in pdfs_with_desc]
+    pdf_pages_by_source = sync_pdfs(chroma, pdf_paths, text_splitter, CHROMA_DB_PATH, known_sources=store.sources("pdf"))
+
+    for pdf_path, desc in pdfs_with_desc:
+      if pdf_path in pdf_pages_by_source:
+        doc = pdf_pages_by_source[pdf_path]
+        store.put_document(pdf_path, doc[0].metadata.get("title") if doc else None, desc, "pdf", doc)
+      else:
+        store.set_description(pdf_path, desc)
+    store.delete_missing("pdf", pdf_paths)
+
+    # Customer information already in the context
+    # loader = TextLoader("data/elina_example_persona.txt")
+    #
+    # doc = loader.load()
+    #
+    # all_splits = text_splitter.split_documents(doc)
+    #
+    # store.put_document(
+    #       "data/elina_example_persona.txt",
+    #       "Elina Example - Customer Information",
+    #       "Compiled customer information for Elina Example, containing her personal details, habits and preferences, Nordea service usage, account information, monthly spending, investments and property.",
+    #       "txt",
+    #       doc,
+    #   )
+    #
+    # # Add split documents to the vector store
+    # _ = chroma.add_documents(all_splits)
+
+    print("Finished loading and indexing documents into the vector store.")
+    print(f"Embedding cache: {cached_embeddings.stats()}")
+
+    # The BM25 keyword index is built from the same chunks as the vector store, after the PDFs have been synced.
+    hybrid_retriever = HybridRetriever(chroma, candidates=HYBRID_CANDIDATES)
+    hybrid_retriever.refresh()
+
+    # Retrieval results are cached until the index version changes (see index_version.py), which also rebuilds the BM25 index.
+    cache = SemanticQueryCache(
+        max_entries=QUERY_CACHE_SIZE,
+        ttl=QUERY_CACHE_TTL,
+        similarity_threshold=QUERY_SIMILARITY_THRESHOLD,
+        version_fn=lambda: read_index_version(CHROMA_DB_PATH),
+        on_invalidate=hybrid_retriever.refresh,
+    )
+
+    vector_store, embeddings, retriever, query_cache, doc_store, checkpointer = chroma, cached_embeddings, hybrid_retriever, cache, store, memory
+
+    # The database schema in the system prompt saves the sql_db_list_tables and sql_db_schema calls of most database questions.
+    # The database is not changed while the server runs, so the schema in the prompt stays up to date.
+    schema_prompt = SCHEMA_PROMPT.format(schema=schema_cache.compact_schema()) if SCHEMA_IN_PROMPT else ""
+
+    # Earlier tool results are dropped from the LLM input and old turns are summarized, so the prompt
+    # doesn't grow with the length of the conversation. The full history stays in the checkpointer.
+    history_trimmer = HistoryTrimmer(
+        ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.2, max_retries=2, google_api_key=api_key),
+        SUMMARY_PROMPT,
+        keep_turns=HISTORY_KEEP_TURNS,
+        token_budget=HISTORY_TOKEN_BUDGET,
+        fixed_tokens=estimate_tokens(prompt + schema_prompt),
+      )
+
+    agent_executor, response_formatter = create_agent(
+        llm,
+        [list_documents, read_document, retrieve, spending_summary, top_merchants, monthly_spending, balance_over_time, sql_db_list_tables, sql_db_schema, sql_db_query],
+        memory,
+        pre_model_hook=history_trimmer.as_hook(),
+        extra_prompt=schema_prompt,
+      )
+    # Answers to generic questions are served from the cache until the index version changes.
+    answer_cache = AnswerCache(ANSWER_CACHE_PATH, version_fn=lambda: read_index_version(CHROMA_DB_PATH), ttl=ANSWER_CACHE_TTL)
+    print(f"Initialization took {time.perf_counter() - started:.2f} seconds.")
+
+async def compact_conversations_periodically():
+    """Delete idle conversations and old checkpoints, and trim conversations over the size cap."""
+    while True:
+        await asyncio.sleep(CONVERSATION_COMPACT_INTERVAL)
+        if checkpointer is None:
+            continue
+        try:
+            stats = await asyncio.to_thread(checkpointer.compact)
+            print(f"Conversation store compaction: {stats}")
+        except Exception as e:
+            print(f"Conversation store compaction failed: {e!r}")
+
+def initialize_in_background():
+    global init_error
+    try:
+        initialize()
+        ready.set()
+    except Exception as e:
+        init_error = e
+        print(f"Initialization failed: {e!r}")
+        raise
+
+async def cached_answer(user_input: str, id: str, lang: str):
+    """The cached answer to a generic question, or None. A cached answer is added to the conversation like an agent answer."""
+    if answer_cache is None or not answer_cache.is_cacheable(user_input):
+        return None
+    response_json = await asyncio.to_thread(answer_cache.get, user_input, lang, account_for_user(id))
+    if response_json is None:
+        return None
+    # The question and the answer are written into the thread as if the agent had run, so follow-up questions have the context.
+    if "generate_structured_response" in agent_executor.nodes:
+        as_node, answer = "generate_structured_response", " ".join(item["content"] for item in response_json["response"] if item.get("content"))
+    else:
+        as_node, answer = "post_model_hook", json.dumps(response_json, ensure_ascii=False)  # Single-pass answers are JSON
+    await agent_executor.aupdate_state(
+      {"configurable": {"thread_id": id}},
+      {"messages": [HumanMessage(content=user_input), AIMessage(content=answer)], "structured_response": ResponseFormatter.model_validate(response_json)},
+      as_node=as_node,
+    )
+    print(f"Answered from the answer cache: {answer_cache.stats()}")
+    return response_json
+
+def turn_tools(messages) -> set:
+    """Names of the tools called since the last user message."""
+    names = set()
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage):
+            break
+        names.update(tool_call["name"] for tool_call in getattr(message, "tool_calls", None) or [])
+    return names
+
+async def remember_answer(user_input: str, id: str, lang: str, response_json: dict, started: float, tool_names):
+    """Cache the answer of a turn, unless it read the transactions (see answer_cache.py)."""
+    if answer_cache is not None:
+        cost = time.perf_counter() - started
+        await asyncio.to_thread(answer_cache.put, user_input, lang, account_for_user(id), response_json, cost, tool_names)
+
+async def stream_graph_updates(user_input: str, id: str, lang: str = "en-US"):
+    # Generic questions that were answered before are served from the answer cache, see answer_cache.py.
+    if (response_json := await cached_answer(user_input, id, lang)) is not None:
+      return response_json
+    started = time.perf_counter()
+    schema_turn = schema_cache.start_turn() if schema_cache else None  # Counts the schema cache hits of this turn
+
+    # astream awaits the LLM calls and tools, so the event loop can serve other conversations meanwhile.
+    last_event = None
+    async for event in agent_executor.astream(
       {"messages": [{"role": "user", "content": user_input}]},
       stream_mode="values",
       config={"configurable": {"thread_id": id}},  # Identifiers for different conversations
@@ -301,8 +578,97 @@ def stream_graph_updates(user_input: str, id: str):
     if last_event:
       response_json = last_event["structured_response"].model_dump()
       print("\n\nResponse JSON:", json.dumps(response_json, ensure_ascii=False, indent=2))
+      if schema_turn:
+        schema_cache.finish_turn(schema_turn)
+      await remember_answer(user_input, id, lang, response_json, started, turn_tools(last_event["messages"]))
       return response_json
 
+async def stream_chat_events(user_input: str, id: str, lang: str = "en-US"):
+    """Run an agent turn and yield (event, data) pairs: tool status updates first, then each response item once it is complete."""
+    if (response_json := await cached_answer(user_input, id, lang)) is not None:
+      for index, item in enumerate(response_json["response"]):
+        yield "item", {"index": index, "item": item}
+      yield "done", response_json
+      return
+    started = time.perf_counter()
+    schema_turn = schema_cache.start_turn() if schema_cache else None
+
+    parsers = {}  # Message ID -> IncrementalItemParser, each LLM call that may write the structured response is parsed separately
+    streamed = {}  # Message ID -> items sent to the client
+    last_streamed = []
+    last_response = None
+    tool_names = set()  # Tools called in this turn, for the answer cache
+    async for mode, chunk in agent_executor.astream(
+      {"messages": [{"role": "user", "content": user_input}]},
+      stream_mode=["updates", "messages"],
+      config={"configurable": {"thread_id": id}},
+    ):
+      if mode == "messages":
+        # Tokens of the LLM calls. In single-pass mode the agent's final answer is the structured response JSON,
+        # otherwise it comes from the structured output call (or its fallback), as message content or tool call arguments.
+        message, metadata = chunk
+        if metadata.get("langgraph_node") not in ("agent", "post_model_hook", "generate_structured_response"):
+          continue
+        parser = parsers.setdefault(message.id, IncrementalItemParser())
+        items = streamed.setdefault(message.id, [])
+        pieces = [message.content] if isinstance(message.content, str) else []
+        pieces += [tool_call_chunk.get("args") or "" for tool_call_chunk in getattr(message, "tool_call_chunks", [])]
+        for piece in pieces:
+          for item in filter(None, map(normalize_item, parser.feed(piece))):
+            items.append(item)
+            last_streamed = items
+            yield "item", {"index": len(items) - 1, "item": item}
+        continue
+
+      for node, update in chunk.items():
+        if not update:
+          continue
+        if node == "agent":
+          for tool_call in getattr(update["messages"][-1], "tool_calls", []):
+            tool_names.add(tool_call["name"])
+            yield "status", {"stage": "tool_start", "tool": tool_call["name"]}
+        elif node == "tools":
+          for message in update["messages"]:
+            yield "status", {"stage": "tool_end", "tool": message.name, "status": getattr(message, "status", "success")}
+        elif "structured_response" in update:
+          last_response = update["structured_response"].model_dump()
+
+    if last_response:
+      # The validated structured response is authoritative. Items the incremental parser missed or got
+      # differently (e.g. repaired ones) are sent now, an item replaces an earlier item with the same index.
+      for index, item in enumerate(last_response["response"]):
+        if index >= len(last_streamed) or last_streamed[index] != item:
+          yield "item", {"index": index, "item": item}
+      print("\n\nStreamed response JSON:", json.dumps(last_response, ensure_ascii=False, indent=2))
+      if schema_turn:
+        schema_cache.finish_turn(schema_turn)
+      await remember_answer(user_input, id, lang, last_response, started, tool_names)
+      yield "done", last_response
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# These are hardcoded structured response examples.
+# Link and attachment messages are not added to memory, AI won't be aware of them yet.
+# Refer to this https://python.langchain.com/docs/concepts/structured_outputs/ 
+# on how to create structured outputs with Langchain/LangGraph.
+EXAMPLE_RESPONSES = {
+    "link": {
+      "response": [
+        { "type": "text", "content": "Based on ASP loan terms " },
+        { "type": "link", "url": "https://www.nordea.fi/en/personal/our-services/loans/home-loans/asploan.html#faq=Frequently-asked-questions-about-ASP-loans+496407", "label": "Nordea - ASP loan" },
+        { "type": "text", "content": ", The saving period for an ASP loan is a minimum of two years. Let me know if you need anything else." }
+      ]
+    },
+    "attachment": {
+      "response": [
+        { "type": "text", "content": "You have 1 unpaid invoice from SlicedInvoices: " },
+        { "type": "attachment", "url": "https://slicedinvoices.com/pdf/wordpress-pdf-invoice-plugin-sample.pdf", "label": "Open Invoice PDF" },
+        { "type": "text", "content": "The due date is this Wednesday, and the sum is 93.50€." }
+      ]
+    },
+}
+
 # Input model
 class ChatInput(BaseModel):
     message: str
@@ -310,77 +676,208 @@ class ChatInput(BaseModel):
     audio: bool
     langCode: str
 
-def text_to_base64_audio(text: str, lang: str = "en-US") -> str:
-    # Remove emojis and asterisks from the text
-    emoji_pattern = re.compile(
-      "[" 
-      "\U0001F600-\U0001F64F"  # emoticons
-      "\U0001F300-\U0001F5FF"  # symbols & pictographs
-      "\U0001F680-\U0001F6FF"  # transport & map symbols
-      "\U0001F1E0-\U0001F1FF"  # flags (iOS)
-      "\U00002700-\U000027BF"  # Dingbats
-      "\U000024C2-\U0001F251"
-      "]",
-      flags=re.UNICODE,
-    )
-    filtered_text = emoji_pattern.sub(r'', text)
-    filtered_text = filtered_text.replace("*", "")
-    client = texttospeech.TextToSpeechClient()
-    synthesis_input = texttospeech.SynthesisInput(text=filtered_text)
-    voice = texttospeech.VoiceSelectionParams(
-        language_code=lang,
-        name="en-US-Chirp3-HD-Achernar", # Try other voices as well!
-        ssml_gender=texttospeech.SsmlVoiceGender.FEMALE,
-    )
-    audio_config = texttospeech.AudioConfig(
-        audio_encoding=texttospeech.AudioEncoding.MP3
-    )
-    response = client.synthesize_speech(
-        input=synthesis_input, voice=voice, audio_config=audio_config
-    )
-    return base64.b64encode(response.audio_content).decode("utf-8")
+async def text_to_base64_audio(text: str, lang: str = "en-US") -> str:
+    # Emojis and asterisks are removed, and the audio of texts synthesized before comes from the cache, see tts.py.
+    audio = await speech.synthesize(text, lang)
+    return base64.b64encode(audio).decode("utf-8")
+
+async def audio_item(text: str, lang: str = "en-US") -> dict:
+    """The audio response item of an answer: the URL of its audio stream, or the audio as base64 (AUDIO_DELIVERY="inline")."""
+    if AUDIO_DELIVERY == "inline":
+        return {"type": "audio", "content": await text_to_base64_audio(text, lang), "format": "mp3"}
+    # Synthesis of the sentences starts now, the client fetches the audio from /audio/{id} while it is being synthesized.
+    audio_id, stream = audio_streams.create(lang)
+    stream.add_text(text)
+    stream.close()
+    return {"type": "audio", "url": f"/audio/{audio_id}", "format": "mp3"}
+
+class SpokenAnswer:
+    """Synthesizes the text items of an answer while the agent is still generating the rest of it (AUDIO_DELIVERY="stream")."""
+
+    def __init__(self, lang: str = "en-US"):
+        self.lang = lang
+        self.items = {}  # Index -> latest streamed item
+        self.spoken = []  # Texts of the text items added to the audio stream, in order
+        self._next_index = 0
+        self.audio_id, self.stream = audio_streams.create(lang)
+
+    def add_item(self, index: int, item: dict):
+        """Add an item event of stream_chat_events(). Text items are synthesized in order, as soon as the ones before them are known."""
+        self.items[index] = item
+        while self._next_index in self.items:
+            item = self.items[self._next_index]
+            if item["type"] == "text" and item.get("content"):
+                self.stream.add_text(item["content"])
+                self.spoken.append(item["content"])
+            self._next_index += 1
+
+    def finish(self, response_json: dict) -> dict:
+        """Add the rest of the final response and return its audio item."""
+        texts = [item["content"] for item in response_json.get("response", []) if item.get("type") == "text" and item.get("content")]
+        if texts[:len(self.spoken)] != self.spoken:
+            # Streamed items were replaced in the final response (e.g. repaired JSON), so its audio starts over.
+            # Sentences that are the same come from the TTS cache.
+            self.stream.close()
+            self.audio_id, self.stream = audio_streams.create(self.lang)
+            self.spoken = []
+        for text in texts[len(self.spoken):]:
+            self.stream.add_text(text)
+            self.spoken.append(text)
+        self.stream.close()
+        return self.audio_item()
+
+    def audio_item(self) -> dict:
+        return {"type": "audio", "url": f"/audio/{self.audio_id}", "format": "mp3"}
+
+# Liveness: the process is up and serving requests.
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok"}
+
+# Readiness: the agent and its documents are initialized, /chat requests will be answered.
+@app.get("/ready")
+def ready_endpoint():
+    if ready.is_set():
+        return {"status": "ready"}
+    if init_error:
+        return JSONResponse(status_code=503, content={"status": "failed", "error": repr(init_error)})
+    return JSONResponse(status_code=503, content={"status": "initializing"})
+
+# Cache statistics, to see how much work and latency the caches save.
+@app.get("/stats")
+def stats_endpoint():
+    if not ready.is_set():
+        return JSONResponse(status_code=503, content={"status": "initializing"})
+    return {
+        "embedding_cache": embeddings.stats(),
+        "retrieval_cache": query_cache.stats(),
+        "conversations": checkpointer.stats(),
+        "history": history_trimmer.stats(),
+        "answer_cache": answer_cache.stats(),
+        "transaction_store": transaction_store.stats(),
+        "sql_validator": sql_validator.stats(),
+        "schema_cache": {"in_prompt": SCHEMA_IN_PROMPT, **schema_cache.stats()},
+        "tts_cache": speech.stats(),
+        "audio_streams": audio_streams.stats(),
+        "structured_output": {"mode": STRUCTURED_OUTPUT_MODE, **(response_formatter.stats() if response_formatter else {})},
+    }
+
+ANSWER_FAILED = "Something went wrong while answering, please try again."
 
 # Endpoint
+# The endpoint is async all the way down (agent astream, async tools, async TTS), so a slow LLM turn
+# doesn't tie up one of FastAPI's worker threads, and one worker can serve many concurrent conversations.
+# See benchmarks/load_test_chat.py for a comparison with the previous sync endpoint.
 @app.post("/chat")
-def chat_endpoint(chat_input: ChatInput):
+async def chat_endpoint(chat_input: ChatInput):
     print("User:", chat_input)
     user_message = chat_input.message
     user_id = chat_input.userId
     audio = chat_input.audio
-    lang = chat_input.langCode # Not used yet, but may be applied to set text-to-speech parameters
+    lang = chat_input.langCode # Part of the answer cache key, and the language of the audio
 
-    # These are hardcoded structured response examples.
-    # Link and attachment messages are not added to memory, AI won't be aware of them yet.
-    # Refer to this https://python.langchain.com/docs/concepts/structured_outputs/ 
-    # on how to create structured outputs with Langchain/LangGraph.
-    
-    if (user_message == "link"):
-        return { 
-          "response": [
-            { "type": "text", "content": "Based on ASP loan terms " },
-            { "type": "link", "url": "https://www.nordea.fi/en/personal/our-services/loans/home-loans/asploan.html#faq=Frequently-asked-questions-about-ASP-loans+496407", "label": "Nordea - ASP loan" },
-            { "type": "text", "content": ", The saving period for an ASP loan is a minimum of two years. Let me know if you need anything else." }
-          ]
-        }
-    elif (user_message == "attachment"):
-        return { 
-          "response": [
-            { "type": "text", "content": "You have 1 unpaid invoice from SlicedInvoices: " },
-            { "type": "attachment", "url": "https://slicedinvoices.com/pdf/wordpress-pdf-invoice-plugin-sample.pdf", "label": "Open Invoice PDF" },
-            { "type": "text", "content": "The due date is this Wednesday, and the sum is 93.50€." }
-          ]
-        }      
+    # Hardcoded structured response examples, see EXAMPLE_RESPONSES.
+    if user_message in EXAMPLE_RESPONSES:
+        return EXAMPLE_RESPONSES[user_message]
     else:
-        response_json = stream_graph_updates(user_message, user_id)
+        # Requests that arrive during a cold start wait for the initialization instead of failing.
+        if not ready.is_set() and not await asyncio.to_thread(ready.wait, READY_TIMEOUT):
+            return JSONResponse(status_code=503, content={"detail": "The assistant is still starting up, please try again shortly."})
+        if audio and AUDIO_DELIVERY == "stream":
+            # Synthesis of the first text items overlaps with the generation of the rest of the answer,
+            # so most of the audio is ready when the response is returned.
+            spoken = SpokenAnswer(lang)
+            response_json = None
+            try:
+                async for event, data in stream_chat_events(user_message, user_id, lang):
+                    if event == "item":
+                        spoken.add_item(data["index"], data["item"])
+                    elif event == "done":
+                        response_json = data
+                if response_json is None:
+                    return JSONResponse(status_code=500, content={"detail": ANSWER_FAILED})
+                response_json["response"].append(spoken.finish(response_json))
+                return response_json
+            finally:
+                spoken.stream.close()  # Also on errors and cancellation, so that readers of the audio don't wait for more
+        response_json = await stream_graph_updates(user_message, user_id, lang)
+        if response_json is None:
+            return JSONResponse(status_code=500, content={"detail": ANSWER_FAILED})
         # Filter only 'text' type items and concatenate their content
         text_content = " ".join(
             item["content"] for item in response_json.get("response", []) if item.get("type") == "text" and item.get("content")
         )
         if audio:
-            audio_base64 = text_to_base64_audio(text_content)
-            response_json["response"].append({
-                "type": "audio",
-                "content": audio_base64,
-                "format": "mp3"
-            })
+            response_json["response"].append(await audio_item(text_content, lang))
         return response_json
+
+# Binary audio of an answer (MP3), delivered sentence by sentence in order as soon as each sentence is synthesized.
+# The URL comes from the audio item of a /chat or /chat/stream response and can be used directly as the source of an <audio> element.
+@app.get("/audio/{audio_id}")
+async def audio_endpoint(audio_id: str):
+    stream = audio_streams.get(audio_id)
+    if stream is None:
+        return JSONResponse(status_code=404, content={"detail": "Unknown or expired audio."})
+    return StreamingResponse(stream.chunks(), media_type="audio/mpeg", headers={"Cache-Control": "no-store"})
+
+# Streaming endpoint (server-sent events). The client gets feedback right away instead of after the whole turn:
+#   event: status  {"stage": "started" | "tool_start" | "tool_end", "tool": ...}  while the agent works
+#   event: item    {"index": n, "item": ResponseItem}  as soon as each response item is complete (replaces an earlier item n)
+#   event: audio   {"type": "audio", "url": "/audio/{id}", "format": "mp3"}  if audio was requested, with the first text item
+#                  (see SpokenAnswer). A later audio event replaces the earlier one.
+#   event: done    the full response, same JSON as /chat returns (without audio)
+#   event: error   {"detail": ...}
+@app.post("/chat/stream")
+async def chat_stream_endpoint(chat_input: ChatInput):
+    print("User (stream):", chat_input)
+
+    async def events():
+        yield sse_event("status", {"stage": "started"})
+        if chat_input.message in EXAMPLE_RESPONSES:
+            response_json = EXAMPLE_RESPONSES[chat_input.message]
+            for index, item in enumerate(response_json["response"]):
+                yield sse_event("item", {"index": index, "item": item})
+            yield sse_event("done", response_json)
+            return
+        if not ready.is_set() and not await asyncio.to_thread(ready.wait, READY_TIMEOUT):
+            yield sse_event("error", {"detail": "The assistant is still starting up, please try again shortly."})
+            return
+        # With streamed audio, the audio event is sent with the first text item and the audio plays while the answer is generated.
+        spoken = SpokenAnswer(chat_input.langCode) if chat_input.audio and AUDIO_DELIVERY == "stream" else None
+        try:
+            response_json = None
+            announced = None
+            async for event, data in stream_chat_events(chat_input.message, chat_input.userId, chat_input.langCode):
+                yield sse_event(event, data)
+                if event == "item" and spoken:
+                    spoken.add_item(data["index"], data["item"])
+                    if spoken.spoken and announced is None:
+                        announced = spoken.audio_item()
+                        yield sse_event("audio", announced)
+                elif event == "done":
+                    response_json = data
+            if response_json is None:  # The turn ended without a response
+                yield sse_event("error", {"detail": ANSWER_FAILED})
+                return
+            if spoken:
+                if (audio := spoken.finish(response_json)) != announced:
+                    yield sse_event("audio", audio)
+            elif chat_input.audio:
+                text_content = " ".join(
+                    item["content"] for item in response_json.get("response", []) if item.get("type") == "text" and item.get("content")
+                )
+                yield sse_event("audio", await audio_item(text_content, chat_input.langCode))
+        except Exception as e:
+            print(f"Streaming chat failed: {e!r}")
+            yield sse_event("error", {"detail": ANSWER_FAILED})
+        finally:
+            # Also when the client disconnects (the generator is closed), so that readers of the audio don't wait for more.
+            if spoken:
+                spoken.stream.close()
+
+    # X-Accel-Buffering stops proxies from buffering the event stream.
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+import_time = time.perf_counter() - _import_started
+if import_time > IMPORT_TIME_BUDGET:
+    print(f"Warning: importing api.py took {import_time:.2f} seconds, over the budget of {IMPORT_TIME_BUDGET:.2f} seconds.")
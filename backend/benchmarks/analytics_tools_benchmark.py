@@ -0,0 +1,108 @@
+# Benchmark of spending questions answered with the SQL toolkit vs. the spending analytics tools (transaction_analytics.py).
+#
+# A scripted stub LLM makes the tool calls the agent makes for each question, against the real transaction database:
+# "sql+llm check" is the SQL toolkit as is: list the tables, read the schema, check the query (sql_db_query_checker,
+# itself an LLM call) and run it; "sql" runs the query with the local validation of sql_validator.py instead of the
+# checker and the cached schema tools of schema_cache.py; "sql, schema in prompt" has the schema in the system prompt, so
+# it skips listing the tables and reading the schema; "analytics" calls one analytics tool. Reported per question: LLM calls and end-to-end latency with a fixed
+# latency per LLM call, and the result of the data tool, to check that both ways give the same numbers.
+#
+# Usage (from the backend directory): python benchmarks/analytics_tools_benchmark.py [LLM latency in seconds]
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+os.environ.setdefault("GOOGLE_APPLICATION_CREDENTIALS", "benchmark")
+
+from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
+from langchain_community.utilities.sql_database import SQLDatabase
+from langchain_core.messages import ToolMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+import api
+from benchmarks.stubs import ScriptedChatModel
+from prompts import SCHEMA_PROMPT
+from schema_cache import SchemaCache
+from sql_validator import SCHEMA_QUERY, SqlValidator
+
+LLM_LATENCY = float(sys.argv[1]) if len(sys.argv) > 1 else 0.5
+ANSWER = json.dumps({"response": [{"type": "text", "content": "Here is the summary of your spending."}]})
+SQL_DISCOVERY = [("sql_db_list_tables", {}), ("sql_db_schema", {"table_names": "transaction_history"})]
+
+def sql_script(query: str) -> list:
+  return SQL_DISCOVERY + [("sql_db_query_checker", {"query": query}), ("sql_db_query", {"query": query})]
+
+def validated_sql_script(script: list) -> list:
+  return [step for step in script if step[0] != "sql_db_query_checker"]
+
+def schema_in_prompt_script(script: list) -> list:
+  return [step for step in validated_sql_script(script) if step not in SQL_DISCOVERY]
+
+# (question, SQL toolkit script, analytics tools script)
+QUESTIONS = [
+  ("What did I spend on groceries in June 2024?",
+   sql_script("SELECT ROUND(SUM(amount), 2), COUNT(*) FROM transaction_history WHERE transaction_type = 'Groceries' AND transaction_date BETWEEN '2024-06-01' AND '2024-06-30'"),
+   [("spending_summary", {"start_date": "2024-06-01", "end_date": "2024-06-30", "category": "Groceries"})]),
+  ("Where did I spend the most money in 2024?",
+   sql_script("SELECT receiver, ROUND(SUM(amount), 2) AS total FROM transaction_history WHERE transaction_date BETWEEN '2024-01-01' AND '2024-12-31' GROUP BY receiver ORDER BY total DESC LIMIT 5"),
+   [("top_merchants", {"start_date": "2024-01-01", "end_date": "2024-12-31", "limit": 5})]),
+  ("How has my restaurant spending changed month to month this year?",
+   sql_script("SELECT strftime('%Y-%m', transaction_date) AS month, ROUND(SUM(amount), 2) FROM transaction_history WHERE transaction_type = 'Restaurant' AND transaction_date >= '2025-01-01' GROUP BY month ORDER BY month"),
+   [("monthly_spending", {"start_date": "2025-01-01", "category": "Restaurant"})]),
+]
+
+async def ask(question: str, script: list, local_check: bool, turn: str, extra_prompt: str = "") -> tuple[int, float, str]:
+  model = ScriptedChatModel(latency=LLM_LATENCY, answer=ANSWER, script=script)
+  if local_check:
+    sql_tools = [api.sql_db_list_tables, api.sql_db_schema, api.sql_db_query]
+  else:
+    sql_tools = SQLDatabaseToolkit(db=api.sql_database, llm=model).get_tools()  # The query checker calls the same (stub) LLM
+  tools = [api.spending_summary, api.top_merchants, api.monthly_spending, api.balance_over_time, *sql_tools]
+  api.agent_executor, _ = api.create_agent(model, tools, MemorySaver(), mode="single_pass", extra_prompt=extra_prompt)
+  started = time.perf_counter()
+  schema_turn = api.schema_cache.start_turn()
+  result = await api.agent_executor.ainvoke({"messages": [{"role": "user", "content": question}]}, {"configurable": {"thread_id": turn}})
+  elapsed = time.perf_counter() - started
+  api.schema_cache.finish_turn(schema_turn)
+  data = [message.content for message in result["messages"] if isinstance(message, ToolMessage)][-1]
+  return model.calls, elapsed, data
+
+async def main():
+  api.transaction_store = api.get_transaction_store()
+  engine = api.get_engine_for_transaction_db(api.transaction_store)
+  with engine.connect() as connection:
+    api.sql_validator = SqlValidator([row[0] for row in connection.exec_driver_sql(SCHEMA_QUERY)])
+  api.sql_database = SQLDatabase(engine)
+  api.schema_cache = SchemaCache(api.sql_database, version_fn=lambda: api.transaction_store.version(api.TRANSACTION_ACCOUNT))
+  started = time.perf_counter()
+  schema_prompt = SCHEMA_PROMPT.format(schema=api.schema_cache.compact_schema())
+  print(f"Schema for the system prompt ({len(schema_prompt)} characters) built in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+  totals = {"sql+llm check": [0, 0.0], "sql": [0, 0.0], "sql, schema in prompt": [0, 0.0], "analytics": [0, 0.0]}
+  for i, (question, sql, analytics) in enumerate(QUESTIONS):
+    print(f"\n{question}")
+    paths = (
+      ("sql+llm check", sql, False, ""),
+      ("sql", validated_sql_script(sql), True, ""),
+      ("sql, schema in prompt", schema_in_prompt_script(sql), True, schema_prompt),
+      ("analytics", analytics, True, ""),
+    )
+    for label, script, local_check, extra_prompt in paths:
+      calls, elapsed, data = await ask(question, script, local_check, f"{label}-{i}", extra_prompt)
+      totals[label][0] += calls
+      totals[label][1] += elapsed
+      print(f"  {label:22} {calls} LLM calls, {elapsed:.2f} s  {data[:150]}")
+
+  print(f"\n{len(QUESTIONS)} questions, {LLM_LATENCY} s per LLM call. Per question on average:")
+  for label, (calls, elapsed) in totals.items():
+    print(f"  {label:22} {calls / len(QUESTIONS):.1f} LLM calls, {elapsed / len(QUESTIONS):.2f} s")
+  print(f"Schema cache: {json.dumps(api.schema_cache.stats())}")
+
+if __name__ == "__main__":
+  asyncio.run(main())
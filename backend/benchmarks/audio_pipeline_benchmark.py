@@ -0,0 +1,89 @@
+# Benchmark of voice answers with a stubbed, streaming LLM and a fake synthesizer: is synthesis overlapped with generation?
+#
+# "sequential" is the previous /chat behavior: the whole structured response is generated, then its text is synthesized.
+# "pipelined" is the current /chat with audio (SpokenAnswer): each text item is synthesized as soon as the agent has
+# written it, while the rest of the answer is still being generated. "pipelined SSE" is /chat/stream with audio, where
+# the client gets the audio URL with the first text item and can start playing before the answer is complete.
+# Times are measured from the request: until the response, until the first audio chunk and until all audio has been read.
+#
+# Usage (from the backend directory): python benchmarks/audio_pipeline_benchmark.py [turns] [seconds per streamed chunk]
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+os.environ.setdefault("GOOGLE_APPLICATION_CREDENTIALS", "benchmark")
+
+from langgraph.checkpoint.memory import MemorySaver
+
+import api
+from benchmarks.stubs import StubChatModel, make_stub_tool
+from tts import AudioCache, AudioStreams, FakeSynthesizer, SpeechService
+
+TURNS = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+CHUNK_LATENCY = float(sys.argv[2]) if len(sys.argv) > 2 else 0.03
+LLM_LATENCY = 0.3  # Seconds to the first token of each LLM call
+QUESTION = "How does an ASP loan work?"
+ANSWER = json.dumps({"response": [
+  {"type": "text", "content": "An ASP loan is a home loan for first-time buyers aged 15 to 39."},
+  {"type": "text", "content": "You first save at least 5% of the price of the home to an ASP account for at least eight months."},
+  {"type": "link", "url": "https://www.nordea.fi/en/personal/our-services/loans/home-loans/asploan.html", "label": "Nordea - ASP loan"},
+  {"type": "text", "content": "The state guarantees part of the loan and pays an interest subsidy during the first ten years."},
+]})
+
+def setup():
+  # A fresh agent and a memory-only TTS cache, so that every turn generates and synthesizes everything.
+  model = StubChatModel(latency=LLM_LATENCY, answer=ANSWER, chunk_latency=CHUNK_LATENCY)
+  api.agent_executor, _ = api.create_agent(model, [make_stub_tool()], MemorySaver(), mode="single_pass")
+  api.speech = SpeechService(FakeSynthesizer(latency=0.25, seconds_per_char=0.003), AudioCache(None), max_concurrency=4)
+  api.audio_streams = AudioStreams(api.speech)
+  api.ready.set()
+
+async def read_audio(url: str, started: float) -> tuple[float, float]:
+  first = None
+  async for _ in api.audio_streams.get(url.rsplit("/", 1)[-1]).chunks():
+    first = first or time.perf_counter() - started
+  return first, time.perf_counter() - started
+
+async def sequential(turn: int) -> tuple[float, float, float]:
+  started = time.perf_counter()
+  response_json = await api.stream_graph_updates(QUESTION, f"sequential-{turn}")
+  text = " ".join(item["content"] for item in response_json["response"] if item["type"] == "text")
+  audio = await api.audio_item(text)
+  return time.perf_counter() - started, *await read_audio(audio["url"], started)
+
+async def pipelined(turn: int) -> tuple[float, float, float]:
+  started = time.perf_counter()
+  response_json = await api.chat_endpoint(api.ChatInput(message=QUESTION, userId=f"pipelined-{turn}", audio=True, langCode="en-US"))
+  response_time = time.perf_counter() - started
+  return response_time, *await read_audio(response_json["response"][-1]["url"], started)
+
+async def pipelined_sse(turn: int) -> tuple[float, float, float]:
+  started = time.perf_counter()
+  response = await api.chat_stream_endpoint(api.ChatInput(message=QUESTION, userId=f"sse-{turn}", audio=True, langCode="en-US"))
+  reader = None
+  async for event in response.body_iterator:
+    if event.startswith("event: audio") and reader is None:
+      reader = asyncio.create_task(read_audio(json.loads(event.split("data: ", 1)[1])["url"], started))
+    elif event.startswith("event: done"):
+      response_time = time.perf_counter() - started
+  return response_time, *await reader
+
+async def run(scenario) -> list[float]:
+  totals = [0.0, 0.0, 0.0]
+  for turn in range(TURNS):
+    setup()
+    for i, value in enumerate(await scenario(turn)):
+      totals[i] += value / TURNS
+  return totals
+
+if __name__ == "__main__":
+  rows = [(label, asyncio.run(run(scenario))) for label, scenario in (("sequential", sequential), ("pipelined", pipelined), ("pipelined SSE", pipelined_sse))]
+  print(f"\n{TURNS} turns, {LLM_LATENCY} s to the first token, {CHUNK_LATENCY} s per streamed chunk, fake TTS 0.25 s + 3 ms/character.\n")
+  for label, (response, first_audio, all_audio) in rows:
+    print(f"{label:14} response {response:.2f} s, first audio {first_audio:.2f} s, all audio {all_audio:.2f} s")
@@ -0,0 +1,81 @@
+# Load test of the /chat endpoint with a stubbed LLM: the async endpoint vs. the previous sync one.
+#
+# The previous endpoint was a sync `def` calling agent_executor.stream(), so every in-flight conversation held
+# one of FastAPI's worker threads (40 by default) for the whole agent loop, and further requests queued.
+# The async endpoint awaits the LLM instead, so one worker serves all concurrent conversations.
+#
+# Usage (from the backend directory): python benchmarks/load_test_chat.py [concurrent requests] [LLM latency in seconds]
+
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GEMINI_API_KEY", "load-test")
+os.environ.setdefault("GOOGLE_APPLICATION_CREDENTIALS", "load-test")
+
+import aiohttp
+import uvicorn
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.prebuilt import create_react_agent
+
+import api
+from benchmarks.stubs import StubChatModel, make_stub_tool
+
+CONCURRENCY = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+LLM_LATENCY = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+PORT = 8790
+
+# The real agent graph, with a stubbed LLM and tool. The lifespan (and its real initialization) is not run.
+api.agent_executor = create_react_agent(
+  StubChatModel(latency=LLM_LATENCY),
+  [make_stub_tool()],
+  checkpointer=MemorySaver(),
+  prompt=api.prompt,
+  response_format=api.ResponseFormatter,
+)
+api.ready.set()
+
+@api.app.post("/chat-sync")
+def legacy_chat_endpoint(chat_input: api.ChatInput):
+  """The previous implementation: a sync endpoint that blocks its worker thread on agent_executor.stream()."""
+  last_event = None
+  for event in api.agent_executor.stream(
+    {"messages": [{"role": "user", "content": chat_input.message}]},
+    stream_mode="values",
+    config={"configurable": {"thread_id": chat_input.userId}},
+  ):
+    last_event = event
+  return last_event["structured_response"].model_dump()
+
+async def run_load(path: str) -> float:
+  async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=600), connector=aiohttp.TCPConnector(limit=0)) as session:
+    async def one_request(i):
+      payload = {"message": "What is the saving period of an ASP loan?", "userId": f"{path}-{i}", "audio": False, "langCode": "en-US"}
+      async with session.post(f"http://127.0.0.1:{PORT}{path}", json=payload) as response:
+        response.raise_for_status()
+        await response.json()
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(one_request(i) for i in range(CONCURRENCY)))
+    return time.perf_counter() - start_time
+
+if __name__ == "__main__":
+  server = uvicorn.Server(uvicorn.Config(api.app, port=PORT, lifespan="off", log_level="warning"))
+  server_thread = threading.Thread(target=server.run, daemon=True)
+  server_thread.start()
+  while not server.started:
+    if not server_thread.is_alive():
+      sys.exit(f"The server could not be started on port {PORT}.")
+    time.sleep(0.05)
+
+  # Each turn makes 3 LLM calls (tool call, answer, structured output), so its minimum latency is 3 * LLM_LATENCY.
+  print(f"{CONCURRENCY} concurrent conversations, {LLM_LATENCY} s per LLM call.\n")
+  for label, path in [("sync /chat (before)", "/chat-sync"), ("async /chat (after)", "/chat")]:
+    elapsed = asyncio.run(run_load(path))
+    print(f"{label}: {elapsed:.2f} s total, {CONCURRENCY / elapsed:.1f} requests/s")
+
+  server.should_exit = True
@@ -0,0 +1,59 @@
+# Benchmark of the structured output modes with a stubbed LLM: LLM calls per turn and end-to-end latency.
+#
+# "two_pass" is the previous behavior: create_react_agent(response_format=ResponseFormatter) makes one more LLM call
+# after the final answer, with the ResponseFormatter schema (FORMATTER_PROMPT and examples) and the whole history.
+# "single_pass" prompts the agent to write the final answer as ResponseFormatter JSON and parses it locally
+# (response_items.py). It falls back to the second call only when the answer can't be parsed or repaired.
+#
+# Usage (from the backend directory): python benchmarks/structured_output_benchmark.py [turns] [LLM latency in seconds]
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+os.environ.setdefault("GOOGLE_APPLICATION_CREDENTIALS", "benchmark")
+
+from langgraph.checkpoint.memory import MemorySaver
+
+import api
+from benchmarks.stubs import STUB_ANSWER, StubChatModel, make_stub_tool
+from context_packing import estimate_tokens
+
+TURNS = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+LLM_LATENCY = float(sys.argv[2]) if len(sys.argv) > 2 else 0.3
+
+ASP_URL = "https://www.nordea.fi/en/personal/our-services/loans/home-loans/asploan.html"
+JSON_ANSWER = json.dumps({"response": [{"type": "text", "content": STUB_ANSWER}, {"type": "link", "url": ASP_URL, "label": "Nordea - ASP loan"}]})
+SCENARIOS = [
+  ("two_pass", "two_pass", STUB_ANSWER),
+  ("single_pass, valid JSON", "single_pass", JSON_ANSWER),
+  ("single_pass, repaired JSON", "single_pass", f"```json\n{JSON_ANSWER[:-2]},]}}\n```"),  # Code fence and a trailing comma
+  ("single_pass, fallback", "single_pass", f"{STUB_ANSWER} See {ASP_URL}"),  # Plain text with a link needs the second pass
+]
+
+async def run_scenario(mode: str, answer: str) -> tuple[float, float, dict]:
+  model = StubChatModel(latency=LLM_LATENCY, answer=answer)
+  agent, formatter = api.create_agent(model, [make_stub_tool()], MemorySaver(), mode=mode)
+  api.agent_executor = agent
+  started = time.perf_counter()
+  for turn in range(TURNS):
+    response = await api.stream_graph_updates("What is the saving period of an ASP loan?", f"{mode}-{turn}")
+    assert response["response"], response
+  elapsed = time.perf_counter() - started
+  return elapsed / TURNS, model.calls / TURNS, formatter.stats() if formatter else {}
+
+if __name__ == "__main__":
+  # Tokens of the schema the second pass sends on top of the history (FORMATTER_PROMPT, field descriptions, examples).
+  schema_tokens = estimate_tokens(json.dumps(api.ResponseFormatter.model_json_schema(), ensure_ascii=False))
+  rows = []
+  for label, mode, answer in SCENARIOS:
+    rows.append((label, *asyncio.run(run_scenario(mode, answer))))
+
+  print(f"\n{TURNS} turns per scenario, {LLM_LATENCY} s per LLM call. The second pass also sends ~{schema_tokens} schema tokens plus the history.\n")
+  for label, latency, calls, stats in rows:
+    print(f"{label:28} {calls:.1f} LLM calls/turn, {latency:.2f} s/turn  {stats}")
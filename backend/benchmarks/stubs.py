@@ -0,0 +1,127 @@
+"""
+Stubbed LLM and tool for benchmarks, so the agent loop can be measured without calling Gemini.
+
+The stub model sleeps instead of calling an API (time.sleep when invoked sync, asyncio.sleep when
+invoked async), first requests one tool call, and answers once it has seen the tool result.
+With chunk_latency set, async streaming delivers the answer in chunks of a few characters, like a real LLM.
+"""
+
+import asyncio
+import json
+import time
+from typing import Any
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+from langchain_core.tools import StructuredTool
+
+CHUNK_CHARS = 16  # Characters per streamed chunk, roughly four tokens
+STUB_ANSWER = "The saving period for an ASP loan is a minimum of two years."
+
+
+def _reply(messages, answer: str) -> AIMessage:
+    if not any(isinstance(message, ToolMessage) for message in messages):
+        return AIMessage(content="", tool_calls=[{"name": "lookup", "args": {"query": "ASP loan"}, "id": f"call_{time.monotonic_ns()}"}])
+    return AIMessage(content=answer)
+
+
+class StubChatModel(BaseChatModel):
+    latency: float = 0.5  # Seconds per LLM call
+    calls: int = 0
+    answer: str = STUB_ANSWER  # Final answer, e.g. ResponseFormatter JSON in single-pass mode
+    chunk_latency: float = 0.0  # Seconds per streamed chunk of CHUNK_CHARS characters, 0 disables streaming
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _message(self, messages) -> AIMessage:
+        return _reply(messages, self.answer)
+
+    def _generation_seconds(self, message: AIMessage) -> float:
+        # Without streaming, the answer takes as long to generate as its streamed chunks would.
+        return self.latency + -(-len(message.content) // CHUNK_CHARS) * self.chunk_latency
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        self.calls += 1
+        message = self._message(messages)
+        time.sleep(self._generation_seconds(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        self.calls += 1
+        message = self._message(messages)
+        await asyncio.sleep(self._generation_seconds(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        if not self.chunk_latency:
+            result = await self._agenerate(messages, stop, run_manager, **kwargs)
+            message = result.generations[0].message
+            tool_call_chunks = [{**tool_call, "args": json.dumps(tool_call["args"]), "index": i} for i, tool_call in enumerate(message.tool_calls)]
+            yield ChatGenerationChunk(message=AIMessageChunk(content=message.content, tool_call_chunks=tool_call_chunks))
+            return
+        self.calls += 1
+        await asyncio.sleep(self.latency)  # Time to the first token
+        message = self._message(messages)
+        if message.tool_calls:
+            tool_call_chunks = [{**tool_call, "args": json.dumps(tool_call["args"]), "index": i} for i, tool_call in enumerate(message.tool_calls)]
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=tool_call_chunks))
+            return
+        for start in range(0, len(message.content), CHUNK_CHARS):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=message.content[start:start + CHUNK_CHARS]))
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+            await asyncio.sleep(self.chunk_latency)
+
+    def bind_tools(self, tools, **kwargs: Any):
+        return self
+
+    def with_structured_output(self, schema, **kwargs: Any):
+        """Second LLM pass of create_react_agent(response_format=...): returns a fixed structured answer."""
+        def format_answer(messages):
+            self.calls += 1
+            time.sleep(self.latency)
+            return schema(response=[{"type": "text", "content": STUB_ANSWER, "url": None, "label": None}])
+
+        async def aformat_answer(messages):
+            self.calls += 1
+            await asyncio.sleep(self.latency)
+            return schema(response=[{"type": "text", "content": STUB_ANSWER, "url": None, "label": None}])
+
+        return RunnableLambda(format_answer, afunc=aformat_answer)
+
+
+class ScriptedChatModel(StubChatModel):
+    """Makes the tool calls of a script, one per LLM call, and then answers.
+
+    It also stands in for the LLM of the SQL toolkit's query checker, which gets the query back unchanged.
+    """
+    script: list = []  # (tool name, args) pairs, in order
+
+    def _message(self, messages) -> AIMessage:
+        last_message = messages[-1]
+        if isinstance(last_message.content, str) and "\nDouble check the" in last_message.content:
+            return AIMessage(content=last_message.content.split("\nDouble check the")[0].strip())
+        turn_start = max((i for i, message in enumerate(messages) if isinstance(message, HumanMessage)), default=0)
+        step = sum(isinstance(message, AIMessage) for message in messages[turn_start:])
+        if step < len(self.script):
+            name, args = self.script[step]
+            return AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": f"call_{time.monotonic_ns()}"}])
+        return AIMessage(content=self.answer)
+
+
+def make_stub_tool(latency: float = 0.05) -> StructuredTool:
+    """A tool that simulates retrieval I/O."""
+    def lookup(query: str) -> str:
+        time.sleep(latency)
+        return f"Stub document about {query}."
+
+    async def alookup(query: str) -> str:
+        await asyncio.sleep(latency)
+        return f"Stub document about {query}."
+
+    return StructuredTool.from_function(func=lookup, coroutine=alookup, name="lookup", description="Look up documents.")
@@ -0,0 +1,80 @@
+# Benchmark of the startup time of the transaction database: loading the SQL script at startup vs. opening a prebuilt database.
+#
+# For growing synthetic histories (receivers and types of data/transaction_history.sql, random amounts and dates), writes an SQL
+# script of INSERT statements like data/transaction_history.sql, and measures:
+#   - "script": what every start used to do, executescript() into an in-memory database and create the indexes and aggregate tables;
+#   - "build step": compiling the script into an account database with transaction_store.py (done once, e.g. in the Dockerfile);
+#   - "prebuilt": what a start does now, open the store and run the first query and schema read on the prebuilt database.
+#
+# Usage (from the backend directory): python benchmarks/transaction_bootstrap_benchmark.py [largest history in rows]
+
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sql_validator import SCHEMA_QUERY
+from transaction_db import prepare_transaction_db
+from transaction_store import TransactionStore, read_rows
+
+LARGEST = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+SIZES = [size for size in (1_000, 10_000, 100_000, 1_000_000, 10_000_000) if size <= LARGEST]
+FIRST_QUERY = "SELECT total FROM monthly_category_totals WHERE transaction_type = 'Restaurant' AND month = '2024-06'"
+
+with open("data/transaction_history.sql", "r", encoding="utf-8") as f:
+  SQL_SCRIPT = f.read()
+SCHEMA = SQL_SCRIPT[:SQL_SCRIPT.index("-- Insert data")]
+RECEIVERS = sorted(set(re.findall(r"\(\d+\.?\d*, '([^']+)', '[\d-]+', '([^']+)'\)", SQL_SCRIPT)))
+
+def write_script(path: str, rows: int):
+  rng = random.Random(0)
+  start = date(2016, 1, 1)
+  with open(path, "w", encoding="utf-8") as f:
+    f.write(SCHEMA + "-- Insert data\n")
+    for first in range(0, rows, 500):
+      values = []
+      for _ in range(min(500, rows - first)):
+        receiver, transaction_type = rng.choice(RECEIVERS)
+        day = (start + timedelta(days=rng.randrange(3650))).isoformat()
+        values.append(f"({round(rng.uniform(2, 300), 2)}, '{receiver}', '{day}', '{transaction_type}')")
+      f.write("INSERT INTO transaction_history (amount, receiver, transaction_date, transaction_type) VALUES\n" + ",\n".join(values) + ";\n")
+
+def script_startup(path: str) -> float:
+  started = time.perf_counter()
+  with open(path, "r", encoding="utf-8") as f:
+    connection = sqlite3.connect(":memory:", check_same_thread=False)
+    connection.executescript(f.read())
+  prepare_transaction_db(connection)
+  connection.execute(FIRST_QUERY).fetchall()
+  connection.execute(SCHEMA_QUERY).fetchall()
+  elapsed = time.perf_counter() - started
+  connection.close()
+  return elapsed
+
+def prebuilt_startup(directory: str) -> float:
+  started = time.perf_counter()
+  store = TransactionStore(directory)
+  assert store.has_account("bench")
+  store.query("bench", FIRST_QUERY)
+  store.query("bench", SCHEMA_QUERY)
+  return time.perf_counter() - started
+
+if __name__ == "__main__":
+  print(f"{'rows':>10}  {'script':>10}  {'build step':>10}  {'prebuilt':>10}")
+  with tempfile.TemporaryDirectory() as directory:
+    script_path = os.path.join(directory, "transaction_history.sql")
+    for size in SIZES:
+      write_script(script_path, size)
+      script_seconds = script_startup(script_path)
+      started = time.perf_counter()
+      TransactionStore(directory).build("bench", read_rows(script_path))
+      build_seconds = time.perf_counter() - started
+      prebuilt_seconds = prebuilt_startup(directory)
+      print(f"{size:>10}  {script_seconds:>8.2f} s  {build_seconds:>8.2f} s  {prebuilt_seconds * 1000:>7.2f} ms")
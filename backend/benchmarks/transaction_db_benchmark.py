@@ -0,0 +1,99 @@
+# Benchmark of the transaction history queries with and without the indexes and aggregate tables of transaction_db.py.
+#
+# Builds two in-memory databases with the same synthetic rows (receivers and types of data/transaction_history.sql,
+# random amounts and dates over ten years): "plain" has the schema of transaction_history.sql only, "prepared" also
+# has the indexes and monthly aggregate tables. Reports the time of typical agent queries on both, and the cost of
+# keeping the aggregates in sync on insert.
+#
+# Usage (from the backend directory): python benchmarks/transaction_db_benchmark.py [rows]
+
+import os
+import random
+import re
+import sqlite3
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transaction_db import prepare_transaction_db
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+REPEATS = 5
+INSERTS = 10_000
+
+with open("data/transaction_history.sql", "r", encoding="utf-8") as f:
+  SQL_SCRIPT = f.read()
+SCHEMA = SQL_SCRIPT[:SQL_SCRIPT.index("-- Insert data")]
+RECEIVERS = sorted(set(re.findall(r"\(\d+\.?\d*, '([^']+)', '[\d-]+', '([^']+)'\)", SQL_SCRIPT)))
+
+# (label, plain query, query on the prepared database)
+QUERIES = [
+  ("restaurants in one month",
+   "SELECT ROUND(SUM(amount), 2) FROM transaction_history WHERE transaction_type = 'Restaurant' AND transaction_date BETWEEN '2024-06-01' AND '2024-06-30'",
+   "SELECT total FROM monthly_category_totals WHERE transaction_type = 'Restaurant' AND month = '2024-06'"),
+  ("totals by category, one year",
+   "SELECT strftime('%Y-%m', transaction_date), transaction_type, ROUND(SUM(amount), 2) FROM transaction_history WHERE transaction_date BETWEEN '2024-01-01' AND '2024-12-31' GROUP BY 1, 2",
+   "SELECT month, transaction_type, total FROM monthly_category_totals WHERE month BETWEEN '2024-01' AND '2024-12'"),
+  ("top 5 receivers in one month",
+   "SELECT receiver, ROUND(SUM(amount), 2) AS total FROM transaction_history WHERE transaction_date BETWEEN '2024-06-01' AND '2024-06-30' GROUP BY receiver ORDER BY total DESC LIMIT 5",
+   "SELECT receiver, total FROM monthly_receiver_totals WHERE month = '2024-06' ORDER BY total DESC LIMIT 5"),
+  ("one receiver, all time",
+   "SELECT ROUND(SUM(amount), 2), COUNT(*) FROM transaction_history WHERE receiver = 'Wolt'",
+   "SELECT ROUND(SUM(total), 2), SUM(count) FROM monthly_receiver_totals WHERE receiver = 'Wolt'"),
+  ("transactions of one day (index only)",
+   "SELECT amount, receiver FROM transaction_history WHERE transaction_date = '2024-06-07'",
+   "SELECT amount, receiver FROM transaction_history WHERE transaction_date = '2024-06-07'"),
+]
+
+def synthetic_rows(count: int, seed: int = 0):
+  rng = random.Random(seed)
+  start = date(2016, 1, 1)
+  for _ in range(count):
+    receiver, transaction_type = rng.choice(RECEIVERS)
+    yield round(rng.uniform(2, 300), 2), receiver, (start + timedelta(days=rng.randrange(3650))).isoformat(), transaction_type
+
+def build(prepared: bool) -> tuple[sqlite3.Connection, float]:
+  connection = sqlite3.connect(":memory:")
+  connection.executescript(SCHEMA)
+  with connection:
+    connection.executemany(
+      "INSERT INTO transaction_history (amount, receiver, transaction_date, transaction_type) VALUES (?, ?, ?, ?)", synthetic_rows(ROWS),
+    )
+  started = time.perf_counter()
+  if prepared:
+    prepare_transaction_db(connection)
+  return connection, time.perf_counter() - started
+
+def query_ms(connection: sqlite3.Connection, query: str) -> float:
+  connection.execute(query).fetchall()  # Warm up
+  started = time.perf_counter()
+  for _ in range(REPEATS):
+    connection.execute(query).fetchall()
+  return (time.perf_counter() - started) / REPEATS * 1000
+
+def insert_seconds(connection: sqlite3.Connection) -> float:
+  started = time.perf_counter()
+  with connection:
+    connection.executemany(
+      "INSERT INTO transaction_history (amount, receiver, transaction_date, transaction_type) VALUES (?, ?, ?, ?)", synthetic_rows(INSERTS, seed=1),
+    )
+  return time.perf_counter() - started
+
+if __name__ == "__main__":
+  plain, _ = build(prepared=False)
+  prepared, prepare_seconds = build(prepared=True)
+  print(f"\n{ROWS} rows, {len(RECEIVERS)} receivers. Creating the indexes and aggregate tables took {prepare_seconds:.2f} s.\n")
+
+  for label, plain_query, prepared_query in QUERIES:
+    assert sorted(plain.execute(plain_query)) == sorted(prepared.execute(prepared_query)), f"Different results: {label}"
+    before, after = query_ms(plain, plain_query), query_ms(prepared, prepared_query)
+    print(f"{label:38} {before:8.2f} ms -> {after:6.3f} ms  ({before / after:.0f}x)")
+
+  plain_inserts, prepared_inserts = insert_seconds(plain), insert_seconds(prepared)
+  print(f"\n{INSERTS} inserts: {plain_inserts * 1000:.0f} ms without, {prepared_inserts * 1000:.0f} ms with indexes and aggregate triggers.")
+  check = "SELECT month, transaction_type, ROUND(SUM(amount), 2), COUNT(*) FROM (SELECT strftime('%Y-%m', transaction_date) AS month, transaction_type, amount FROM transaction_history) GROUP BY 1, 2"
+  in_sync = prepared.execute(check).fetchall() == prepared.execute("SELECT month, transaction_type, total, count FROM monthly_category_totals ORDER BY 1, 2").fetchall()
+  print(f"Aggregates in sync with the transactions after the inserts: {in_sync}")
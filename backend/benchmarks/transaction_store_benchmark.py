@@ -0,0 +1,128 @@
+# Concurrency benchmark of the transaction store (transaction_store.py) vs. one shared in-memory connection.
+#
+# Builds synthetic accounts (receivers and types of data/transaction_history.sql, random amounts and dates over ten years)
+# twice: "shared" is the previous setup, one in-memory connection used by all sessions (one at a time, as with StaticPool),
+# here with all accounts in one table with an account column and an (account, transaction_date) index; "store" has one
+# database file per account with a pool of read-only connections. Each session (a thread) runs a mix of typical agent
+# queries on its own account. Reported: throughput and latency percentiles, and a scoping check (each session only sees
+# the rows of its account, which all have a different number of rows).
+#
+# Usage (from the backend directory): python benchmarks/transaction_store_benchmark.py [sessions] [rows per account]
+
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transaction_store import SCHEMA, TransactionStore
+
+SESSIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 128
+ROWS = int(sys.argv[2]) if len(sys.argv) > 2 else 20_000
+QUERIES_PER_SESSION = 20
+
+with open("data/transaction_history.sql", "r", encoding="utf-8") as f:
+  RECEIVERS = sorted(set(re.findall(r"\(\d+\.?\d*, '([^']+)', '[\d-]+', '([^']+)'\)", f.read())))
+
+# Typical queries of the agent on the transaction_history table of one account.
+QUERIES = [
+  "SELECT ROUND(SUM(amount), 2) FROM transaction_history WHERE transaction_type = 'Restaurant' AND transaction_date BETWEEN '2024-06-01' AND '2024-06-30'",
+  "SELECT receiver, ROUND(SUM(amount), 2) AS total FROM transaction_history WHERE transaction_date BETWEEN '2024-01-01' AND '2024-12-31' GROUP BY receiver ORDER BY total DESC LIMIT 5",
+  "SELECT strftime('%Y-%m', transaction_date) AS month, ROUND(SUM(amount), 2) FROM transaction_history WHERE transaction_date >= '2025-01-01' GROUP BY month",
+  "SELECT amount, receiver FROM transaction_history WHERE transaction_date = '2024-06-07'",
+  "SELECT ROUND(SUM(amount), 2), COUNT(*) FROM transaction_history WHERE receiver = 'Wolt'",
+]
+COUNT_QUERY = "SELECT COUNT(*) FROM transaction_history"
+
+def account_name(i: int) -> str:
+  return f"user{i:04d}"
+
+def account_rows(i: int) -> int:
+  return ROWS + i  # A different number of rows per account, for the scoping check
+
+def synthetic_rows(count: int, seed: int):
+  rng = random.Random(seed)
+  start = date(2016, 1, 1)
+  for _ in range(count):
+    receiver, transaction_type = rng.choice(RECEIVERS)
+    yield round(rng.uniform(2, 300), 2), receiver, (start + timedelta(days=rng.randrange(3650))).isoformat(), transaction_type
+
+def build_shared() -> sqlite3.Connection:
+  connection = sqlite3.connect(":memory:", check_same_thread=False)
+  connection.executescript(SCHEMA + "ALTER TABLE transaction_history ADD COLUMN account TEXT;")
+  with connection:
+    for i in range(SESSIONS):
+      connection.executemany(
+        "INSERT INTO transaction_history (amount, receiver, transaction_date, transaction_type, account) VALUES (?, ?, ?, ?, ?)",
+        (row + (account_name(i),) for row in synthetic_rows(account_rows(i), seed=i)),
+      )
+  connection.executescript("""
+    CREATE INDEX idx_account_date ON transaction_history (account, transaction_date);
+    CREATE INDEX idx_account_receiver ON transaction_history (account, receiver);
+    ANALYZE;
+  """)
+  return connection
+
+def scoped(query: str) -> str:
+  """The query on the shared table, limited to one account."""
+  return re.sub(r"FROM transaction_history( WHERE)?", lambda m: "FROM transaction_history WHERE account = ?" + (" AND" if m.group(1) else ""), query)
+
+def percentile(values: list, p: float) -> float:
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * p))]
+
+def run_sessions(label: str, run_query) -> None:
+  """run_query(session, query) -> rows"""
+  latencies, wrong = [], []
+  lock = threading.Lock()
+
+  def session(i: int):
+    rng = random.Random(i)
+    own = []
+    for _ in range(QUERIES_PER_SESSION):
+      query = rng.choice(QUERIES)
+      started = time.perf_counter()
+      run_query(i, query)
+      own.append(time.perf_counter() - started)
+    if run_query(i, COUNT_QUERY) != [(account_rows(i),)]:
+      wrong.append(i)
+    with lock:
+      latencies.extend(own)
+
+  started = time.perf_counter()
+  with ThreadPoolExecutor(max_workers=SESSIONS) as executor:
+    list(executor.map(session, range(SESSIONS)))
+  elapsed = time.perf_counter() - started
+  print(f"{label:7} {len(latencies) / elapsed:7.0f} queries/s   latency p50 {percentile(latencies, 0.5) * 1000:7.2f} ms"
+        f"  p95 {percentile(latencies, 0.95) * 1000:7.2f} ms  p99 {percentile(latencies, 0.99) * 1000:7.2f} ms"
+        f"   sessions that saw other accounts' rows: {len(wrong)}")
+
+if __name__ == "__main__":
+  started = time.perf_counter()
+  shared = build_shared()
+  shared_lock = threading.Lock()  # The connection runs one query at a time
+  print(f"Shared database: {SESSIONS} accounts, {sum(account_rows(i) for i in range(SESSIONS))} rows, built in {time.perf_counter() - started:.1f} s")
+
+  with tempfile.TemporaryDirectory() as directory:
+    store = TransactionStore(directory, pool_size=4, max_pools=SESSIONS)
+    started = time.perf_counter()
+    for i in range(SESSIONS):
+      store.build(account_name(i), synthetic_rows(account_rows(i), seed=i))
+    print(f"Store: {SESSIONS} account databases built in {time.perf_counter() - started:.1f} s\n")
+    print(f"{SESSIONS} parallel sessions, {QUERIES_PER_SESSION} queries each:")
+
+    def shared_query(i: int, query: str):
+      with shared_lock:
+        return shared.execute(scoped(query), (account_name(i),)).fetchall()
+
+    run_sessions("shared", shared_query)
+    run_sessions("store", lambda i, query: store.query(account_name(i), query))
+    print(f"\nStore: {store.stats()}")
@@ -0,0 +1,60 @@
+# Benchmark of the audio delivery with a fake synthesizer whose latency grows with the length of the text.
+#
+# "inline" is the previous behavior: the whole answer is synthesized in one call and returned as base64 in the JSON.
+# "stream" splits the answer into sentences, synthesizes them concurrently and delivers ordered binary chunks
+# (tts.AudioStream, served by /audio/{id}). Reported: time to the first audio byte, time to all audio, bytes sent.
+#
+# Usage (from the backend directory): python benchmarks/tts_benchmark.py [concurrency] [seconds per call] [seconds per character]
+
+import asyncio
+import base64
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tts import AudioCache, AudioStream, FakeSynthesizer, SpeechService, split_sentences
+
+CONCURRENCY = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+CALL_LATENCY = float(sys.argv[2]) if len(sys.argv) > 2 else 0.25
+SECONDS_PER_CHAR = float(sys.argv[3]) if len(sys.argv) > 3 else 0.003
+
+ANSWER = (
+  "An ASP loan is a home loan for first-time buyers aged 15 to 39. "
+  "Before you can get the loan, you save at least 5% of the price of the home to an ASP account for at least eight months. "
+  "You can save regularly or make one-time deposits, as long as the total reaches the target. "
+  "The state guarantees part of the loan, so the down payment can be smaller than with an ordinary home loan. "
+  "You also get an interest subsidy, which lowers your interest costs during the first ten years of the loan. "
+  "In addition, the ASP account pays a higher interest rate than an ordinary savings account. "
+  "You can open an ASP account in the Nordea mobile app or at a branch, and I can help you compare loan options."
+)
+
+def new_service() -> SpeechService:
+  # A fresh memory-only cache, so that every run synthesizes everything.
+  synthesizer = FakeSynthesizer(latency=CALL_LATENCY, seconds_per_char=SECONDS_PER_CHAR)
+  return SpeechService(synthesizer, AudioCache(None), max_concurrency=CONCURRENCY)
+
+async def inline() -> tuple[float, float, int]:
+  started = time.perf_counter()
+  audio = await new_service().synthesize(ANSWER)
+  elapsed = time.perf_counter() - started
+  return elapsed, elapsed, len(base64.b64encode(audio))  # Nothing can be played before the whole response has arrived
+
+async def stream() -> tuple[float, float, int]:
+  started = time.perf_counter()
+  audio_stream = AudioStream(new_service())
+  audio_stream.add_text(ANSWER)
+  audio_stream.close()
+  first, size = None, 0
+  async for chunk in audio_stream.chunks():
+    first = first or time.perf_counter() - started
+    size += len(chunk)
+  return first, time.perf_counter() - started, size
+
+if __name__ == "__main__":
+  segments = split_sentences(ANSWER)
+  print(f"\nAnswer of {len(ANSWER)} characters in {len(segments)} segments, {CALL_LATENCY} s + {SECONDS_PER_CHAR} s/character per synthesis, concurrency {CONCURRENCY}.\n")
+  for label, run in (("inline (one call, base64)", inline), ("stream (sentences, binary)", stream)):
+    first, total, size = asyncio.run(run())
+    print(f"{label:28} first audio {first:.2f} s, all audio {total:.2f} s, {size} bytes")
@@ -0,0 +1,49 @@
+# Import-time budget check for api.py.
+# The heavier api.py is to import, the longer a Cloud Run instance takes before it can accept traffic after a cold start.
+# Imports api.py in a fresh interpreter, prints the slowest imported modules and exits with an error if the budget is exceeded.
+# Usage: python check_import_time.py [budget in seconds]
+
+import os
+import subprocess
+import sys
+import time
+
+IMPORT_TIME_BUDGET = float(sys.argv[1]) if len(sys.argv) > 1 else float(os.getenv("IMPORT_TIME_BUDGET", "1.5"))
+SLOWEST_SHOWN = 10
+
+env = dict(os.environ)
+# api.py only checks that these are set on import, the values are not used before initialize().
+env.setdefault("GEMINI_API_KEY", "import-time-check")
+env.setdefault("GOOGLE_APPLICATION_CREDENTIALS", "import-time-check")
+env["IMPORT_TIME_BUDGET"] = "inf"  # Report here instead of in api.py
+
+start_time = time.perf_counter()
+result = subprocess.run(
+  [sys.executable, "-X", "importtime", "-c", "import api"],
+  cwd=os.path.dirname(os.path.abspath(__file__)),
+  env=env,
+  capture_output=True,
+  text=True,
+)
+elapsed = time.perf_counter() - start_time
+
+if result.returncode != 0:
+  print(result.stderr)
+  sys.exit("Importing api.py failed.")
+
+# -X importtime lines look like: "import time:  self [us] | cumulative | imported package"
+modules = []
+for line in result.stderr.splitlines():
+  parts = line.split("|")
+  if line.startswith("import time:") and len(parts) == 3 and parts[1].strip().isdigit():
+    modules.append((int(parts[1]), parts[2].rstrip()))
+
+# Nesting is shown by indentation, modules imported directly by api.py are indented by 3 spaces.
+direct_imports = [(cumulative_us, name) for cumulative_us, name in modules if len(name) - len(name.lstrip()) == 3]
+print("Slowest imports of api.py (cumulative):")
+for cumulative_us, name in sorted(direct_imports, reverse=True)[:SLOWEST_SHOWN]:
+  print(f"  {cumulative_us / 1e6:6.3f} s {name.strip()}")
+
+print(f"\nImporting api.py took {elapsed:.2f} seconds (including interpreter startup), budget is {IMPORT_TIME_BUDGET:.2f} seconds.")
+if elapsed > IMPORT_TIME_BUDGET:
+  sys.exit("Import-time budget exceeded! Move heavy imports into initialize() or the function that needs them.")
@@ -0,0 +1,422 @@
+"""
+Durable, bounded LangGraph checkpointer for conversation threads, stored in a local SQLite file.
+
+MemorySaver keeps every checkpoint of every thread in process memory, and each checkpoint holds a full
+copy of the message history (including large tool outputs). This checkpointer instead:
+  - stores only the channels that changed in a checkpoint (like the official savers), and stores list
+    channels such as "messages" as a list of content hashes, with each message saved once per thread.
+    A new checkpoint therefore only adds the new messages, not a snapshot of the whole history;
+  - keeps the last few checkpoints of each thread and deletes older ones when compact() runs;
+  - trims the oldest turns of a thread whose stored size is over a cap. Only turns that the running summary
+    of the conversation (conversation_history.py) already covers are dropped, and the last message it
+    covers is kept, so the summary still knows where it ends;
+  - deletes threads that have been idle for longer than a TTL.
+
+api.py runs compact() periodically. To compact manually:
+    python checkpoint_store.py conversations.sqlite
+"""
+
+import asyncio
+import hashlib
+import json
+import random
+import sqlite3
+import sys
+import threading
+import time
+
+from langgraph.checkpoint.base import WRITES_IDX_MAP, BaseCheckpointSaver, CheckpointTuple, get_checkpoint_id, get_checkpoint_metadata
+
+ITEMS_TYPE = "items"  # Blob type of a list channel stored as a JSON list of item hashes
+
+
+class SqliteCheckpointSaver(BaseCheckpointSaver[str]):
+    def __init__(self, path: str, max_checkpoints: int = 10, max_thread_bytes: int = 2 * 1024 * 1024, idle_ttl: float = 7 * 24 * 3600, min_idle: float = 60,
+                 summary_channel: str = "history_summary", serde=None):
+        super().__init__(serde=serde)
+        self.path = path
+        self.max_checkpoints = max_checkpoints  # Checkpoints kept per thread and namespace, older ones are only needed for time travel
+        self.max_thread_bytes = max_thread_bytes  # Stored size above which the oldest turns of a thread are dropped
+        self.idle_ttl = idle_ttl  # Seconds after the last turn until a thread is deleted
+        self.min_idle = min_idle  # Threads are only compacted when they have been idle this long, so a running turn is never touched
+        self.summary_channel = summary_channel  # {"text": ..., "until": message ID}, trimming stops at the "until" message
+        self.last_compaction = None
+        self._lock = threading.Lock()  # One connection, shared by the event loop and worker threads
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA auto_vacuum = INCREMENTAL")  # Only takes effect when the file is created
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL,
+                checkpoint_id TEXT NOT NULL,
+                parent_checkpoint_id TEXT,
+                type TEXT NOT NULL,
+                checkpoint BLOB NOT NULL,
+                metadata_type TEXT NOT NULL,
+                metadata BLOB NOT NULL,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+            );
+            CREATE TABLE IF NOT EXISTS blobs (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL,
+                channel TEXT NOT NULL,
+                version TEXT NOT NULL,
+                type TEXT NOT NULL,
+                value BLOB,
+                PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+            );
+            CREATE TABLE IF NOT EXISTS items (
+                thread_id TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                type TEXT NOT NULL,
+                value BLOB NOT NULL,
+                PRIMARY KEY (thread_id, hash)
+            );
+            CREATE TABLE IF NOT EXISTS writes (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL,
+                checkpoint_id TEXT NOT NULL,
+                task_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                channel TEXT NOT NULL,
+                type TEXT NOT NULL,
+                value BLOB,
+                task_path TEXT NOT NULL,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+            );
+            CREATE TABLE IF NOT EXISTS threads (
+                thread_id TEXT PRIMARY KEY,
+                last_access REAL NOT NULL
+            );
+        """)
+        self._conn.commit()
+
+    # Serialization of channel values. List items are stored once per thread, keyed by their hash.
+
+    def _dump_value(self, thread_id: str, value) -> tuple[str, bytes, list]:
+        """Returns (type, blob, new item rows) for a channel value."""
+        if not isinstance(value, list):
+            type_, blob = self.serde.dumps_typed(value)
+            return type_, blob, []
+        hashes, rows = [], []
+        for item in value:
+            type_, blob = self.serde.dumps_typed(item)
+            item_hash = hashlib.sha256(type_.encode() + b"\0" + blob).hexdigest()[:32]
+            hashes.append(item_hash)
+            rows.append((thread_id, item_hash, type_, blob))
+        return ITEMS_TYPE, json.dumps(hashes).encode(), rows
+
+    def _load_value(self, thread_id: str, type_: str, blob: bytes):
+        if type_ != ITEMS_TYPE:
+            return self.serde.loads_typed((type_, blob))
+        hashes = json.loads(blob)
+        items = {}
+        for i in range(0, len(hashes), 500):
+            part = hashes[i:i + 500]
+            rows = self._conn.execute(
+                f"SELECT hash, type, value FROM items WHERE thread_id = ? AND hash IN ({','.join('?' * len(part))})",
+                [thread_id, *part],
+            ).fetchall()
+            items.update((item_hash, (item_type, value)) for item_hash, item_type, value in rows)
+        return [self.serde.loads_typed(items[item_hash]) for item_hash in hashes if item_hash in items]
+
+    def _tuple_from_row(self, row) -> CheckpointTuple:
+        thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type_, checkpoint_blob, metadata_type, metadata_blob = row
+        checkpoint = self.serde.loads_typed((type_, checkpoint_blob))
+        channel_values = {}
+        for channel, version in checkpoint["channel_versions"].items():
+            blob_row = self._conn.execute(
+                "SELECT type, value FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                (thread_id, checkpoint_ns, channel, str(version)),
+            ).fetchone()
+            if blob_row and blob_row[0] != "empty":
+                channel_values[channel] = self._load_value(thread_id, *blob_row)
+        writes = self._conn.execute(
+            "SELECT task_id, channel, type, value FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint={**checkpoint, "channel_values": channel_values},
+            metadata=self.serde.loads_typed((metadata_type, metadata_blob)),
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_checkpoint_id}}
+                if parent_checkpoint_id
+                else None
+            ),
+            pending_writes=[(task_id, channel, self.serde.loads_typed((write_type, value))) for task_id, channel, write_type, value in writes],
+        )
+
+    # BaseCheckpointSaver interface
+
+    def get_tuple(self, config) -> CheckpointTuple | None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        columns = "thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata"
+        with self._lock:
+            if checkpoint_id := get_checkpoint_id(config):
+                row = self._conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = self._conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+            return self._tuple_from_row(row) if row else None
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        query = "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata FROM checkpoints"
+        conditions, parameters = [], []
+        if config:
+            conditions.append("thread_id = ?")
+            parameters.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                conditions.append("checkpoint_ns = ?")
+                parameters.append(config["configurable"]["checkpoint_ns"])
+            if checkpoint_id := get_checkpoint_id(config):
+                conditions.append("checkpoint_id = ?")
+                parameters.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            conditions.append("checkpoint_id < ?")
+            parameters.append(before_id)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY checkpoint_id DESC"
+
+        with self._lock:
+            rows = self._conn.execute(query, parameters).fetchall()
+        for row in rows:
+            if limit is not None and limit <= 0:
+                break
+            metadata = self.serde.loads_typed((row[6], row[7]))
+            if filter and not all(metadata.get(key) == value for key, value in filter.items()):
+                continue
+            if limit is not None:
+                limit -= 1
+            with self._lock:
+                checkpoint_tuple = self._tuple_from_row(row)
+            yield checkpoint_tuple
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        checkpoint = checkpoint.copy()
+        values = checkpoint.pop("channel_values")
+        blob_rows, item_rows = [], []
+        for channel, version in new_versions.items():
+            if channel in values:
+                type_, blob, rows = self._dump_value(thread_id, values[channel])
+                item_rows += rows
+            else:
+                type_, blob = "empty", None
+            blob_rows.append((thread_id, checkpoint_ns, channel, str(version), type_, blob))
+        type_, checkpoint_blob = self.serde.dumps_typed(checkpoint)
+        metadata_type, metadata_blob = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO items (thread_id, hash, type, value) VALUES (?, ?, ?, ?)", item_rows)
+            self._conn.executemany("INSERT OR REPLACE INTO blobs (thread_id, checkpoint_ns, channel, version, type, value) VALUES (?, ?, ?, ?, ?, ?)", blob_rows)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"), type_, checkpoint_blob, metadata_type, metadata_blob),
+            )
+            self._conn.execute("INSERT OR REPLACE INTO threads (thread_id, last_access) VALUES (?, ?)", (thread_id, time.time()))
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config, writes, task_id: str, task_path: str = ""):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        regular_rows, special_rows = [], []
+        for idx, (channel, value) in enumerate(writes):
+            type_, blob = self.serde.dumps_typed(value)
+            row = (thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx), channel, type_, blob, task_path)
+            (special_rows if channel in WRITES_IDX_MAP else regular_rows).append(row)
+        columns = "thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value, task_path"
+        # Regular writes are only stored once, special writes (errors, interrupts) replace the previous one.
+        with self._lock, self._conn:
+            self._conn.executemany(f"INSERT OR IGNORE INTO writes ({columns}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", regular_rows)
+            self._conn.executemany(f"INSERT OR REPLACE INTO writes ({columns}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", special_rows)
+
+    def delete_thread(self, thread_id: str):
+        with self._lock, self._conn:
+            self._delete_thread(thread_id)
+
+    def _delete_thread(self, thread_id: str):
+        for table in ("checkpoints", "blobs", "items", "writes", "threads"):
+            self._conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+    def get_next_version(self, current, channel=None) -> str:
+        # Same version format as MemorySaver: a zero-padded counter, so versions sort as strings.
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # SQLite calls take milliseconds, they run on a worker thread so they don't block the event loop.
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        for checkpoint_tuple in await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit))):
+            yield checkpoint_tuple
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id: str, task_path: str = ""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str):
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    # Compaction
+
+    def _load_item(self, thread_id: str, item_hash: str):
+        row = self._conn.execute("SELECT type, value FROM items WHERE thread_id = ? AND hash = ?", (thread_id, item_hash)).fetchone()
+        return self.serde.loads_typed(row) if row else None
+
+    def _summary_anchor(self, thread_id: str, checkpoint_ns: str, channel_versions: dict) -> str | None:
+        """ID of the last message that the running summary of a checkpoint covers, if it has one."""
+        if self.summary_channel not in channel_versions:
+            return None
+        row = self._conn.execute(
+            "SELECT type, value FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+            (thread_id, checkpoint_ns, self.summary_channel, str(channel_versions[self.summary_channel])),
+        ).fetchone()
+        summary = self.serde.loads_typed(row) if row and row[0] not in ("empty", ITEMS_TYPE) else None
+        return summary.get("until") if isinstance(summary, dict) else None
+
+    def _trim_items(self, thread_id: str, hashes: "list[str]", budget: int, anchor: str | None = None) -> "list[str]":  # Quoted, list is a method name in this class
+        """Drop the oldest items until the rest fit in the budget, then drop items until the history starts with a user message.
+
+        If an item has the ID anchor (the last message covered by the summary), it and the items after it are kept, even over the budget:
+        they are not in the summary yet.
+        """
+        sizes = dict(self._conn.execute(
+            "SELECT hash, length(value) FROM items WHERE thread_id = ?", (thread_id,),
+        ).fetchall())
+        keep_from = len(hashes)  # Index of the anchor, items from it on are never dropped
+        if anchor is not None:
+            for index in range(len(hashes) - 1, -1, -1):
+                if getattr(self._load_item(thread_id, hashes[index]), "id", None) == anchor:
+                    keep_from = index
+                    break
+        start, used = len(hashes), 0
+        while start > 0:
+            used += sizes.get(hashes[start - 1], 0)
+            if used > budget and start < len(hashes) and start - 1 < keep_from:
+                break
+            start -= 1
+        # A tool result or an AI message with tool calls can't be the first message of a history. The anchor can be: the
+        # history trimmer only sends the messages after it to the LLM.
+        while start < len(hashes) and start != keep_from and getattr(self._load_item(thread_id, hashes[start]), "type", None) != "human":
+            start += 1
+        return hashes[start:]
+
+    def _compact_thread(self, thread_id: str, stats: dict):
+        for (checkpoint_ns,) in self._conn.execute("SELECT DISTINCT checkpoint_ns FROM checkpoints WHERE thread_id = ?", (thread_id,)).fetchall():
+            ids = [row[0] for row in self._conn.execute(
+                "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC", (thread_id, checkpoint_ns),
+            ).fetchall()]
+            keep = ids[:self.max_checkpoints]
+
+            # Over the size cap: keep only the latest checkpoint and drop the oldest turns of its list channels.
+            size = self._conn.execute(
+                "SELECT (SELECT COALESCE(SUM(length(value)), 0) FROM items WHERE thread_id = ?)"
+                " + (SELECT COALESCE(SUM(length(value)), 0) FROM writes WHERE thread_id = ?)",
+                (thread_id, thread_id),
+            ).fetchone()[0]
+            latest = self.serde.loads_typed(self._conn.execute(
+                "SELECT type, checkpoint FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", (thread_id, checkpoint_ns, ids[0]),
+            ).fetchone())
+            if size > self.max_thread_bytes:
+                keep = ids[:1]
+                anchor = self._summary_anchor(thread_id, checkpoint_ns, latest["channel_versions"])
+                for channel, version in latest["channel_versions"].items():
+                    row = self._conn.execute(
+                        "SELECT type, value FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                        (thread_id, checkpoint_ns, channel, str(version)),
+                    ).fetchone()
+                    if row and row[0] == ITEMS_TYPE:
+                        kept = self._trim_items(thread_id, json.loads(row[1]), self.max_thread_bytes // 2, anchor)
+                        self._conn.execute(
+                            "UPDATE blobs SET value = ? WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                            (json.dumps(kept).encode(), thread_id, checkpoint_ns, channel, str(version)),
+                        )
+                stats["trimmed_threads"] += 1
+
+            removed = ids[len(keep):]
+            for checkpoint_id in removed:
+                self._conn.execute("DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", (thread_id, checkpoint_ns, checkpoint_id))
+                self._conn.execute("DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", (thread_id, checkpoint_ns, checkpoint_id))
+            stats["deleted_checkpoints"] += len(removed)
+
+            # Delete channel values that no remaining checkpoint refers to.
+            referenced = set()
+            for type_, blob in self._conn.execute("SELECT type, checkpoint FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?", (thread_id, checkpoint_ns)).fetchall():
+                referenced.update((channel, str(version)) for channel, version in self.serde.loads_typed((type_, blob))["channel_versions"].items())
+            for channel, version in self._conn.execute("SELECT channel, version FROM blobs WHERE thread_id = ? AND checkpoint_ns = ?", (thread_id, checkpoint_ns)).fetchall():
+                if (channel, version) not in referenced:
+                    self._conn.execute(
+                        "DELETE FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?", (thread_id, checkpoint_ns, channel, version),
+                    )
+
+        # Delete list items that no remaining channel value refers to.
+        referenced_items = set()
+        for (blob,) in self._conn.execute("SELECT value FROM blobs WHERE thread_id = ? AND type = ?", (thread_id, ITEMS_TYPE)).fetchall():
+            referenced_items.update(json.loads(blob))
+        for (item_hash,) in self._conn.execute("SELECT hash FROM items WHERE thread_id = ?", (thread_id,)).fetchall():
+            if item_hash not in referenced_items:
+                self._conn.execute("DELETE FROM items WHERE thread_id = ? AND hash = ?", (thread_id, item_hash))
+                stats["deleted_items"] += 1
+
+    def compact(self, now: float | None = None) -> dict:
+        """Delete idle threads, old checkpoints and unreferenced messages, and trim threads over the size cap."""
+        now = now or time.time()
+        stats = {"evicted_threads": 0, "deleted_checkpoints": 0, "trimmed_threads": 0, "deleted_items": 0}
+        with self._lock:
+            idle_threads = [row[0] for row in self._conn.execute("SELECT thread_id FROM threads WHERE last_access < ?", (now - self.idle_ttl,)).fetchall()]
+            with self._conn:
+                for thread_id in idle_threads:
+                    self._delete_thread(thread_id)
+            stats["evicted_threads"] = len(idle_threads)
+
+            settled_threads = [row[0] for row in self._conn.execute("SELECT thread_id FROM threads WHERE last_access < ?", (now - self.min_idle,)).fetchall()]
+            for thread_id in settled_threads:
+                with self._conn:  # One transaction per thread, so the lock is not held for long in one write
+                    self._compact_thread(thread_id, stats)
+            self._conn.execute("PRAGMA incremental_vacuum")
+        self.last_compaction = {"at": now, **stats}
+        return stats
+
+    def stats(self) -> dict:
+        with self._lock:
+            threads, checkpoints, items = self._conn.execute(
+                "SELECT (SELECT COUNT(*) FROM threads), (SELECT COUNT(*) FROM checkpoints), (SELECT COUNT(*) FROM items)"
+            ).fetchone()
+            page_count = self._conn.execute("PRAGMA page_count").fetchone()[0]
+            page_size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+        return {
+            "threads": threads,
+            "checkpoints": checkpoints,
+            "stored_messages": items,
+            "file_bytes": page_count * page_size,
+            "last_compaction": self.last_compaction,
+        }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("Usage: python checkpoint_store.py <conversations.sqlite>")
+    saver = SqliteCheckpointSaver(sys.argv[1], min_idle=0)
+    print(f"Compaction: {saver.compact()}")
+    print(f"{sys.argv[1]}: {saver.stats()}")
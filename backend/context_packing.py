@@ -0,0 +1,78 @@
+"""
+Token-budgeted packing of retrieved chunks into the context returned by the retrieve tool.
+
+Retrieved chunks are grouped by source, and adjacent chunks of the same source are merged, removing the
+text they repeat because of the splitter's chunk overlap. Each source gets one compact reference line
+(number, title, source, pages) instead of a full metadata dict per chunk. Sources are added in order of
+their best-ranked chunk until the token budget is used up.
+"""
+
+CHARS_PER_TOKEN = 4  # Rough average for Gemini tokenization of English and Finnish text
+MIN_OVERLAP = 20  # Shorter matches between chunk ends are treated as coincidence, not splitter overlap
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def merge_overlapping(first: str, second: str, max_overlap: int) -> str | None:
+    """Join two chunks if the end of the first repeats the start of the second (or one contains the other)."""
+    if second in first:
+        return first
+    if first in second:
+        return second
+    for size in range(min(len(first), len(second), max_overlap), MIN_OVERLAP - 1, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return None
+
+
+def _merge_chunks(texts: list[str], max_overlap: int) -> list[str]:
+    """Merge a source's chunks into as few segments as possible. Chunks that don't overlap stay separate segments."""
+    segments = []
+    for text in texts:
+        text = text.strip()
+        for i, segment in enumerate(segments):
+            merged = merge_overlapping(segment, text, max_overlap) or merge_overlapping(text, segment, max_overlap)
+            if merged is not None:
+                segments[i] = merged
+                break
+        else:
+            segments.append(text)
+    return segments
+
+
+def _reference(number: int, metadata: dict, pages: list) -> str:
+    title = (metadata.get("title") or "").strip()
+    reference = f"[{number}] {title} <{metadata.get('source', 'unknown source')}>" if title else f"[{number}] <{metadata.get('source', 'unknown source')}>"
+    if pages:
+        reference += " pages " + ", ".join(str(page + 1) for page in sorted(set(pages)))  # PyPDFLoader pages are 0-based
+    return reference
+
+
+def pack_context(docs: list, token_budget: int, max_overlap: int = 400) -> str:
+    """Pack ranked chunks (best first) into a compact context string of at most about token_budget tokens."""
+    groups = {}  # source -> chunks, in order of each source's best-ranked chunk
+    for doc in docs:
+        groups.setdefault(doc.metadata.get("source"), []).append(doc)
+
+    parts = []
+    used_tokens = 0
+    for number, chunks in enumerate(groups.values(), start=1):
+        # PDF chunks are put in page order, so consecutive chunks are adjacent and can be merged.
+        chunks = sorted(chunks, key=lambda doc: doc.metadata.get("page", 0))
+        pages = [doc.metadata["page"] for doc in chunks if isinstance(doc.metadata.get("page"), int)]
+        header = _reference(number, chunks[0].metadata, pages)
+        body = "\n[...]\n".join(_merge_chunks([doc.page_content for doc in chunks], max_overlap))
+
+        remaining = token_budget - used_tokens - estimate_tokens(header)
+        if remaining <= 0:
+            break
+        if estimate_tokens(body) > remaining:
+            # Truncate the last source that fits partially, then stop.
+            parts.append(f"{header}\n{body[:remaining * CHARS_PER_TOKEN].rstrip()} [...]")
+            break
+        parts.append(f"{header}\n{body}")
+        used_tokens += estimate_tokens(header) + estimate_tokens(body)
+
+    return "\n\n".join(parts)
@@ -0,0 +1,155 @@
+"""
+Pre-model hook that keeps the prompt of long conversations within a token budget.
+
+The checkpointer keeps the full history of a thread, but the LLM does not need all of it on every call:
+  - tool calls and tool results of earlier turns (SQL results, retrieved chunks, whole documents) are
+    dropped, only the user messages and the final answers of those turns are kept;
+  - the last few turns are sent verbatim, the current turn always with its tool results;
+  - older turns are folded into a running summary, stored in the graph state (so it is checkpointed with
+    the thread) and updated incrementally, a few turns at a time, by one extra LLM call.
+
+Token counts are estimated (see context_packing.estimate_tokens). Each model call prints the estimated
+prompt size next to the size it would have had without trimming, and stats() sums them up.
+"""
+
+import threading
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableLambda
+from langgraph.prebuilt.chat_agent_executor import AgentStateWithStructuredResponse
+from typing_extensions import NotRequired
+
+from context_packing import estimate_tokens
+
+
+class SummarizedAgentState(AgentStateWithStructuredResponse):
+    history_summary: NotRequired[dict]  # {"text": running summary, "until": ID of the last message it covers}
+
+
+def message_tokens(message) -> int:
+    tokens = estimate_tokens(message.content if isinstance(message.content, str) else str(message.content))
+    for tool_call in getattr(message, "tool_calls", None) or []:
+        tokens += estimate_tokens(tool_call["name"] + str(tool_call["args"]))
+    return tokens
+
+
+def turns_tokens(turns: list[list]) -> int:
+    return sum(message_tokens(message) for turn in turns for message in turn)
+
+
+def split_turns(messages: list) -> list[list]:
+    """Split a history into turns, each starting with a user message."""
+    turns = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def compact_turn(turn: list) -> list:
+    """Keep the user messages and the final answer of a finished turn, without its tool calls and tool results."""
+    return [
+        message for message in turn
+        if isinstance(message, HumanMessage) or (isinstance(message, AIMessage) and not message.tool_calls and message.content)
+    ]
+
+
+def _transcript(messages: list) -> str:
+    return "\n".join(f"{'User' if isinstance(message, HumanMessage) else 'Assistant'}: {message.content}" for message in messages)
+
+
+class HistoryTrimmer:
+    def __init__(self, llm, summary_prompt: str, keep_turns: int = 4, token_budget: int = 6000, summarize_every: int = 2, fixed_tokens: int = 0):
+        self.llm = llm  # Writes the running summary
+        self.summary_prompt = summary_prompt
+        self.keep_turns = keep_turns  # Turns sent verbatim (tool results only for the current turn), including the current one
+        self.token_budget = token_budget  # Estimated tokens for the summary and the history sent to the LLM
+        self.summarize_every = summarize_every  # Older turns are folded into the summary in batches of this many, to save LLM calls
+        self.fixed_tokens = fixed_tokens  # Tokens of the system prompt, only used for reporting
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.summaries = 0
+        self.sent_tokens = 0
+        self.full_tokens = 0
+
+    def _plan(self, state: dict):
+        """Returns (summary, older turns not in the summary yet, kept previous turns, current turn)."""
+        messages = state["messages"]
+        summary = state.get("history_summary") or {"text": "", "until": None}
+        ids = [message.id for message in messages]
+        # Compaction (checkpoint_store.py) keeps the "until" message, so it is only missing when there is no summary yet.
+        start = ids.index(summary["until"]) + 1 if summary["until"] in ids else 0
+
+        turns = split_turns(messages[start:])
+        current = turns[-1] if turns else []
+        previous = [compact_turn(turn) for turn in turns[:-1]]
+        kept = previous[-(self.keep_turns - 1):] if self.keep_turns > 1 else []
+        uncovered = previous[:len(previous) - len(kept)]
+
+        # Move the oldest kept turns to the ones to summarize as long as the history is over the budget.
+        while kept and estimate_tokens(summary["text"]) + turns_tokens(uncovered + kept + [current]) > self.token_budget:
+            uncovered.append(kept.pop(0))
+        return summary, uncovered, kept, current
+
+    def _result(self, state: dict, summary: dict, uncovered: list, kept: list, current: list, updated: bool) -> dict:
+        llm_input = [SystemMessage(content=f"Summary of the earlier conversation:\n{summary['text']}")] if summary["text"] else []
+        llm_input += [message for turn in uncovered + kept for message in turn] + current
+
+        sent = self.fixed_tokens + sum(message_tokens(message) for message in llm_input)
+        full = self.fixed_tokens + sum(message_tokens(message) for message in state["messages"])
+        with self._lock:
+            self.calls += 1
+            self.sent_tokens += sent
+            self.full_tokens += full
+        print(f"History: ~{sent} prompt tokens (~{full} without trimming), {len(llm_input)} of {len(state['messages'])} messages.")
+
+        result = {"llm_input_messages": llm_input}
+        if updated:
+            result["history_summary"] = summary
+        return result
+
+    def _summary_request(self, summary: dict, uncovered: list) -> tuple[list, list]:
+        new_messages = [message for turn in uncovered for message in turn]
+        request = f"Current summary:\n{summary['text'] or '(none)'}\n\nNew conversation turns:\n{_transcript(new_messages)}"
+        return [SystemMessage(content=self.summary_prompt), HumanMessage(content=request)], new_messages
+
+    def _should_summarize(self, summary: dict, uncovered: list, kept: list, current: list) -> bool:
+        if not uncovered:
+            return False
+        over_budget = estimate_tokens(summary["text"]) + turns_tokens(uncovered + kept + [current]) > self.token_budget
+        return over_budget or len(uncovered) >= self.summarize_every
+
+    def _updated_summary(self, text: str, new_messages: list) -> dict:
+        with self._lock:
+            self.summaries += 1
+        return {"text": text.strip(), "until": new_messages[-1].id if new_messages else None}
+
+    def trim(self, state: dict) -> dict:
+        summary, uncovered, kept, current = self._plan(state)
+        if not self._should_summarize(summary, uncovered, kept, current):
+            return self._result(state, summary, uncovered, kept, current, updated=False)
+        request, new_messages = self._summary_request(summary, uncovered)
+        summary = self._updated_summary(self.llm.invoke(request).content, new_messages)
+        return self._result(state, summary, [], kept, current, updated=True)
+
+    async def atrim(self, state: dict) -> dict:
+        summary, uncovered, kept, current = self._plan(state)
+        if not self._should_summarize(summary, uncovered, kept, current):
+            return self._result(state, summary, uncovered, kept, current, updated=False)
+        request, new_messages = self._summary_request(summary, uncovered)
+        summary = self._updated_summary((await self.llm.ainvoke(request)).content, new_messages)
+        return self._result(state, summary, [], kept, current, updated=True)
+
+    def as_hook(self):
+        """The pre_model_hook for create_react_agent, usable with both invoke/stream and ainvoke/astream."""
+        return RunnableLambda(self.trim, afunc=self.atrim, name="trim_history")
+
+    def stats(self) -> dict:
+        return {
+            "model_calls": self.calls,
+            "summaries": self.summaries,
+            "prompt_tokens": self.sent_tokens,
+            "prompt_tokens_without_trimming": self.full_tokens,
+            "saved_fraction": round(1 - self.sent_tokens / self.full_tokens, 3) if self.full_tokens else 0.0,
+        }
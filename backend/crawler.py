@@ -0,0 +1,168 @@
+"""
+Async web crawler with per-host concurrency limits, connection pooling and an on-disk response cache.
+
+Every fetched page is cached on disk together with its ETag and Last-Modified headers. On a re-crawl
+these are sent back as If-None-Match / If-Modified-Since, so pages that have not changed are answered
+with a bodyless 304 and served from the cache. Only changed pages are downloaded again.
+
+Try it against a local server that serves fixture pages (http.server supports If-Modified-Since):
+    python -m http.server 8001 --directory <fixture dir>
+    python crawler.py http://localhost:8001/page1.html http://localhost:8001/page2.html
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from dataclasses import dataclass
+from urllib.parse import urlparse
+
+import aiohttp
+from bs4 import BeautifulSoup
+from langchain_core.documents import Document
+
+CACHE_DIR = "./crawl_cache"
+PER_HOST_LIMIT = 4  # Concurrent requests per host. Be polite to nordea.fi!
+TOTAL_LIMIT = 32  # Concurrent requests in total (size of the connection pool)
+MAX_RETRIES = 3
+USER_AGENT = "smart-bank-chatbot-crawler"
+
+
+@dataclass
+class CrawlResult:
+    url: str
+    html: str
+    changed: bool  # False when the server answered 304 Not Modified and the cached copy was used
+    status: int
+
+
+class ResponseCache:
+    """On-disk cache of page bodies and their validators (ETag, Last-Modified), one pair of files per URL."""
+
+    def __init__(self, cache_dir: str = CACHE_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _paths(self, url: str):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, key + ".json"), os.path.join(self.cache_dir, key + ".body")
+
+    def get(self, url: str):
+        """Return (metadata, body) of the cached response, or (None, None) if the URL is not cached."""
+        meta_path, body_path = self._paths(url)
+        if not (os.path.exists(meta_path) and os.path.exists(body_path)):
+            return None, None
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(body_path, "rb") as f:
+            return meta, f.read()
+
+    def put(self, url: str, headers, body: bytes, charset: str):
+        meta_path, body_path = self._paths(url)
+        meta = {
+            "url": url,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "charset": charset,
+            "fetched_at": time.time(),
+        }
+        # Body first, so a crash in between never leaves metadata pointing at a missing body.
+        with open(body_path, "wb") as f:
+            f.write(body)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+
+def _conditional_headers(meta) -> dict:
+    headers = {}
+    if meta:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+    return headers
+
+
+async def _fetch(session, url: str, cache: ResponseCache, host_limits: dict) -> CrawlResult:
+    meta, cached_body = cache.get(url)
+    headers = _conditional_headers(meta)
+    host = urlparse(url).netloc
+
+    for attempt in range(MAX_RETRIES + 1):
+        async with host_limits[host]:
+            async with session.get(url, headers=headers) as response:
+                if response.status == 304 and cached_body is not None:
+                    return CrawlResult(url, cached_body.decode(meta.get("charset") or "utf-8", errors="replace"), False, 304)
+                if response.status == 429 or response.status >= 500:
+                    retry_after = response.headers.get("Retry-After", "")
+                    delay = float(retry_after) if retry_after.isdigit() else 2 ** attempt * (1 + random.random())
+                else:
+                    response.raise_for_status()
+                    body = await response.read()
+                    charset = response.charset or "utf-8"
+                    cache.put(url, response.headers, body, charset)
+                    return CrawlResult(url, body.decode(charset, errors="replace"), True, response.status)
+        if attempt == MAX_RETRIES:
+            response.raise_for_status()
+        # Back off outside the host slot, so other requests to the host can proceed meanwhile.
+        await asyncio.sleep(delay)
+
+
+async def crawl(
+    urls: list[str],
+    cache_dir: str = CACHE_DIR,
+    per_host_limit: int = PER_HOST_LIMIT,
+    total_limit: int = TOTAL_LIMIT,
+    timeout: float = 30,
+) -> list[CrawlResult]:
+    """Fetch all URLs concurrently. Failed URLs are reported and left out of the results."""
+    cache = ResponseCache(cache_dir)
+    host_limits = {host: asyncio.Semaphore(per_host_limit) for host in {urlparse(url).netloc for url in urls}}
+    connector = aiohttp.TCPConnector(limit=total_limit, limit_per_host=per_host_limit)
+    async with aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=timeout),
+        headers={"User-Agent": USER_AGENT},
+    ) as session:
+        results = await asyncio.gather(*(_fetch(session, url, cache, host_limits) for url in urls), return_exceptions=True)
+
+    crawled = []
+    for url, result in zip(urls, results):
+        if isinstance(result, Exception):
+            print(f"Failed to fetch {url}: {result}")
+        else:
+            crawled.append(result)
+    return crawled
+
+
+def crawl_sync(urls: list[str], **kwargs) -> list[CrawlResult]:
+    return asyncio.run(crawl(urls, **kwargs))
+
+
+def html_to_document(url: str, html: str) -> Document:
+    """Parse a page into a Document with the same content and metadata as WebBaseLoader produces."""
+    soup = BeautifulSoup(html, "html.parser")
+    metadata = {"source": url}
+    if title := soup.find("title"):
+        metadata["title"] = title.get_text()
+    if description := soup.find("meta", attrs={"name": "description"}):
+        metadata["description"] = description.get("content", "No description found.")
+    if html_tag := soup.find("html"):
+        metadata["language"] = html_tag.get("lang", "No language found.")
+    return Document(page_content=soup.get_text(), metadata=metadata)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crawl URLs into the on-disk response cache.")
+    parser.add_argument("urls", nargs="+")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--per-host-limit", type=int, default=PER_HOST_LIMIT)
+    args = parser.parse_args()
+
+    start_time = time.time()
+    results = crawl_sync(args.urls, cache_dir=args.cache_dir, per_host_limit=args.per_host_limit)
+    changed = sum(result.changed for result in results)
+    print(f"Fetched {len(results)} pages in {time.time() - start_time:.2f} seconds: {changed} downloaded, {len(results) - changed} not modified.")
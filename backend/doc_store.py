@@ -0,0 +1,157 @@
+"""
+Compact, indexed on-disk document store for list_documents and read_document.
+
+Documents are kept in a SQLite file (memory-mapped for reads) instead of in process memory,
+so startup time and resident memory stay flat as the corpus grows: only the catalog columns are
+read for list_documents, and full page contents are fetched lazily by source for read_document.
+
+docs*.json files stay the human-editable source of truth. They are imported with import_json(),
+which is a no-op when the file hasn't changed since the last import. To import manually:
+    python doc_store.py docs_en.json docs_en.sqlite
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+
+from langchain_core.documents import Document
+
+from ingest_pipeline import iter_json_array
+
+MMAP_SIZE = 256 * 1024 * 1024  # Upper bound of the memory-mapped region, the OS only pages in what is read.
+
+
+class DocumentStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()  # One connection per thread, FastAPI runs sync tools on a thread pool.
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                source TEXT PRIMARY KEY,
+                title TEXT,
+                description TEXT,
+                kind TEXT NOT NULL,
+                position INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS pages (
+                source TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                page_content TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                PRIMARY KEY (source, page)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS imports (
+                kind TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL
+            );
+        """)
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+            conn.execute("PRAGMA journal_mode = WAL")  # Readers are not blocked while documents are imported
+            self._local.conn = conn
+        return conn
+
+    def _next_position(self, conn) -> int:
+        return conn.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM documents").fetchone()[0]
+
+    def _put(self, conn, source: str, title, description, kind: str, pages: list[Document], position: int):
+        conn.execute("DELETE FROM pages WHERE source = ?", (source,))
+        conn.execute(
+            "INSERT OR REPLACE INTO documents (source, title, description, kind, position) VALUES (?, ?, ?, ?, ?)",
+            (source, title, description, kind, position),
+        )
+        conn.executemany(
+            "INSERT INTO pages (source, page, page_content, metadata) VALUES (?, ?, ?, ?)",
+            [(source, i, page.page_content, json.dumps(page.metadata, ensure_ascii=False)) for i, page in enumerate(pages)],
+        )
+
+    def put_document(self, source: str, title, description, kind: str, pages: list[Document]):
+        """Insert or replace a document (a web page has one page, a PDF has one per PDF page)."""
+        conn = self._conn()
+        with conn:
+            row = conn.execute("SELECT position FROM documents WHERE source = ?", (source,)).fetchone()
+            self._put(conn, source, title, description, kind, pages, row[0] if row else self._next_position(conn))
+
+    def set_description(self, source: str, description: str):
+        with self._conn() as conn:
+            conn.execute("UPDATE documents SET description = ? WHERE source = ?", (description, source))
+
+    def delete_missing(self, kind: str, keep_sources):
+        """Delete all documents of a kind whose source is not in keep_sources."""
+        keep_sources = set(keep_sources)
+        conn = self._conn()
+        with conn:
+            stale = [source for (source,) in conn.execute("SELECT source FROM documents WHERE kind = ?", (kind,)) if source not in keep_sources]
+            conn.executemany("DELETE FROM pages WHERE source = ?", [(source,) for source in stale])
+            conn.executemany("DELETE FROM documents WHERE source = ?", [(source,) for source in stale])
+
+    def import_json(self, json_path: str, kind: str = "web") -> bool:
+        """
+        Replace all documents of a kind with the contents of a docs*.json file, streaming it item by item.
+        Skipped (returns False) if the file hasn't changed since the last import.
+        """
+        file_stat = os.stat(json_path)
+        fingerprint = f"{os.path.abspath(json_path)}:{file_stat.st_size}:{file_stat.st_mtime_ns}"
+        conn = self._conn()
+        row = conn.execute("SELECT fingerprint FROM imports WHERE kind = ?", (kind,)).fetchone()
+        if row and row[0] == fingerprint:
+            return False
+
+        with conn:
+            conn.execute("DELETE FROM pages WHERE source IN (SELECT source FROM documents WHERE kind = ?)", (kind,))
+            conn.execute("DELETE FROM documents WHERE kind = ?", (kind,))
+            position = self._next_position(conn)
+            for item in iter_json_array(json_path):
+                doc = Document(**item)
+                self._put(
+                    conn,
+                    doc.metadata["source"],
+                    doc.metadata.get("title"),
+                    doc.metadata.get("description", "No description available."),
+                    kind,
+                    [doc],
+                    position,
+                )
+                position += 1
+            conn.execute("INSERT OR REPLACE INTO imports (kind, fingerprint) VALUES (?, ?)", (kind, fingerprint))
+        return True
+
+    def sources(self, kind: str = None) -> set:
+        query, params = ("SELECT source FROM documents WHERE kind = ?", (kind,)) if kind else ("SELECT source FROM documents", ())
+        return {source for (source,) in self._conn().execute(query, params)}
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def catalog(self):
+        """Yield the title, description and source of every document, without reading their contents."""
+        for title, description, source in self._conn().execute("SELECT title, description, source FROM documents ORDER BY position"):
+            yield {"title": title, "description": description, "source": source}
+
+    def get(self, source: str):
+        """Return the Document (web page), the list of page Documents (PDF), or None if the source is unknown."""
+        conn = self._conn()
+        row = conn.execute("SELECT kind FROM documents WHERE source = ?", (source,)).fetchone()
+        if not row:
+            return None
+        pages = [
+            Document(page_content=page_content, metadata=json.loads(metadata))
+            for page_content, metadata in conn.execute("SELECT page_content, metadata FROM pages WHERE source = ? ORDER BY page", (source,))
+        ]
+        return pages if row[0] == "pdf" else pages[0]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("Usage: python doc_store.py <docs.json> <store.sqlite>")
+    store = DocumentStore(sys.argv[2])
+    store.import_json(sys.argv[1])
+    print(f"{sys.argv[2]} contains {store.count()} documents.")
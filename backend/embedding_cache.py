@@ -0,0 +1,111 @@
+"""
+Content-addressed embedding cache shared by all ingestion paths (api.py, document_loader.py, save_docs_to_vectors.py).
+
+Embeddings are stored in a local SQLite file, keyed by (model name, task, SHA-256 of the chunk text).
+Only chunks that are not in the cache yet are sent to the embedding provider, so rebuilding a vector
+store after editing a few documents only costs embedding calls for the chunks that actually changed.
+"""
+
+import hashlib
+import sqlite3
+import threading
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_MODEL = "models/embedding-001"
+EMBEDDING_CACHE_PATH = "embedding_cache.sqlite"
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an Embeddings provider with a persistent SQLite cache and hit/miss counters."""
+
+    def __init__(self, underlying: Embeddings, model_name: str, cache_path: str = EMBEDDING_CACHE_PATH):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()  # One connection is shared by the ingestion worker threads.
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, task TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, task, text_hash))"
+        )
+        self._conn.commit()
+
+    def _lookup(self, task: str, hashes: list[str]) -> dict:
+        found = {}
+        with self._lock:
+            # Query in slices to stay below SQLite's host parameter limit.
+            for i in range(0, len(hashes), 500):
+                part = hashes[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND task = ? AND text_hash IN ({','.join('?' * len(part))})",
+                    [self.model_name, task, *part],
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+        return found
+
+    def _store(self, task: str, vectors_by_hash: dict):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, task, text_hash, vector) VALUES (?, ?, ?, ?)",
+                [(self.model_name, task, key, array("f", vector).tobytes()) for key, vector in vectors_by_hash.items()],
+            )
+            self._conn.commit()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        hashes = [text_hash(text) for text in texts]
+        cached = self._lookup("document", list(set(hashes)))
+
+        # Embed each missing text only once, even if it occurs several times in the batch.
+        missing = {}
+        for key, text in zip(hashes, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            # Round to float32 like the stored copies, so results don't depend on whether they came from the cache.
+            new_vectors = {key: array("f", vector).tolist() for key, vector in zip(missing.keys(), vectors)}
+            self._store("document", new_vectors)
+            cached.update(new_vectors)
+
+        with self._lock:
+            self.misses += len(missing)
+            self.hits += len(texts) - len(missing)
+        return [cached[key] for key in hashes]
+
+    def embed_query(self, text: str) -> list[float]:
+        # Queries are embedded with a different task type than documents, so they are cached separately.
+        key = text_hash(text)
+        cached = self._lookup("query", [key])
+        if key in cached:
+            with self._lock:
+                self.hits += 1
+            return cached[key]
+        vector = array("f", self.underlying.embed_query(text)).tolist()
+        self._store("query", {key: vector})
+        with self._lock:
+            self.misses += 1
+        return vector
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+def get_embeddings(cache_path: str = EMBEDDING_CACHE_PATH) -> CachedEmbeddings:
+    """Gemini embeddings behind the shared local cache. Needs GOOGLE_APPLICATION_CREDENTIALS or an API key."""
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+    return CachedEmbeddings(GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL), EMBEDDING_MODEL, cache_path)
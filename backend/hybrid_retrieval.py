@@ -0,0 +1,140 @@
+"""
+Hybrid retrieval: a local BM25 keyword index fused with the vector store's similarity search.
+
+Embeddings are good at meaning but miss exact terms such as product names ("ASP-laina"), fee codes
+and IBAN-like tokens. The BM25 index is built from the same chunks as the vector store and catches
+those. The two rankings are merged with reciprocal rank fusion (RRF), so a smaller number of chunks
+reaches the same recall as a large vector-only k.
+"""
+
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+
+STEM_LENGTH = 5  # Finnish inflects heavily ("laina", "lainan", "lainaa"), so longer words also get a prefix token.
+RRF_K = 60  # Rank offset of reciprocal rank fusion, 60 is the value from the original RRF paper.
+
+STOPWORDS = {
+    # English
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how", "i", "in", "is",
+    "it", "my", "of", "on", "or", "that", "the", "this", "to", "was", "what", "when", "where", "which", "who",
+    "will", "with", "you", "your",
+    # Finnish
+    "ja", "on", "ei", "se", "että", "oli", "ovat", "kun", "mitä", "mikä", "miten", "jos", "voi", "tai", "sekä",
+    "myös", "kuin", "ole", "olla", "minun", "mun", "sinun", "hän", "me", "te", "he", "tämä", "tuo", "nyt",
+}
+
+TOKEN_PATTERN = re.compile(r"\w+(?:[-']\w+)*", re.UNICODE)
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased word tokens for English and Finnish text, keeping hyphenated terms and codes intact."""
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(unicodedata.normalize("NFKC", text).lower()):
+        token = match.group()
+        if token in STOPWORDS:
+            continue
+        words = [token]
+        if "-" in token:
+            # "asp-laina" also matches "asp" and "laina"
+            words.extend(part for part in token.split("-") if part and part not in STOPWORDS)
+        for word in words:
+            tokens.append(word)
+            if word.isalpha() and len(word) >= STEM_LENGTH:
+                tokens.append(word[:STEM_LENGTH] + "*")
+    return tokens
+
+
+class BM25Index:
+    """In-memory inverted index over chunk texts. Only the postings and chunk IDs are kept, not the texts."""
+
+    def __init__(self, ids: list[str], texts: list[str], k1: float = 1.5, b: float = 0.75):
+        self.ids = ids
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)  # term -> [(chunk index, term frequency)]
+        self.lengths = []
+        for index, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            self.lengths.append(sum(counts.values()))
+            for term, frequency in counts.items():
+                self.postings[term].append((index, frequency))
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+
+    def search(self, query: str, k: int) -> list[tuple[str, float]]:
+        """Return up to k (chunk ID, score) pairs, best first."""
+        scores = defaultdict(float)
+        n = len(self.ids)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for index, frequency in postings:
+                norm = 1 - self.b + self.b * self.lengths[index] / self.average_length
+                scores[index] += idf * frequency * (self.k1 + 1) / (frequency + self.k1 * norm)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.ids[index], score) for index, score in best]
+
+
+def reciprocal_rank_fusion(rankings: list[list], k: int = RRF_K) -> list:
+    """Merge several rankings of keys into one: each key scores sum(1 / (k + rank)) over the rankings it appears in."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            scores[key] += 1 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def _doc_key(doc) -> tuple:
+    # LangChain's Chroma search results don't carry chunk IDs, so chunks are matched by source and content.
+    return doc.metadata.get("source"), doc.page_content
+
+
+class HybridRetriever:
+    """Vector similarity search + BM25 over the chunks of a LangChain Chroma store, fused with RRF."""
+
+    def __init__(self, vector_store, candidates: int = 20):
+        self.vector_store = vector_store
+        self.candidates = candidates  # Chunks taken from each retriever before fusion
+        self._index = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """(Re)build the BM25 index from all chunks currently in the vector store."""
+        data = self.vector_store.get(include=["documents"])
+        index = BM25Index(data["ids"], data["documents"])
+        with self._lock:
+            self._index = index
+        print(f"BM25 index built over {len(index.ids)} chunks.")
+
+    def _keyword_search(self, query: str) -> list:
+        from langchain_core.documents import Document
+
+        if self._index is None:
+            self.refresh()
+        hits = self._index.search(query, self.candidates)
+        if not hits:
+            return []
+        data = self.vector_store.get(ids=[id for id, _ in hits], include=["documents", "metadatas"])
+        docs_by_id = {
+            id: Document(page_content=text, metadata=metadata or {})
+            for id, text, metadata in zip(data["ids"], data["documents"], data["metadatas"])
+        }
+        return [docs_by_id[id] for id, _ in hits if id in docs_by_id]
+
+    def search(self, query: str, k: int, embedding: list[float] = None) -> list:
+        """Return the k best chunks. Pass the query embedding if it is already known, to skip embedding the query again."""
+        if embedding is not None:
+            vector_docs = self.vector_store.similarity_search_by_vector(embedding, k=self.candidates)
+        else:
+            vector_docs = self.vector_store.similarity_search(query, k=self.candidates)
+        keyword_docs = self._keyword_search(query)
+
+        docs_by_key = {}
+        for doc in vector_docs + keyword_docs:
+            docs_by_key.setdefault(_doc_key(doc), doc)
+        fused = reciprocal_rank_fusion([[_doc_key(doc) for doc in vector_docs], [_doc_key(doc) for doc in keyword_docs]])
+        return [docs_by_key[key] for key in fused[:k]]
@@ -0,0 +1,31 @@
+"""
+Version stamp of a persistent vector store, for invalidating caches of retrieval results and answers.
+
+Every script that changes the chunks in a Chroma DB directory calls bump_index_version(), which writes
+a new random version into a small file in that directory. Readers (also in other processes) compare the
+version with the one their cached entries were computed against.
+"""
+
+import os
+import uuid
+
+VERSION_FILE = "index_version"
+
+
+def read_index_version(persist_dir: str) -> str:
+    try:
+        with open(os.path.join(persist_dir, VERSION_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return "initial"
+
+
+def bump_index_version(persist_dir: str) -> str:
+    version = uuid.uuid4().hex
+    os.makedirs(persist_dir, exist_ok=True)
+    path = os.path.join(persist_dir, VERSION_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_path, path)
+    return version
@@ -0,0 +1,218 @@
+"""
+Streaming ingestion pipeline: documents -> chunks -> embeddings -> vector store.
+
+Documents are read lazily from a JSON array file and split one at a time. Chunks are grouped into
+batches that are embedded on a bounded thread pool, with a token bucket limiting the request rate
+to the embedding provider and exponential backoff on failures. Each batch is written to the store
+as soon as it is embedded, and completed batches are recorded in a checkpoint file, so a run that
+dies halfway can be resumed without embedding the finished batches again.
+"""
+
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+
+def iter_json_array(path: str, read_size: int = 1 << 16):
+    """Yield the items of a top-level JSON array one by one, without loading the whole file into memory."""
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = f.read(read_size).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"{path} does not contain a JSON array.")
+        buffer = buffer[1:]
+        eof = False
+        while True:
+            buffer = buffer.lstrip().lstrip(",").lstrip()
+            if buffer.startswith("]"):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # The next item is not complete yet, read more.
+                more = f.read(read_size)
+                eof = not more
+                buffer += more
+                continue
+            yield item
+            buffer = buffer[end:]
+
+
+def chunk_id(source: str, index: int, text: str) -> str:
+    """Stable chunk ID, so re-running the pipeline upserts chunks in place instead of duplicating them."""
+    return f"doc:{source}:{index}:{hashlib.sha256(text.encode('utf-8')).hexdigest()[:12]}"
+
+
+def iter_chunks(docs, text_splitter):
+    """Split documents one at a time and yield (chunk ID, chunk Document) pairs."""
+    for doc in docs:
+        if isinstance(doc, dict):
+            doc = Document(**doc)
+        source = doc.metadata.get("source", "")
+        for index, chunk in enumerate(text_splitter.split_documents([doc])):
+            yield chunk_id(source, index, chunk.page_content), chunk
+
+
+def batched(iterable, size: int):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class TokenBucket:
+    """Thread-safe token bucket: allows `rate` acquisitions per second on average, with bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait_time = (tokens - self._tokens) / self.rate
+            time.sleep(wait_time)
+
+
+class RateLimitedEmbeddings(Embeddings):
+    """Wraps an embedding provider with a token bucket (one token per request) and retries with exponential backoff."""
+
+    def __init__(self, underlying: Embeddings, bucket: TokenBucket, max_retries: int = 5, base_delay: float = 1.0):
+        self.underlying = underlying
+        self.bucket = bucket
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.retries = 0
+
+    def _call(self, fn, *args):
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                return fn(*args)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                delay = self.base_delay * 2 ** attempt * (1 + random.random())  # Jitter, so the workers don't retry in lockstep
+                print(f"Embedding request failed ({e!r}), retrying in {delay:.1f} seconds.")
+                time.sleep(delay)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._call(self.underlying.embed_documents, texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._call(self.underlying.embed_query, text)
+
+
+def chroma_batch_writer(vector_store):
+    """Write already-embedded batches to a LangChain Chroma store, without embedding them a second time."""
+    def write_batch(ids, chunks, vectors):
+        vector_store._collection.upsert(
+            ids=ids,
+            embeddings=vectors,
+            documents=[chunk.page_content for chunk in chunks],
+            metadatas=[chunk.metadata or None for chunk in chunks],
+        )
+    return write_batch
+
+
+def _load_checkpoint(path: str, fingerprint: dict) -> set:
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("fingerprint") == fingerprint:
+            return set(checkpoint["done"])
+        print("Input or settings changed since the checkpoint was written, starting from the beginning.")
+    return set()
+
+
+def _save_checkpoint(path: str, fingerprint: dict, done: set):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"fingerprint": fingerprint, "done": sorted(done)}, f)
+    os.replace(tmp_path, path)
+
+
+def run_pipeline(
+    docs,
+    text_splitter,
+    embeddings: Embeddings,
+    write_batch,
+    batch_size: int = 100,
+    max_workers: int = 4,
+    checkpoint_path: str = None,
+    fingerprint: dict = None,
+) -> dict:
+    """
+    Embed and store all chunks of `docs` (an iterable of Documents or Document dicts).
+    `write_batch(ids, chunks, vectors)` is always called from the calling thread, in order of completion.
+    Returns run statistics, including the IDs of all chunks that belong to the input.
+    """
+    fingerprint = fingerprint or {}
+    done = _load_checkpoint(checkpoint_path, fingerprint)
+    if done:
+        print(f"Resuming from checkpoint: {len(done)} batches already stored.")
+
+    seen_ids = set()
+    stored = resumed = 0
+    start_time = time.time()
+
+    def embed(batch_no, batch):
+        vectors = embeddings.embed_documents([chunk.page_content for _, chunk in batch])
+        return batch_no, batch, vectors
+
+    def finish(futures):
+        nonlocal stored
+        for future in futures:
+            batch_no, batch, vectors = future.result()
+            write_batch([id for id, _ in batch], [chunk for _, chunk in batch], vectors)
+            done.add(batch_no)
+            stored += len(batch)
+            if checkpoint_path:
+                _save_checkpoint(checkpoint_path, fingerprint, done)
+            elapsed = time.time() - start_time
+            print(f"Stored batch {batch_no}: {stored} chunks, {stored / elapsed:.1f} chunks/s.")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = set()
+        for batch_no, batch in enumerate(batched(iter_chunks(docs, text_splitter), batch_size)):
+            seen_ids.update(id for id, _ in batch)
+            if batch_no in done:
+                resumed += len(batch)
+                continue
+            # Bound the number of batches in flight, so memory use doesn't grow with the size of the input.
+            if len(pending) >= max_workers * 2:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                finish(finished)
+            pending.add(pool.submit(embed, batch_no, batch))
+        finish(pending)
+
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)  # The run is complete, the next one starts from the beginning.
+
+    elapsed = time.time() - start_time
+    return {
+        "stored_chunks": stored,
+        "resumed_chunks": resumed,
+        "seconds": elapsed,
+        "chunks_per_second": stored / elapsed if elapsed else 0.0,
+        "chunk_ids": seen_ids,
+    }
@@ -0,0 +1,110 @@
+"""
+Incremental indexing of local PDF files into the persistent vector store.
+
+A small manifest stored next to the Chroma DB remembers the content hash of every
+indexed PDF and the IDs of the chunks that were created from it. On startup:
+- unchanged PDFs are skipped (no embedding calls, and no parsing if their pages are already stored),
+- new or changed PDFs are split and upserted under stable chunk IDs,
+- PDFs that are no longer listed have their chunks deleted from the vector store.
+"""
+
+import hashlib
+import json
+import os
+
+from langchain_community.document_loaders import PyPDFLoader
+
+from index_version import bump_index_version
+
+MANIFEST_FILE = "pdf_manifest.json"  # Stored inside the Chroma DB directory, so deleting the DB also resets the manifest.
+
+
+def file_sha256(path: str) -> str:
+    """Return the SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_ids_for(source: str, file_hash: str, count: int) -> list[str]:
+    """Stable chunk IDs: the same file content always maps to the same IDs."""
+    return [f"pdf:{source}:{file_hash[:16]}:{i}" for i in range(count)]
+
+
+def load_manifest(persist_dir: str) -> dict:
+    path = os.path.join(persist_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(persist_dir: str, manifest: dict):
+    """Write the manifest atomically, so a crash never leaves a half-written file behind."""
+    os.makedirs(persist_dir, exist_ok=True)
+    path = os.path.join(persist_dir, MANIFEST_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def sync_pdfs(vector_store, pdf_paths: list[str], text_splitter, persist_dir: str, known_sources=()) -> dict:
+    """
+    Bring the vector store in line with the given PDF files.
+    Returns a dict of loaded pages (list of Documents) by PDF source. Unchanged PDFs whose source is in
+    known_sources (e.g. already in the document store) are not parsed at all and are left out of the result.
+    """
+    manifest = load_manifest(persist_dir)
+    splitter_settings = [text_splitter._chunk_size, text_splitter._chunk_overlap]
+    pages_by_source = {}
+    new_manifest = {}
+    embedded = skipped = 0
+
+    # PyPDFLoader uses the given path as the "source" of every page, so the path is also the manifest key.
+    for source in pdf_paths:
+        if not os.path.exists(source):
+            raise FileNotFoundError(f"The file {source} does not exist.")
+
+        file_hash = file_sha256(source)
+        entry = manifest.get(source)
+        unchanged = entry and entry["sha256"] == file_hash and entry.get("splitter") == splitter_settings
+        if unchanged and source in known_sources:
+            new_manifest[source] = entry
+            skipped += 1
+            continue
+
+        pages = PyPDFLoader(file_path=source).load()
+        pages_by_source[source] = pages
+        if unchanged:
+            new_manifest[source] = entry
+            skipped += 1
+            continue
+
+        all_splits = text_splitter.split_documents(pages)
+        ids = chunk_ids_for(source, file_hash, len(all_splits))
+        if entry:
+            # Drop chunks of the previous version before upserting, in case the IDs overlap (e.g. only the splitter changed).
+            stale_ids = entry["chunk_ids"]
+        else:
+            # Not in the manifest: clean up chunks that earlier versions of api.py added under random IDs on every boot.
+            stale_ids = vector_store.get(where={"source": source}, include=[])["ids"]
+        if stale_ids:
+            vector_store.delete(ids=stale_ids)
+        if all_splits:
+            vector_store.add_documents(all_splits, ids=ids)
+        new_manifest[source] = {"sha256": file_hash, "chunk_ids": ids, "splitter": splitter_settings}
+        embedded += 1
+
+    removed = [source for source in manifest if source not in new_manifest]
+    for source in removed:
+        if manifest[source]["chunk_ids"]:
+            vector_store.delete(ids=manifest[source]["chunk_ids"])
+
+    save_manifest(persist_dir, new_manifest)
+    if embedded or removed:
+        bump_index_version(persist_dir)
+    print(f"PDF index: {embedded} embedded, {skipped} unchanged, {len(removed)} removed.")
+    return pages_by_source
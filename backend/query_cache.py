@@ -0,0 +1,119 @@
+"""
+In-process LRU + TTL cache of retrieval results, matching exact and near-duplicate queries.
+
+Users ask the same handful of questions over and over. A lookup first tries the normalized query text
+(no embedding call, no vector search). If that misses, the caller embeds the query and tries again with
+the embedding: a cached query whose embedding has a cosine similarity above the threshold is treated as
+the same question, which still saves the vector and keyword search.
+
+All entries are dropped when the index version changes, i.e. whenever the vector store is re-indexed.
+"""
+
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace, so trivially different phrasings share an entry."""
+    query = unicodedata.normalize("NFKC", query).lower()
+    query = re.sub(r"[^\w\s-]", " ", query)
+    return " ".join(query.split())
+
+
+class SemanticQueryCache:
+    def __init__(self, max_entries: int = 256, ttl: float = 3600, similarity_threshold: float = 0.95, version_fn=None, on_invalidate=None):
+        self.max_entries = max_entries
+        self.ttl = ttl  # Seconds
+        self.similarity_threshold = similarity_threshold
+        self.version_fn = version_fn  # Returns the current index version, entries of other versions are invalid
+        self.on_invalidate = on_invalidate  # Called when the index version changes, e.g. to rebuild other indexes
+        self._entries = OrderedDict()  # normalized query -> (created, unit embedding, value, cost in seconds)
+        self._version = version_fn() if version_fn else None
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def _check_version(self):
+        if not self.version_fn:
+            return
+        version = self.version_fn()
+        with self._lock:
+            changed = version != self._version  # Checked and set under the lock, so that only one caller rebuilds
+            if changed:
+                self._entries.clear()
+                self._version = version
+        if changed:
+            print("Index version changed, retrieval cache cleared.")
+            if self.on_invalidate:
+                self.on_invalidate()
+
+    def _hit(self, key, entry, exact: bool):
+        self._entries.move_to_end(key)
+        if exact:
+            self.exact_hits += 1
+        else:
+            self.similar_hits += 1
+        self.saved_seconds += entry[3]
+        return entry[2]
+
+    def get(self, query: str):
+        """Exact lookup by normalized query. Returns the cached value or None.
+
+        Reads the index version, and rebuilds the other indexes (on_invalidate) if it has changed, so call it from a worker thread.
+        """
+        self._check_version()
+        key = normalize_query(query)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[0] < self.ttl:
+                return self._hit(key, entry, exact=True)
+            if entry:
+                del self._entries[key]
+        return None
+
+    def get_similar(self, embedding) -> object:
+        """Near-duplicate lookup by query embedding. Returns the cached value or None (counted as a miss)."""
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        now = time.monotonic()
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if now - entry[0] >= self.ttl]:
+                del self._entries[key]
+            if self._entries:
+                keys = list(self._entries)
+                similarities = np.stack([self._entries[key][1] for key in keys]) @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    return self._hit(keys[best], self._entries[keys[best]], exact=False)
+            self.misses += 1
+        return None
+
+    def put(self, query: str, embedding, value, cost: float):
+        """Store a value with the time it took to compute it (reported as saved on later hits)."""
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        key = normalize_query(query)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), vector, value, cost)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.exact_hits + self.similar_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.similar_hits) / lookups if lookups else 0.0,
+            "saved_seconds": round(self.saved_seconds, 3),
+        }
@@ -0,0 +1,203 @@
+"""
+Incremental parsing of the structured response, so that response items can be sent to the client one by one.
+
+The structured output ({"response": [{"type": "text", ...}, {"type": "link", ...}]}) is streamed by the LLM as
+JSON text in small pieces. IncrementalItemParser is fed those pieces and returns each item of the "response"
+list as soon as its closing brace has arrived, without waiting for the rest of the answer.
+
+In single-pass mode the agent writes its final answer directly in that JSON shape, instead of a plain
+answer that a second LLM call reshapes. parse_response() and SinglePassFormatter read and repair it locally.
+"""
+
+import json
+import re
+import threading
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+
+
+class IncrementalItemParser:
+    def __init__(self):
+        self._buffer = ""
+        self._position = 0  # Index in the buffer up to which the JSON has been scanned
+        self._stack = []  # Open brackets ("{" or "[") at the scanned position
+        self._in_string = False
+        self._escaped = False
+        self._item_start = None  # Buffer index of the "{" of the item that is being received
+        self.items = []
+
+    def _is_item_container(self) -> bool:
+        # Items are the objects of the top-level list, or of the list inside the top-level object.
+        return bool(self._stack) and self._stack[-1] == "[" and len(self._stack) <= 2
+
+    def feed(self, text: str) -> list[dict]:
+        """Add the next piece of JSON text. Returns the items that were completed by it."""
+        self._buffer += text
+        completed = []
+        while self._position < len(self._buffer):
+            char = self._buffer[self._position]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if char == "{" and self._is_item_container():
+                    self._item_start = self._position
+                self._stack.append(char)
+            elif char in "}]" and self._stack:
+                self._stack.pop()
+                if char == "}" and self._item_start is not None and self._is_item_container():
+                    try:
+                        item = json.loads(self._buffer[self._item_start:self._position + 1])
+                    except ValueError:
+                        item = None
+                    if isinstance(item, dict):
+                        self.items.append(item)
+                        completed.append(item)
+                    self._item_start = None
+            self._position += 1
+        return completed
+
+
+ITEM_KEYS = ("type", "content", "url", "label")
+CODE_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+
+def normalize_item(item: dict) -> dict | None:
+    """An item with all ResponseItem keys (missing ones as None), or None if it is not a valid text or link item."""
+    item_type = item.get("type") or ("link" if item.get("url") else "text")
+    if item_type == "text" and item.get("content"):
+        return {"type": "text", "content": str(item["content"]), "url": None, "label": None}
+    if item_type == "link" and item.get("url"):
+        return {"type": "link", "content": None, "url": str(item["url"]), "label": str(item.get("label") or item["url"])}
+    return None
+
+
+def _close_truncated(text: str) -> str:
+    """Close the string and the brackets that are still open at the end of a truncated JSON text."""
+    stack, in_string, escaped = [], False, False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+    return text + ('"' if in_string else "") + "".join(reversed(stack))
+
+
+def parse_response(text: str) -> tuple[dict | None, bool]:
+    """Parse a final answer written as {"response": [...]} JSON. Returns (response, repaired) or (None, False).
+
+    Common defects are repaired locally: code fences, text around the JSON, trailing commas, a bare item list,
+    a truncated end, and items with missing or extra keys. An answer without any JSON is accepted as a single
+    text item unless it contains links, which the caller should then format with the structured output pass.
+    """
+    stripped = CODE_FENCE.sub("", text.strip())
+    start = min((i for i in (stripped.find("{"), stripped.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        if stripped and "http" not in stripped:
+            return {"response": [{"type": "text", "content": stripped, "url": None, "label": None}]}, True
+        return None, False
+
+    candidate = stripped[start:stripped.rfind("}" if stripped[start] == "{" else "]") + 1] or stripped[start:]
+    repaired = start > 0 or candidate != stripped or stripped != text.strip()
+    for attempt in (candidate, TRAILING_COMMA.sub(r"\1", candidate), _close_truncated(TRAILING_COMMA.sub(r"\1", stripped[start:]))):
+        try:
+            data = json.loads(attempt)
+            break
+        except ValueError:
+            repaired = True
+    else:
+        return None, False
+
+    items = data.get("response") if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return None, False
+    normalized = [item for item in (normalize_item(item) for item in items if isinstance(item, dict)) if item is not None]
+    if not normalized:
+        return None, False
+    repaired = repaired or len(normalized) != len(items) or any(set(item) - set(ITEM_KEYS) for item in items)
+    return {"response": normalized}, repaired
+
+
+def _text(message) -> str:
+    if isinstance(message.content, str):
+        return message.content
+    return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in message.content)
+
+
+class SinglePassFormatter:
+    """Post-model hook that turns the agent's final message into the structured response without another LLM call.
+
+    The agent is prompted to write its final answer as ResponseFormatter JSON. The hook parses (and if needed
+    repairs) it locally, and only falls back to the structured output LLM call when that fails.
+    """
+
+    def __init__(self, llm, schema):
+        self.schema = schema
+        self.structured_llm = llm.with_structured_output(schema)  # Only used as a fallback
+        self._lock = threading.Lock()
+        self.parsed = 0
+        self.repaired = 0
+        self.fallbacks = 0
+
+    def _parse(self, state: dict):
+        """Returns (update, fallback input messages). Exactly one of them is None."""
+        messages = state["messages"]
+        last_message = messages[-1]
+        if not isinstance(last_message, AIMessage) or last_message.tool_calls:
+            return {}, None  # Not the final answer yet
+        response, repaired = parse_response(_text(last_message))
+        if response is not None:
+            try:
+                structured_response = self.schema.model_validate(response)
+                with self._lock:
+                    self.parsed += 1
+                    self.repaired += repaired
+                return {"structured_response": structured_response}, None
+            except ValueError:
+                pass
+        with self._lock:
+            self.fallbacks += 1
+        # The current turn (from the last user message on) has the answer and the tool results its links come from.
+        turn_start = max((i for i, message in enumerate(messages) if isinstance(message, HumanMessage)), default=0)
+        return None, messages[turn_start:]
+
+    def format(self, state: dict) -> dict:
+        update, fallback_input = self._parse(state)
+        if update is not None:
+            return update
+        return {"structured_response": self.structured_llm.invoke(fallback_input)}
+
+    async def aformat(self, state: dict) -> dict:
+        update, fallback_input = self._parse(state)
+        if update is not None:
+            return update
+        return {"structured_response": await self.structured_llm.ainvoke(fallback_input)}
+
+    def as_hook(self):
+        return RunnableLambda(self.format, afunc=self.aformat, name="format_response")
+
+    def stats(self) -> dict:
+        answers = self.parsed + self.fallbacks
+        return {
+            "parsed_locally": self.parsed,
+            "repaired": self.repaired,
+            "fallback_llm_calls": self.fallbacks,
+            "local_rate": self.parsed / answers if answers else 0.0,
+        }
@@ -1,48 +1,89 @@
 # Update Chroma DB with new documents without needing to fetch all documents from the web.
 # docs*.json files are human-readable and can be edited manually - after editing them, run this script to update the vector database.
+# Embeddings are cached locally (embedding_cache.py), so only the chunks that changed are embedded again.
+# Documents are streamed through ingest_pipeline.py in batches. If the script dies halfway, run it again to resume from the checkpoint.
+# To try the pipeline without Gemini credentials: python save_docs_to_vectors.py --fake-embeddings --db-dir ./chroma_db_fake
 
 import os
-import json
-from langchain_core.documents import Document
+import argparse
+from langchain_core.embeddings import DeterministicFakeEmbedding
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_community.vectorstores import Chroma
 from dotenv import load_dotenv
-import time
+
+from embedding_cache import CachedEmbeddings, EMBEDDING_MODEL, EMBEDDING_CACHE_PATH
+from index_version import bump_index_version
+from ingest_pipeline import RateLimitedEmbeddings, TokenBucket, chroma_batch_writer, iter_json_array, run_pipeline
 
 JSON_FILE = "docs_en.json" # Set path to Document JSON file
 NEW_DB_DIR = "./chroma_db_en" # Directory to store the updated vector store
 CHUNK_SIZE = 1000  # Maximum size of a chunk in characters
 CHUNK_OVERLAP = 200 # Overlap between chunks in characters
+BATCH_SIZE = 100 # Chunks per embedding request (Gemini accepts at most 100 texts per batch request)
+MAX_WORKERS = 4 # Embedding requests in flight at the same time
+REQUESTS_PER_MINUTE = 100 # Rate limit for embedding requests, adjust to your Gemini quota
 
-if not os.path.exists(JSON_FILE):
-  raise FileNotFoundError(f"The JSON file {JSON_FILE} does not exist.")
-
-# Embeddings need credentials
-load_dotenv()
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
+parser = argparse.ArgumentParser(description="Embed the documents of a docs*.json file into a Chroma vector store.")
+parser.add_argument("--json-file", default=JSON_FILE)
+parser.add_argument("--db-dir", default=NEW_DB_DIR)
+parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+parser.add_argument("--requests-per-minute", type=float, default=REQUESTS_PER_MINUTE)
+parser.add_argument("--fake-embeddings", action="store_true", help="Use a local deterministic fake embedder instead of Gemini.")
+args = parser.parse_args()
 
-start_time = time.time()
+if not os.path.exists(args.json_file):
+  raise FileNotFoundError(f"The JSON file {args.json_file} does not exist.")
 
-# Open the JSON file with documents
-with open(JSON_FILE, "r", encoding="utf-8") as f:
-    docs = [Document(**doc) for doc in json.load(f)]
+if args.fake_embeddings:
+  provider, model_name = DeterministicFakeEmbedding(size=768), "fake"
+else:
+  # Embeddings need credentials
+  from langchain_google_genai import GoogleGenerativeAIEmbeddings
+  load_dotenv()
+  os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+  provider, model_name = GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL), EMBEDDING_MODEL
 
-print(f"Loaded {len(docs)} documents from {JSON_FILE}.\n\n")
+# Only cache misses reach the provider, so only they are rate limited.
+bucket = TokenBucket(rate=args.requests_per_minute / 60, capacity=args.workers)
+embeddings = CachedEmbeddings(RateLimitedEmbeddings(provider, bucket), model_name, EMBEDDING_CACHE_PATH)
 
-# Split documents
+vector_store = Chroma(embedding_function=embeddings, persist_directory=args.db_dir)
 text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
-all_splits = text_splitter.split_documents(docs)
 
-# Create and persist vector store
-vector_store = Chroma.from_documents(
-  all_splits,
-  embedding=embeddings,
-  persist_directory=NEW_DB_DIR
+# If the input file or the settings change, the checkpoint is discarded and the run starts over.
+file_stat = os.stat(args.json_file)
+fingerprint = {
+  "json_file": os.path.abspath(args.json_file),
+  "size": file_stat.st_size,
+  "mtime": file_stat.st_mtime,
+  "model": model_name,
+  "batch_size": args.batch_size,
+  "chunk_size": CHUNK_SIZE,
+  "chunk_overlap": CHUNK_OVERLAP,
+}
+
+stats = run_pipeline(
+  iter_json_array(args.json_file),
+  text_splitter,
+  embeddings,
+  chroma_batch_writer(vector_store),
+  batch_size=args.batch_size,
+  max_workers=args.workers,
+  checkpoint_path=os.path.join(args.db_dir, "ingest_checkpoint.json"),
+  fingerprint=fingerprint,
 )
 
-elapsed = time.time() - start_time
+# Remove chunks of documents that were deleted or edited since the last run.
+# PDF chunks ("pdf:" IDs) are managed by api.py on startup, see pdf_index.py.
+stale_ids = [id for id in vector_store.get(include=[])["ids"] if not id.startswith("pdf:") and id not in stats["chunk_ids"]]
+if stale_ids:
+  vector_store.delete(ids=stale_ids)
+# Invalidates the retrieval and answer caches of running API servers.
+if stats["stored_chunks"] or stale_ids:
+  bump_index_version(args.db_dir)
 
-print(f"\nCreated {len(all_splits)} document chunks. These have been saved to the vector store in '{NEW_DB_DIR}'.")
-print(f"\nVector store creation took {elapsed:.2f} seconds.")
\ No newline at end of file
+print(f"\nStored {stats['stored_chunks']} document chunks ({stats['resumed_chunks']} were already stored before resuming) in '{args.db_dir}'. Removed {len(stale_ids)} stale chunks.")
+print(f"\nVector store update took {stats['seconds']:.2f} seconds ({stats['chunks_per_second']:.1f} chunks/s).")
+cache_stats = embeddings.stats()
+print(f"Embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses ({cache_stats['hit_rate']:.0%} of chunks did not need an embedding call). Retried requests: {embeddings.underlying.retries}.")
@@ -0,0 +1,99 @@
+"""
+Cache of the table list and the table info (schema and sample rows) of the transaction database.
+
+Every database question used to make the agent call sql_db_list_tables and sql_db_schema, and SQLDatabase
+reflects the schema and selects sample rows again on every call, although they only change when the
+database is rebuilt. SchemaCache computes them once per database version, and compact_schema() renders
+them for the system prompt, so that the agent can write its query without those tool calls at all.
+The version comes from version_fn, e.g. TransactionStore.version(), which only stats the database file,
+so a hit doesn't touch the database.
+
+Hits and the time they saved (the measured cost of computing the same entry) are counted in total and
+per agent turn: start_turn() at the beginning of a turn, finish_turn() at its end.
+"""
+
+import contextvars
+import re
+import threading
+import time
+
+_current_turn = contextvars.ContextVar("schema_cache_turn", default=None)
+
+
+class SchemaCache:
+    def __init__(self, database, version_fn):
+        self.database = database  # langchain_community SQLDatabase
+        self.version_fn = version_fn  # Returns a value that changes when the schema or the data changes
+        self._lock = threading.Lock()
+        self._entries = {}  # (version, key) -> (value, seconds it took to compute)
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.turns = 0
+
+    def _get(self, key: str, compute):
+        version = self.version_fn()
+        with self._lock:
+            entry = self._entries.get((version, key))
+        turn = _current_turn.get()
+        if entry is not None:
+            with self._lock:
+                self.hits += 1
+                self.saved_seconds += entry[1]
+                if turn is not None:
+                    turn["hits"] += 1
+                    turn["saved_seconds"] += entry[1]
+            return entry[0]
+
+        started = time.perf_counter()
+        value = compute()
+        with self._lock:
+            if any(cached_version != version for cached_version, _ in self._entries):
+                self._entries.clear()  # Entries of an earlier version of the database are not needed anymore
+            self._entries[(version, key)] = (value, time.perf_counter() - started)
+            self.misses += 1
+            if turn is not None:
+                turn["misses"] += 1
+        return value
+
+    def table_names(self) -> str:
+        """Comma-separated list of the tables, like sql_db_list_tables."""
+        return self._get("tables", lambda: ", ".join(self.database.get_usable_table_names()))
+
+    def table_info(self, table_names: str) -> str:
+        """Schema and sample rows of comma-separated tables, like sql_db_schema. Unknown tables return an error message."""
+        names = [name.strip() for name in table_names.split(",") if name.strip()]
+        unknown = set(names) - set(self.database.get_usable_table_names())
+        if unknown or not names:
+            return self.database.get_table_info_no_throw(names)  # Not cached, returns the error message
+        return "\n\n".join(self._get(f"table:{name}", lambda name=name: self.database.get_table_info_no_throw([name])) for name in names)
+
+    def compact_schema(self, sample_rows: int = 2) -> str:
+        """All tables in a compact form for the system prompt: the CREATE TABLE statement on one line and a few sample rows."""
+        parts = []
+        for name in self.database.get_usable_table_names():
+            info = self.table_info(name)
+            create, _, samples = info.partition("/*")
+            lines = [line for line in samples.strip().rstrip("*/").strip().splitlines()[1:] if line.strip()]  # Column names and rows
+            parts.append(re.sub(r"\s+", " ", create).strip() + ("\n" + "\n".join(lines[:sample_rows + 1]) if lines else ""))
+        return "\n\n".join(parts)
+
+    def start_turn(self) -> dict:
+        """Start counting the hits of an agent turn. Tool calls of the turn (also on worker threads) share the counters."""
+        turn = {"hits": 0, "misses": 0, "saved_seconds": 0.0}
+        _current_turn.set(turn)
+        return turn
+
+    def finish_turn(self, turn: dict):
+        if turn["hits"] or turn["misses"]:
+            with self._lock:
+                self.turns += 1
+            print(f"Schema cache: {turn['hits']} hits, {turn['misses']} misses, {turn['saved_seconds'] * 1000:.1f} ms saved in this turn.")
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "saved_seconds": round(self.saved_seconds, 4),
+            "saved_seconds_per_turn": round(self.saved_seconds / self.turns, 4) if self.turns else 0.0,
+        }
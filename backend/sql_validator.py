@@ -0,0 +1,96 @@
+"""
+Local validation of the SQL queries the agent writes, instead of the SQL toolkit's LLM query checker.
+
+sql_db_query_checker spent a whole LLM call (and an agent round trip) on every query. SqlValidator checks a
+query locally, in well under a millisecond, right before it runs:
+  - it must be a single SELECT (or WITH ... SELECT) statement;
+  - it is compiled with EXPLAIN against an empty copy of the database schema, with an SQLite authorizer
+    that only allows reading, so anything that would write, attach or change settings is rejected, and
+    unknown tables and columns are reported with the known ones, so the agent can fix the query at once;
+  - a LIMIT is added when the query has none.
+"""
+
+import re
+import sqlite3
+import threading
+
+SCHEMA_QUERY = "SELECT sql FROM sqlite_master WHERE type IN ('table', 'view') AND sql IS NOT NULL AND name NOT LIKE 'sqlite_%'"
+
+# Strings, quoted identifiers and comments, which may contain keywords, semicolons and parentheses.
+TOKEN = re.compile(r"""'(?:[^']|'')*'|"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\]|--[^\n]*|/\*.*?\*/|\w+|[();]|\S""", re.DOTALL)
+# Authorizer actions of a read-only query (https://www.sqlite.org/c3ref/c_alter_table.html)
+READ_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, getattr(sqlite3, "SQLITE_RECURSIVE", 33)}
+
+
+def read_only_authorizer(action, *args):
+    return sqlite3.SQLITE_OK if action in READ_ACTIONS else sqlite3.SQLITE_DENY
+
+
+class SqlValidator:
+    def __init__(self, schema_sql: list[str], default_limit: int = 50):
+        """schema_sql: the CREATE statements of the tables and views (the result of SCHEMA_QUERY)."""
+        self.default_limit = default_limit
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(":memory:", check_same_thread=False)
+        for sql in schema_sql:
+            self._connection.execute(sql)
+        self.columns = {
+            table: [row[1] for row in self._connection.execute(f'PRAGMA table_info("{table}")')]
+            for (table,) in self._connection.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%' ORDER BY name")
+        }
+        self._connection.set_authorizer(read_only_authorizer)
+        self.checked = 0
+        self.rejected = 0
+        self.limits_added = 0
+
+    def _schema_hint(self) -> str:
+        return "Known tables and columns: " + "; ".join(f"{table}({', '.join(columns)})" for table, columns in self.columns.items())
+
+    def _reject(self, reason: str):
+        with self._lock:
+            self.rejected += 1
+        raise ValueError(reason)
+
+    def validate(self, query: str) -> str:
+        """The query to run (with a LIMIT added if needed). Raises ValueError with the reason if the query is not allowed."""
+        with self._lock:
+            self.checked += 1
+        tokens = [token for token in TOKEN.findall(query) if not token.startswith(("--", "/*"))]
+        while tokens and tokens[-1] == ";":
+            tokens.pop()
+        if not tokens:
+            self._reject("The query is empty.")
+        if ";" in tokens:
+            self._reject("Only one statement can be run at a time.")
+        if tokens[0].upper() not in ("SELECT", "WITH"):
+            self._reject("Only SELECT queries are allowed, the database is read-only.")
+
+        query = query.strip().rstrip(";").rstrip()
+        try:
+            with self._lock:
+                self._connection.execute(f"EXPLAIN {query}")
+        except sqlite3.DatabaseError as e:
+            message = str(e)
+            if "not authorized" in message:
+                self._reject("Only SELECT queries are allowed, the database is read-only.")
+            if "no such column" in message or "no such table" in message:
+                self._reject(f"{message}. {self._schema_hint()}")
+            self._reject(message)
+
+        # LIMIT at the top level, i.e. not inside parentheses (subqueries) or a CTE.
+        depth, has_limit = 0, False
+        for token in tokens:
+            if token == "(":
+                depth += 1
+            elif token == ")":
+                depth -= 1
+            elif depth == 0 and token.upper() == "LIMIT":
+                has_limit = True
+        if not has_limit:
+            query = f"{query}\nLIMIT {self.default_limit}"
+            with self._lock:
+                self.limits_added += 1
+        return query
+
+    def stats(self) -> dict:
+        return {"checked": self.checked, "rejected": self.rejected, "limits_added": self.limits_added}
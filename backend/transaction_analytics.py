@@ -0,0 +1,118 @@
+"""
+Spending analytics over the transaction history, held in memory as NumPy columns.
+
+Answering "what did I spend on groceries in June" with the SQL toolkit takes several LLM round trips
+(list tables, read the schema, check the query with another LLM call, run it). These functions answer
+the common questions in one tool call: spend by category or receiver over a date range, top merchants,
+month-over-month changes and the balance over time.
+
+The transactions are loaded once into columns sorted by date: amounts in cents (int64, so sums are exact),
+dates (datetime64[D]) and categories and receivers as integer codes. A date range is two binary searches,
+and totals per group are one np.bincount over the codes in the range.
+"""
+
+from datetime import date
+
+import numpy as np
+
+QUERY = "SELECT amount, receiver, transaction_date, transaction_type FROM transaction_history"
+
+
+def _euros(cents) -> float:
+    return round(int(cents) / 100, 2)
+
+
+class TransactionColumns:
+    def __init__(self, rows):
+        """rows: (amount, receiver, date 'YYYY-MM-DD', category) tuples, e.g. the result of QUERY."""
+        rows = sorted(rows, key=lambda row: row[2])
+        self.amounts = np.array([round(float(row[0]) * 100) for row in rows], dtype=np.int64)
+        self.dates = np.array([row[2] for row in rows], dtype="datetime64[D]")
+        self.receivers, self.receiver_codes = np.unique(np.array([row[1] for row in rows], dtype=object).astype(str), return_inverse=True)
+        self.categories, self.category_codes = np.unique(np.array([row[3] for row in rows], dtype=object).astype(str), return_inverse=True)
+
+    def __len__(self) -> int:
+        return len(self.amounts)
+
+    def _range(self, start: date | None, end: date | None) -> slice:
+        """Rows from start to end, both inclusive (None means unbounded)."""
+        first = np.searchsorted(self.dates, np.datetime64(start, "D"), side="left") if start else 0
+        last = np.searchsorted(self.dates, np.datetime64(end, "D"), side="right") if end else len(self.dates)
+        return slice(first, last)
+
+    @staticmethod
+    def _code(labels: np.ndarray, name: str, kind: str) -> int:
+        """The code of a category or receiver, matched case-insensitively, or as a part of the name ("restaurants", "amazon") if there is no exact match."""
+        name = name.strip().lower()
+        lowered = [label.lower() for label in labels]
+        if name in lowered:
+            return lowered.index(name)
+        matches = [i for i, label in enumerate(lowered) if name in label or label in name]
+        if len(matches) == 1:
+            return matches[0]
+        raise ValueError(f"Unknown {kind} '{name}'. Known {kind} names: {', '.join(labels)}")
+
+    def _mask(self, rows: slice, category: str | None, receiver: str | None) -> np.ndarray:
+        mask = np.ones(rows.stop - rows.start, dtype=bool)
+        if category:
+            mask &= self.category_codes[rows] == self._code(self.categories, category, "category")
+        if receiver:
+            mask &= self.receiver_codes[rows] == self._code(self.receivers, receiver, "receiver")
+        return mask
+
+    def spend(self, start: date | None = None, end: date | None = None, group_by: str = "category",
+              category: str | None = None, receiver: str | None = None) -> dict:
+        """Total and count of transactions per category or receiver, largest total first."""
+        rows = self._range(start, end)
+        mask = self._mask(rows, category, receiver)
+        labels, codes = (self.categories, self.category_codes) if group_by == "category" else (self.receivers, self.receiver_codes)
+        codes = codes[rows][mask]
+        totals = np.bincount(codes, weights=self.amounts[rows][mask], minlength=len(labels))
+        counts = np.bincount(codes, minlength=len(labels))
+        order = np.argsort(-totals, kind="stable")
+        groups = [{group_by: labels[i], "total": _euros(totals[i]), "count": int(counts[i])} for i in order if counts[i]]
+        return {"total": _euros(self.amounts[rows][mask].sum()), "count": int(mask.sum()), "groups": groups}
+
+    def top_merchants(self, start: date | None = None, end: date | None = None, limit: int = 5, category: str | None = None) -> list[dict]:
+        return self.spend(start, end, group_by="receiver", category=category)["groups"][:limit]
+
+    def monthly(self, start: date | None = None, end: date | None = None, category: str | None = None, receiver: str | None = None) -> list[dict]:
+        """Total per calendar month with the change from the previous month (months without transactions included)."""
+        rows = self._range(start, end)
+        mask = self._mask(rows, category, receiver)
+        months = self.dates[rows].astype("datetime64[M]")
+        if not len(months):
+            return []
+        first, last = months[0], months[-1]
+        month_codes = (months[mask] - first).astype(np.int64)
+        totals = np.bincount(month_codes, weights=self.amounts[rows][mask], minlength=int((last - first).astype(np.int64)) + 1)
+        result, previous = [], None
+        for i, cents in enumerate(totals):
+            entry = {"month": str(first + i), "total": _euros(cents)}
+            if previous is not None:
+                entry["change"] = _euros(cents - previous)
+                entry["change_percent"] = round((cents - previous) / previous * 100, 1) if previous else None
+            result.append(entry)
+            previous = cents
+        return result
+
+    def balance_over_time(self, current_balance: float, start: date | None = None, end: date | None = None) -> list[dict]:
+        """Month-end balances, reconstructed backwards from the current balance by adding back the later payments.
+
+        The history only has outgoing payments (no income), so this shows how the payments drew down the account.
+        """
+        rows = self._range(start, None)
+        months = self.dates[rows].astype("datetime64[M]")
+        if not len(months):
+            return []
+        current_cents = round(current_balance * 100)
+        # Balance at the end of a month = current balance + all payments after that month.
+        spent_after = self.amounts[rows][::-1].cumsum()[::-1]  # Payments from each row to the end
+        last_rows = np.flatnonzero(np.append(months[1:] != months[:-1], True))  # Last row of each month
+        result = []
+        for row in last_rows:
+            if end and months[row] > np.datetime64(end, "M"):
+                break
+            later = spent_after[row + 1] if row + 1 < len(spent_after) else 0
+            result.append({"month": str(months[row]), "balance": _euros(current_cents + later)})
+        return result
@@ -0,0 +1,65 @@
+"""
+Indexes and monthly aggregate tables of the transaction history database.
+
+The typical questions ("how much did I spend on restaurants last month", "where did I shop most in March")
+filter by date, type (category) and receiver, and sum amounts per month. prepare_transaction_db() adds to
+the transaction_history table loaded from transaction_history.sql:
+  - indexes on transaction_date, (transaction_type, transaction_date) and (receiver, transaction_date);
+  - monthly_category_totals and monthly_receiver_totals: the total, count and month ('YYYY-MM') per category
+    and per receiver, filled once from the existing rows and kept in sync by triggers on insert, update
+    and delete, so a monthly total is one primary key lookup instead of a scan and a GROUP BY.
+
+Compare the query times with benchmarks/transaction_db_benchmark.py.
+"""
+
+import sqlite3
+
+AGGREGATE_TABLES = {
+    # Aggregate table -> column of transaction_history it groups by (with the month)
+    "monthly_category_totals": "transaction_type",
+    "monthly_receiver_totals": "receiver",
+}
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_transaction_date ON transaction_history (transaction_date);
+CREATE INDEX IF NOT EXISTS idx_transaction_type_date ON transaction_history (transaction_type, transaction_date);
+CREATE INDEX IF NOT EXISTS idx_receiver_date ON transaction_history (receiver, transaction_date);
+"""
+
+
+def _aggregate_sql(table: str, column: str) -> str:
+    # Totals are rounded to cents on every change, so that sums of floating point amounts don't drift.
+    add = f"""
+        INSERT INTO {table} (month, {column}, total, count) VALUES (strftime('%Y-%m', NEW.transaction_date), NEW.{column}, ROUND(NEW.amount, 2), 1)
+        ON CONFLICT (month, {column}) DO UPDATE SET total = ROUND(total + excluded.total, 2), count = count + 1;"""
+    remove = f"""
+        UPDATE {table} SET total = ROUND(total - OLD.amount, 2), count = count - 1
+        WHERE month = strftime('%Y-%m', OLD.transaction_date) AND {column} = OLD.{column};
+        DELETE FROM {table} WHERE month = strftime('%Y-%m', OLD.transaction_date) AND {column} = OLD.{column} AND count <= 0;"""
+    return f"""
+    CREATE TABLE IF NOT EXISTS {table} (
+        month TEXT NOT NULL,
+        {column} TEXT NOT NULL,
+        total DECIMAL(10, 2) NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (month, {column})
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table} ({column}, month);
+    DELETE FROM {table};
+    INSERT INTO {table} (month, {column}, total, count)
+        SELECT strftime('%Y-%m', transaction_date), {column}, ROUND(SUM(amount), 2), COUNT(*)
+        FROM transaction_history GROUP BY 1, 2;
+    CREATE TRIGGER IF NOT EXISTS {table}_insert AFTER INSERT ON transaction_history BEGIN {add}
+    END;
+    CREATE TRIGGER IF NOT EXISTS {table}_delete AFTER DELETE ON transaction_history BEGIN {remove}
+    END;
+    CREATE TRIGGER IF NOT EXISTS {table}_update AFTER UPDATE OF amount, transaction_date, {column} ON transaction_history BEGIN {remove} {add}
+    END;
+    """
+
+
+def prepare_transaction_db(connection: sqlite3.Connection):
+    """Create the indexes and the aggregate tables (with their triggers) for a loaded transaction_history table."""
+    with connection:
+        connection.executescript(INDEXES + "".join(_aggregate_sql(table, column) for table, column in AGGREGATE_TABLES.items()))
+        connection.execute("ANALYZE")  # Statistics for the query planner to choose between the indexes
@@ -0,0 +1,255 @@
+"""
+File-backed transaction store: one SQLite database per account, read through a pool of read-only connections.
+
+get_engine_for_transaction_db() used to load the transactions into one in-memory connection that every request
+thread shared through StaticPool, so the queries of concurrent sessions ran one at a time on it, and it only
+held the transactions of one user. TransactionStore keeps:
+  - one database file per account (<directory>/<account>.sqlite) in WAL mode. build() writes a whole account
+    with the SQLite backup API in one transaction: sessions that are reading keep their snapshot, and the
+    next query sees the new data;
+  - a pool of read-only connections per account (mode=ro, and an authorizer that only allows reading, so
+    also no ATTACH of another account's file), so that sessions query in parallel. The pools of the most
+    recently used accounts are kept open;
+  - the NumPy columns of the analytics tools (transaction_analytics.py) per account, rebuilt when the
+    database file changes.
+
+Queries are scoped to one account by the tool layer: the tools in api.py take the account from the user of the
+agent run, never from the LLM, and a connection of an account's pool can only read that account's file.
+
+Account databases are compiled from their source (a JSON list of transactions or an SQL script like
+data/transaction_history.sql) in advance, e.g. when the Docker image is built, so that starting the server only
+opens the file, however long the history is:
+    python transaction_store.py transactions elina data/transaction_history.sql
+
+Compare with the shared connection: benchmarks/transaction_store_benchmark.py
+Startup time with and without a prebuilt database: benchmarks/transaction_bootstrap_benchmark.py
+"""
+
+import json
+import os
+import queue
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from sql_validator import read_only_authorizer
+from transaction_analytics import QUERY as COLUMNS_QUERY, TransactionColumns
+from transaction_db import prepare_transaction_db
+
+ACCOUNT_NAME = re.compile(r"^[A-Za-z0-9_-]{1,64}$")  # Account names are file names
+COLUMNS = "amount, receiver, transaction_date, transaction_type"
+SCHEMA = """
+CREATE TABLE transaction_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    amount DECIMAL(10, 2) NOT NULL,
+    receiver TEXT NOT NULL,
+    transaction_date DATE NOT NULL,
+    transaction_type TEXT NOT NULL
+);
+"""
+
+
+def read_sql_rows(sql_script: str) -> list[tuple]:
+    """The (amount, receiver, date, category) rows of an SQL script like data/transaction_history.sql."""
+    connection = sqlite3.connect(":memory:")
+    try:
+        connection.executescript(sql_script)
+        return connection.execute(f"SELECT {COLUMNS} FROM transaction_history ORDER BY id").fetchall()
+    finally:
+        connection.close()
+
+
+def read_json_rows(json_text: str) -> list[tuple]:
+    """The rows of a JSON list of transactions like data/elina_transactions_categorized.json."""
+    return [(t["amount"], t["receiver"], t["date"], t["type"]) for t in json.loads(json_text)]
+
+
+def read_rows(path: str) -> list[tuple]:
+    """The (amount, receiver, date, category) rows of a transaction source file, JSON or an SQL script."""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    return read_json_rows(text) if path.endswith(".json") else read_sql_rows(text)
+
+
+class ConnectionPool:
+    """Read-only connections to one database file, opened on demand up to size and reused."""
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self.closed = False
+        self.waits = 0  # Checkouts that had to wait for a connection
+        self._idle = queue.LifoQueue()  # The most recently used connection first, its pages are in its cache
+        self._lock = threading.Lock()
+        self._opened = 0
+
+    def _open(self) -> sqlite3.Connection:
+        # Used by one thread at a time, but not always by the thread that opened it.
+        connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        connection.set_authorizer(read_only_authorizer)
+        return connection
+
+    @contextmanager
+    def connection(self, timeout: float):
+        try:
+            connection = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._opened < self.size
+                if can_open:
+                    self._opened += 1
+                else:
+                    self.waits += 1
+            if can_open:
+                try:
+                    connection = self._open()
+                except sqlite3.Error:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            else:
+                try:
+                    connection = self._idle.get(timeout=timeout)
+                except queue.Empty:
+                    raise TimeoutError(f"No free connection to {self.path} in {timeout} s") from None
+        try:
+            yield connection
+        finally:
+            if self.closed:
+                connection.close()
+            else:
+                self._idle.put(connection)
+
+    def close(self):
+        """Close the idle connections. Connections in use are closed when they are returned."""
+        self.closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class TransactionStore:
+    def __init__(self, directory: str, pool_size: int = 4, max_pools: int = 64, timeout: float = 10.0):
+        self.directory = directory
+        self.pool_size = pool_size  # Connections per account
+        self.max_pools = max_pools  # Accounts whose pools (and analytics columns) are kept open
+        self.timeout = timeout  # Seconds a query waits for a free connection
+        self._lock = threading.Lock()
+        self._pools = OrderedDict()  # account -> ConnectionPool, the most recently used last
+        self._columns = OrderedDict()  # account -> (file signature, TransactionColumns)
+        self.queries = 0
+        self.pools_closed = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, account: str) -> str:
+        if not ACCOUNT_NAME.match(account):
+            raise ValueError(f"Invalid account name: {account!r}")
+        return os.path.join(self.directory, f"{account}.sqlite")
+
+    def has_account(self, account: str) -> bool:
+        return bool(ACCOUNT_NAME.match(account)) and os.path.exists(self.path(account))
+
+    def build(self, account: str, rows):
+        """Write the transactions of an account, (amount, receiver, date, category) rows, replacing the earlier ones.
+
+        The database is built in memory with its indexes and aggregate tables (transaction_db.py), and copied to the file
+        with the backup API, in one write transaction, so that readers never see a half-built database.
+        """
+        source = sqlite3.connect(":memory:")
+        target = sqlite3.connect(self.path(account))
+        try:
+            source.executescript(SCHEMA)
+            with source:
+                source.executemany(f"INSERT INTO transaction_history ({COLUMNS}) VALUES (?, ?, ?, ?)", rows)
+            prepare_transaction_db(source)
+            target.execute("PRAGMA journal_mode = WAL")  # Persistent: readers read while the next build writes
+            source.backup(target)
+        finally:
+            source.close()
+            target.close()
+
+    def connect(self, account: str) -> sqlite3.Connection:
+        """A read-only connection to the database of an account, outside the pool (e.g. for reading the schema with SQLAlchemy)."""
+        if not self.has_account(account):
+            raise KeyError(f"No transactions for account {account!r}")
+        return sqlite3.connect(f"file:{self.path(account)}?mode=ro", uri=True, check_same_thread=False)
+
+    def _pool(self, account: str) -> ConnectionPool:
+        with self._lock:
+            pool = self._pools.get(account)
+            if pool is not None:
+                self._pools.move_to_end(account)
+                return pool
+        if not self.has_account(account):
+            raise KeyError(f"No transactions for account {account!r}")
+        with self._lock:
+            pool = self._pools.setdefault(account, ConnectionPool(self.path(account), self.pool_size))
+            self._pools.move_to_end(account)
+            while len(self._pools) > self.max_pools:
+                _, evicted = self._pools.popitem(last=False)
+                evicted.close()
+                self.pools_closed += 1
+        return pool
+
+    def query(self, account: str, sql: str, parameters=()) -> list[tuple]:
+        """Rows of a read-only query on the database of an account. Raises sqlite3.Error if the query fails."""
+        with self._lock:
+            self.queries += 1
+        with self._pool(account).connection(self.timeout) as connection:
+            return connection.execute(sql, parameters).fetchall()
+
+    def version(self, account: str) -> tuple:
+        """Changes whenever the database of the account changes: a commit changes the WAL file, a checkpoint the database file.
+        Two stat calls, without a query."""
+        path = self.path(account)
+        return tuple((s.st_mtime_ns, s.st_size) if (s := _stat(p)) else None for p in (path, f"{path}-wal"))
+
+    def columns(self, account: str) -> TransactionColumns:
+        """The transactions of an account as NumPy columns for the analytics tools, rebuilt when the database has changed."""
+        signature = self.version(account)
+        with self._lock:
+            cached = self._columns.get(account)
+            if cached and cached[0] == signature:
+                self._columns.move_to_end(account)
+                return cached[1]
+        columns = TransactionColumns(self.query(account, COLUMNS_QUERY))
+        with self._lock:
+            self._columns[account] = (signature, columns)
+            self._columns.move_to_end(account)
+            while len(self._columns) > self.max_pools:
+                self._columns.popitem(last=False)
+        return columns
+
+    def stats(self) -> dict:
+        with self._lock:
+            pools = list(self._pools.values())
+            return {
+                "queries": self.queries,
+                "open_pools": len(pools),
+                "open_connections": sum(pool._opened for pool in pools),
+                "pool_waits": sum(pool.waits for pool in pools),
+                "pools_closed": self.pools_closed,
+            }
+
+
+def _stat(path: str):
+    try:
+        return os.stat(path)
+    except FileNotFoundError:
+        return None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4:
+        sys.exit("Usage: python transaction_store.py <store directory> <account> <transactions .json or .sql>")
+    directory, account, source = sys.argv[1:]
+    started = time.perf_counter()
+    rows = read_rows(source)
+    TransactionStore(directory).build(account, rows)
+    print(f"{os.path.join(directory, account)}.sqlite: {len(rows)} transactions from {source}, built in {time.perf_counter() - started:.2f} s")
@@ -0,0 +1,445 @@
+"""
+Text-to-speech with a long-lived client and a content-addressed audio cache.
+
+Greetings, error messages and repeated FAQ answers are synthesized once: audio is cached by the SHA-256 of
+(filtered text, language, voice, encoding), in memory (LRU, bounded in bytes) and in files on disk (bounded
+in bytes, oldest files removed first), so it survives restarts. Identical requests that arrive while the
+audio is being synthesized wait for the same synthesis instead of starting another one.
+
+The synthesizer is pluggable: GoogleSynthesizer calls Google Cloud TTS with one client that is reused by
+all requests, FakeSynthesizer returns deterministic bytes for tests and benchmarks without credentials.
+
+Answers are not synthesized in one call: AudioStream splits the text into sentences, synthesizes them
+concurrently (at most max_concurrency at a time) and delivers the audio segments in order as binary MP3,
+so playback can start after the first sentence. MP3 frames can be concatenated, so the segments form one
+playable file. Short sentences are also more likely to be served from the cache. Text can be added to a
+stream while the answer is still being generated, so synthesis overlaps with the generation.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+# Voice per language code. Google rejects a voice of another language than the language code, so they are sent together.
+VOICES = {
+    "en-US": "en-US-Chirp3-HD-Achernar",  # Try other voices as well!
+    "fi-FI": "fi-FI-Chirp3-HD-Achernar",
+}
+DEFAULT_LANGUAGE = "en-US"  # Languages without a voice are spoken in this one
+AUDIO_ENCODING = "MP3"
+
+# Emojis are removed from the text before synthesis (compiled once, not per request).
+EMOJI_PATTERN = re.compile(
+    "["
+    "\U0001F600-\U0001F64F"  # emoticons
+    "\U0001F300-\U0001F5FF"  # symbols & pictographs
+    "\U0001F680-\U0001F6FF"  # transport & map symbols
+    "\U0001F1E0-\U0001F1FF"  # flags (iOS)
+    "\U00002700-\U000027BF"  # Dingbats
+    "\U000024C2-\U0001F251"
+    "]",
+    flags=re.UNICODE,
+)
+
+
+SENTENCE_END = re.compile(r"(?<=[.!?…:;])\s+")
+SENTENCE_FINISHED = re.compile(r"[.!?…:;][\"')\]]*$")
+CLAUSE_END = re.compile(r"(?<=[,–—])\s+")
+MIN_SEGMENT_CHARS = 40  # Shorter sentences are joined with the next one, to save synthesis calls
+MAX_SEGMENT_CHARS = 400  # Longer sentences are split at commas (or spaces), so that the first audio is ready sooner
+
+
+def split_sentences(text: str) -> list[str]:
+    """Split a text into segments of whole sentences of MIN_SEGMENT_CHARS to MAX_SEGMENT_CHARS characters, where possible."""
+    pieces = []
+    for sentence in SENTENCE_END.split(text.strip()):
+        while len(sentence) > MAX_SEGMENT_CHARS:
+            head = sentence[:MAX_SEGMENT_CHARS]
+            cut = max((m.end() for m in CLAUSE_END.finditer(head)), default=0) or head.rfind(" ") + 1 or MAX_SEGMENT_CHARS
+            pieces.append(sentence[:cut].strip())
+            sentence = sentence[cut:]
+        if sentence.strip():
+            pieces.append(sentence.strip())
+
+    segments = []
+    for piece in pieces:
+        if segments and len(segments[-1]) < MIN_SEGMENT_CHARS and len(segments[-1]) + len(piece) < MAX_SEGMENT_CHARS:
+            segments[-1] += " " + piece
+        else:
+            segments.append(piece)
+    return segments
+
+
+def clean_text_for_speech(text: str) -> str:
+    """Remove emojis and Markdown asterisks, which would otherwise be read out or break the synthesis."""
+    return " ".join(EMOJI_PATTERN.sub("", text).replace("*", "").split())
+
+
+class GoogleSynthesizer:
+    def __init__(self, voices: dict[str, str] = VOICES):
+        self.voices = voices
+        self._client = None
+        self._client_loop = None
+
+    def _get_client(self):
+        # The async gRPC client is bound to the event loop it was created on, so it is created once per loop (normally once).
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            from google.cloud import texttospeech
+            self._client = texttospeech.TextToSpeechAsyncClient()
+            self._client_loop = loop
+        return self._client
+
+    def voice(self, lang: str) -> tuple[str, str]:
+        """(language code, voice name) that the text of a language is synthesized with."""
+        if lang not in self.voices:
+            lang = DEFAULT_LANGUAGE
+        return lang, self.voices[lang]
+
+    async def synthesize(self, text: str, lang: str, encoding: str = AUDIO_ENCODING) -> bytes:
+        from google.cloud import texttospeech
+        lang, voice_name = self.voice(lang)
+        response = await self._get_client().synthesize_speech(
+            input=texttospeech.SynthesisInput(text=text),
+            voice=texttospeech.VoiceSelectionParams(
+                language_code=lang,
+                name=voice_name,
+                ssml_gender=texttospeech.SsmlVoiceGender.FEMALE,
+            ),
+            audio_config=texttospeech.AudioConfig(audio_encoding=getattr(texttospeech.AudioEncoding, encoding)),
+        )
+        return response.audio_content
+
+
+class FakeSynthesizer:
+    """Returns deterministic bytes after a delay. For tests and benchmarks."""
+
+    def __init__(self, latency: float = 0.3, voice_name: str = "fake", seconds_per_char: float = 0.0):
+        self.latency = latency  # Seconds per synthesis
+        self.seconds_per_char = seconds_per_char  # Additional seconds per character, synthesis time grows with the text
+        self.voice_name = voice_name
+        self.calls = 0
+
+    def voice(self, lang: str) -> tuple[str, str]:
+        return lang, self.voice_name
+
+    async def synthesize(self, text: str, lang: str, encoding: str = AUDIO_ENCODING) -> bytes:
+        self.calls += 1
+        await asyncio.sleep(self.latency + self.seconds_per_char * len(text))
+        return f"{encoding}:{lang}:{text}".encode("utf-8")
+
+
+class AudioCache:
+    def __init__(self, directory: str | None, max_memory_bytes: int = 32 * 1024 * 1024, max_disk_bytes: int = 512 * 1024 * 1024):
+        self.directory = directory  # None keeps the cache in memory only
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()  # key -> audio bytes
+        self._memory_bytes = 0
+        self._disk_bytes = None  # Running total of the files, counted on the first disk access
+        self._lock = threading.Lock()
+        self._trim_lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(text: str, lang: str, voice_name: str, encoding: str) -> str:
+        return hashlib.sha256(json.dumps([text, lang, voice_name, encoding], ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.audio")
+
+    def remember(self, key: str, audio: bytes):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return
+            self._memory[key] = audio
+            self._memory_bytes += len(audio)
+            while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    def get_memory(self, key: str) -> bytes | None:
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+            return audio
+
+    def read_disk(self, key: str) -> bytes | None:
+        """Audio from the disk cache (kept in memory from then on), or None. Blocking, call it from a worker thread."""
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key), "rb") as f:
+                audio = f.read()
+            os.utime(self._path(key))  # The file modification time is the LRU order on disk
+        except FileNotFoundError:
+            return None
+        self.remember(key, audio)
+        return audio
+
+    def get(self, key: str) -> tuple[bytes | None, str | None]:
+        """Returns (audio, "memory" or "disk") or (None, None)."""
+        audio = self.get_memory(key)
+        if audio is not None:
+            return audio, "memory"
+        audio = self.read_disk(key)
+        return (audio, "disk") if audio is not None else (None, None)
+
+    def write_disk(self, key: str, audio: bytes):
+        """Blocking, call it from a worker thread. The oldest files are removed when the cache goes over max_disk_bytes."""
+        if not self.directory:
+            return
+        path = self._path(key)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(audio)
+        replaced = os.stat(path).st_size if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += len(audio) - replaced
+            over = self._disk_bytes is None or self._disk_bytes > self.max_disk_bytes
+        if over:
+            self._trim_disk()
+
+    def put(self, key: str, audio: bytes):
+        self.remember(key, audio)
+        self.write_disk(key, audio)
+
+    def _trim_disk(self):
+        # Lists the directory only when the running total is unknown or over the budget. The total is recounted here,
+        # which also corrects it when other processes share the directory.
+        with self._trim_lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".audio"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_disk_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+            with self._lock:
+                self._disk_bytes = total
+
+
+class SpeechService:
+    def __init__(self, synthesizer, cache: AudioCache, encoding: str = AUDIO_ENCODING, max_concurrency: int = 8):
+        self.synthesizer = synthesizer
+        self.cache = cache
+        self.encoding = encoding
+        self.max_concurrency = max_concurrency  # Synthesis calls in progress at the same time, over all requests
+        self._semaphore = None
+        self._semaphore_loop = None
+        self._in_flight = {}  # key -> future of the audio being synthesized
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0  # Requests that waited for the same text being synthesized for another request
+        self.synthesis_seconds = 0.0
+        self.saved_seconds = 0.0
+
+    async def synthesize(self, text: str, lang: str = "en-US") -> bytes:
+        """Audio of the text (emojis and asterisks removed), from the cache if it was synthesized before."""
+        text = clean_text_for_speech(text)
+        lang, voice_name = self.synthesizer.voice(lang)
+        key = AudioCache.key(text, lang, voice_name, self.encoding)
+        audio = self.cache.get_memory(key)
+        if audio is not None:
+            self.memory_hits += 1
+            self.saved_seconds += self._average_synthesis_seconds()
+            return audio
+        if self.cache.directory and key not in self._in_flight:
+            audio = await asyncio.to_thread(self.cache.read_disk, key)  # File reads stay off the event loop
+            if audio is not None:
+                self.disk_hits += 1
+                self.saved_seconds += self._average_synthesis_seconds()
+                return audio
+        if key in self._in_flight:
+            self.coalesced += 1
+            return await asyncio.shield(self._in_flight[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            async with self._get_semaphore():
+                started = time.perf_counter()
+                audio = await self.synthesizer.synthesize(text, lang, self.encoding)
+                self.synthesis_seconds += time.perf_counter() - started
+            self.misses += 1
+            self.cache.remember(key, audio)
+            future.set_result(audio)
+            try:
+                await asyncio.to_thread(self.cache.write_disk, key, audio)
+            except OSError as e:  # The audio is still served from memory
+                print(f"Writing audio to the disk cache failed: {e!r}")
+            return audio
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e)
+                future.exception()  # Mark the exception as retrieved when nobody else waits for it
+            raise
+        finally:
+            del self._in_flight[key]
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    def _average_synthesis_seconds(self) -> float:
+        return self.synthesis_seconds / self.misses if self.misses else 0.0
+
+    def stats(self) -> dict:
+        hits = self.memory_hits + self.disk_hits + self.coalesced
+        lookups = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "saved_seconds": round(self.saved_seconds, 3),
+        }
+
+
+class AudioStream:
+    """The audio of one answer, synthesized sentence by sentence and read as ordered binary chunks."""
+
+    def __init__(self, speech: SpeechService, lang: str = "en-US", idle_timeout: float = 120):
+        self.speech = speech
+        self.lang = lang
+        self.idle_timeout = idle_timeout  # Seconds chunks() waits for more text before it ends the audio of an unclosed stream
+        self.created = time.time()
+        self.first_audio_seconds = None  # From the creation of the stream until the first segment was synthesized
+        self.closed = False
+        self.failed = 0  # Segments whose synthesis failed
+        self.error = None  # Exception of the first failed segment
+        self._segments = []  # Synthesis tasks, in the order of the text
+        self._pending = ""  # Unfinished last sentence of the text added so far
+        self._changed = asyncio.Event()
+
+    def add_text(self, text: str):
+        """Start synthesizing the finished sentences of a text. Must be called from the event loop.
+
+        The text can be added in parts (e.g. response items while the answer is being generated): an unfinished
+        sentence at the end waits for the next part, or for close().
+        """
+        segments = split_sentences(f"{self._pending} {text}")
+        self._pending = segments.pop() if segments and not SENTENCE_FINISHED.search(segments[-1]) else ""
+        for segment in segments:
+            self._add_segment(segment)
+
+    def close(self):
+        """No more text will be added."""
+        if self._pending:
+            self._add_segment(self._pending)
+            self._pending = ""
+        self.closed = True
+        self._changed.set()
+
+    def _add_segment(self, segment: str):
+        self._segments.append(asyncio.ensure_future(self._synthesize(segment, first=not self._segments)))
+        self._changed.set()
+
+    async def _synthesize(self, sentence: str, first: bool) -> bytes | None:
+        try:
+            audio = await self.speech.synthesize(sentence, self.lang)
+        except Exception as e:
+            # Recorded instead of raised, so that the task doesn't log an unretrieved exception if nobody reads the audio.
+            print(f"Synthesis of a sentence failed: {e!r}")
+            self.failed += 1
+            self.error = self.error or e
+            return None
+        if first:
+            self.first_audio_seconds = time.time() - self.created
+        return audio
+
+    async def chunks(self):
+        """The audio segments in order, each as soon as it and the ones before it are ready. Can be read more than once.
+
+        Raises RuntimeError at a segment whose synthesis failed, instead of leaving the sentence out of the audio: the
+        response of /audio breaks off, and the client's audio element reports an error.
+        """
+        index = 0
+        while True:
+            if index < len(self._segments):
+                audio = await asyncio.shield(self._segments[index])
+                index += 1
+                if audio is None:
+                    raise RuntimeError(f"Synthesis of segment {index} of the audio failed") from self.error
+                if audio:
+                    yield audio
+            elif self.closed:
+                return
+            else:
+                self._changed.clear()
+                try:
+                    await asyncio.wait_for(self._changed.wait(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    print(f"No text was added to an audio stream in {self.idle_timeout} s, its audio ends here.")
+                    return
+
+
+class AudioStreams:
+    """Audio streams by unguessable ID, so that the audio of an answer can be fetched from a separate endpoint."""
+
+    def __init__(self, speech: SpeechService, ttl: float = 600, max_streams: int = 1000, idle_timeout: float = 120):
+        self.speech = speech
+        self.ttl = ttl  # Seconds a stream can be fetched after it was created
+        self.idle_timeout = idle_timeout  # See AudioStream
+        self.max_streams = max_streams
+        self._streams = OrderedDict()  # ID -> AudioStream, oldest first
+        self.created = 0
+        self.first_audio_seconds = 0.0
+        self.first_audio_count = 0
+        self.failed_segments = 0
+
+    def create(self, lang: str = "en-US") -> tuple[str, AudioStream]:
+        now = time.time()
+        while self._streams and (len(self._streams) >= self.max_streams or next(iter(self._streams.values())).created < now - self.ttl):
+            self._collect(self._streams.popitem(last=False)[1])
+        stream_id = secrets.token_urlsafe(16)
+        self._streams[stream_id] = stream = AudioStream(self.speech, lang, self.idle_timeout)
+        self.created += 1
+        return stream_id, stream
+
+    def get(self, stream_id: str) -> AudioStream | None:
+        stream = self._streams.get(stream_id)
+        if stream is None or stream.created < time.time() - self.ttl:
+            return None
+        return stream
+
+    def _collect(self, stream: AudioStream):
+        self.failed_segments += stream.failed
+        if stream.first_audio_seconds is not None:
+            self.first_audio_seconds += stream.first_audio_seconds
+            self.first_audio_count += 1
+
+    def stats(self) -> dict:
+        first_audio = [s.first_audio_seconds for s in self._streams.values() if s.first_audio_seconds is not None]
+        count = self.first_audio_count + len(first_audio)
+        return {
+            "streams": self.created,
+            "average_first_audio_seconds": round((self.first_audio_seconds + sum(first_audio)) / count, 3) if count else None,
+            "failed_segments": self.failed_segments + sum(s.failed for s in self._streams.values()),
+        }
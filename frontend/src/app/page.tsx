@@ -15,7 +15,7 @@ type MessageContentBlock =
   | { type: 'text'; content: string }
   | { type: 'link'; url: string; label: string }
   | { type: 'attachment'; url: string; label: string }
-  | { type: 'audio'; content: string; format: string }; // <-- Add audio type
+  | { type: 'audio'; content?: string; url?: string; format: string }; // Audio as base64 content, or the URL of a streamed audio file
 
 type Message = {
   sender: 'User' | 'Assistant';
@@ -104,7 +104,11 @@ export default function Home() {
       const audioBlock = data.response.find(
         (item: MessageContentBlock) => item.type === 'audio'
       );
-      if (audioBlock && audioBlock.type === 'audio') {
+      if (audioBlock && audioBlock.type === 'audio' && audioBlock.url) {
+        // Streamed audio starts playing as soon as the first sentence has been synthesized.
+        const audioObj = new Audio(`${process.env.NEXT_PUBLIC_API_URL}${audioBlock.url}`);
+        audioObj.play();
+      } else if (audioBlock && audioBlock.type === 'audio' && audioBlock.content) {
         let audioUrl = audioUrlCache.current[audioBlock.content];
         if (!audioUrl) {
           audioUrl = `data:audio/${audioBlock.format};base64,${audioBlock.content}`;